@@ -9,8 +9,13 @@ from .routes.control_chart import router as control_chart_router
 from .routes.capability import router as capability_router
 from .routes.reportbuilder_router import router as reportbuilder_router 
 from .routes.action_plan_router import router as action_plan_router
+from .routes.ingest_router import router as ingest_router
+from .routes.uploads_router import router as uploads_router
+from .routes.tasks_router import router as tasks_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from .services import catalog, ingest, tasks
+from .services.workers import admission_status
 import os 
 
 app = FastAPI(title="Statistical Project API")
@@ -33,6 +38,9 @@ app.include_router(control_chart_router)
 app.include_router(capability_router) 
 app.include_router(reportbuilder_router)
 app.include_router(action_plan_router) 
+app.include_router(ingest_router)
+app.include_router(uploads_router)
+app.include_router(tasks_router)
 
 JOBS_PATH = os.path.join(os.path.dirname(__file__), "data", "jobs")
 
@@ -40,6 +48,23 @@ os.makedirs(JOBS_PATH, exist_ok=True)
 
 app.mount("/static/jobs", StaticFiles(directory=JOBS_PATH), name="static_jobs")
 
+@app.on_event("startup")
+def load_catalog():
+    catalog.start()
+    ingest.start()
+    tasks.start()
+
+@app.on_event("shutdown")
+def stop_catalog():
+    tasks.stop()
+    ingest.stop()
+    catalog.stop()
+
 @app.get("/")
 def ping():
     return {"ok": True}
+
+@app.get("/admission")
+async def admission():
+    #vagas por classe de trabalho pesado (ver services/workers)
+    return admission_status()
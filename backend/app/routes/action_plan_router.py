@@ -15,6 +15,8 @@ import json
 import re
 from datetime import datetime
 
+from app.services.piece_analysis import latest_stats
+
 router = APIRouter(tags=["action-plan"])
 
 BASE_DATA = Path(__file__).resolve().parent.parent / "data" / "groups"
@@ -31,12 +33,13 @@ def _piece_dir(group: str, piece: str) -> Path:
 def _ap_file(group: str, piece: str) -> Path:
     return _piece_dir(group, piece) / "action_plan.json"
 
-def _latest_stats_file(group: str, piece: str) -> Path:
-    analysis = _piece_dir(group, piece) / "analysis"
-    files = sorted(analysis.glob("*_stats.json"))
-    if not files:
+def _latest_stats(group: str, piece: str) -> dict:
+    #semana mais recente, em dia com o analysis (calculado na ingestão)
+    _piece_dir(group, piece)
+    latest = latest_stats(group, piece)
+    if latest is None:
         raise HTTPException(404, "Nenhum stats.json encontrado")
-    return files[-1]
+    return latest[0]
 
 def _safe_float(v):
     try: return float(v)
@@ -94,9 +97,7 @@ def get_action_plan_points(group: str, piece: str):
     Retorna pontos com stats completos para popular o modal.
     Cada item: { id, label, axis, cp, cpk, xmed, range, lse, lie, symbol, tolerance }
     """
-    stats_file = _latest_stats_file(group, piece)
-    with open(stats_file, encoding="utf-8") as f:
-        data = json.load(f)
+    data = _latest_stats(group, piece)
 
     points = []
     for ch in data.get("characteristics", []):
@@ -146,9 +147,7 @@ def create_action_plan(group: str, piece: str, body: ActionPlanCreate):
     seq = max((p["seq"] for p in plans), default=0) + 1
 
     # Busca stats dos pontos selecionados para preencher a tabela
-    stats_file = _latest_stats_file(group, piece)
-    with open(stats_file, encoding="utf-8") as f:
-        stats_data = json.load(f)
+    stats_data = _latest_stats(group, piece)
 
     chars_map = {}
     for ch in stats_data.get("characteristics", []):
@@ -219,9 +218,7 @@ def update_action_plan(group: str, piece: str, seq: int, body: ActionPlanUpdate)
         raise HTTPException(404, f"Plano SEQ {seq} não encontrado")
 
     # Rebusca stats para atualizar rows se pontos mudaram
-    stats_file = _latest_stats_file(group, piece)
-    with open(stats_file, encoding="utf-8") as f:
-        stats_data = json.load(f)
+    stats_data = _latest_stats(group, piece)
 
     chars_map = {}
     for ch in stats_data.get("characteristics", []):
@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException
 from pathlib import Path
 from typing import Any, Optional
 import json
+from app.services.workers import offload
+from app.services.piece_analysis import latest_stats
  
 router = APIRouter(tags=["capability"])
  
@@ -14,11 +16,12 @@ def _piece_analysis_dir(group: str, piece: str) -> Path:
         raise HTTPException(404, f"Análise não encontrada: grupo='{group}', peça='{piece}'")
     return path
  
-def _latest_stats_file(analysis_dir: Path) -> Path:
-    files = sorted(analysis_dir.glob("*_stats.json"))
-    if not files:
+def _latest_stats(group: str, piece: str) -> dict:
+    #semana mais recente, em dia com o analysis (calculado na ingestão)
+    latest = latest_stats(group, piece)
+    if latest is None:
         raise HTTPException(404, "Nenhum stats.json encontrado.")
-    return files[-1]
+    return latest[0]
  
 def _safe_float(v):
     try:    return float(v)
@@ -29,12 +32,10 @@ def _layout_path(group: str, piece: str) -> Path:
  
 #ENDPOINT 1 — Pontos com stats completos
 @router.get("/pieces/{group}/{piece}/capability-points")
+@offload
 def get_capability_points(group: str, piece: str):
-    analysis_dir = _piece_analysis_dir(group, piece)
-    stats_file   = _latest_stats_file(analysis_dir)
- 
-    with open(stats_file, encoding="utf-8") as f:
-        stats_data = json.load(f)
+    _piece_analysis_dir(group, piece)
+    stats_data = _latest_stats(group, piece)
  
     points_map: dict[str, dict] = {}
  
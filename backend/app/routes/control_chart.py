@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException, Query
 from pathlib import Path
-import json
 import csv
 
+from app.services.workers import offload
+from app.services.piece_analysis import analysis_path, latest_stats
+
 router = APIRouter(tags=["pieces"])
 
 BASE_DATA = Path(__file__).resolve().parent.parent / "data" / "groups"
@@ -20,23 +22,29 @@ def _piece_analysis_dir(group: str, piece: str) -> Path:
     return path
 
 
-def _latest_stats_file(analysis_dir: Path) -> Path:
-    """Retorna o *_stats.json mais recente (ordenação alfabética = mais recente)."""
-    files = sorted(analysis_dir.glob("*_stats.json"))
-    if not files:
+def _latest(group: str, piece: str) -> tuple[dict, int, int]:
+    """
+    (stats, ano, semana) da semana mais recente com analysis (em dia com
+    ele — calculado na ingestão, aqui é só consulta).
+    """
+    latest = latest_stats(group, piece)
+    if latest is None:
         raise HTTPException(status_code=404, detail="Nenhum arquivo stats.json encontrado.")
-    return files[-1]
+    return latest
 
 
-def _latest_csv_file(analysis_dir: Path) -> Path:
-    """
-    Retorna o CSV mais recente da pasta analysis.
-    Padrão: analysis_YYYY_WNN.csv — ordenação alfabética garante o mais recente.
-    """
-    files = sorted(f for f in analysis_dir.glob("*.csv"))
-    if not files:
+def _latest_stats(group: str, piece: str) -> tuple[dict, str]:
+    """Stats da semana mais recente + rótulo "AAAA-WNN"."""
+    stats, year, week = _latest(group, piece)
+    return stats, f"{year}-W{week:02d}"
+
+
+def _latest_csv_file(group: str, piece: str, year: int, week: int) -> Path:
+    """CSV do analysis da semana — a mesma dos stats usados no gráfico."""
+    path = Path(analysis_path(group, piece, year, week))
+    if not path.exists():
         raise HTTPException(status_code=404, detail="Nenhum arquivo CSV encontrado.")
-    return files[-1]
+    return path
 
 
 def _stem_to_week(filename: str) -> str:
@@ -56,13 +64,11 @@ def _safe_float(value):
 # ── ENDPOINT 1 – Pontos disponíveis (para o modal) ───────────────────────────
 
 @router.get("/pieces/{group}/{piece}/points")
+@offload
 def get_available_points(group: str, piece: str):
     """Lê o stats.json mais recente e retorna todos os pontos com seus eixos."""
-    analysis_dir = _piece_analysis_dir(group, piece)
-    stats_file   = _latest_stats_file(analysis_dir)
-
-    with open(stats_file, encoding="utf-8") as f:
-        stats_data = json.load(f)
+    _piece_analysis_dir(group, piece)
+    stats_data, week = _latest_stats(group, piece)
 
     points_map: dict[str, dict] = {}
     for ch in stats_data.get("characteristics", []):
@@ -84,7 +90,7 @@ def get_available_points(group: str, piece: str):
     return {
         "group":  group,
         "piece":  piece,
-        "week":   _stem_to_week(stats_file.stem),
+        "week":   week,
         "points": list(points_map.values()),
     }
 
@@ -92,12 +98,17 @@ def get_available_points(group: str, piece: str):
 # ── ENDPOINT 2 – Dados de um gráfico ─────────────────────────────────────────
 
 @router.get("/pieces/{group}/{piece}/chart")
+@offload
 def get_chart_data(
     group: str,
     piece: str,
     point: str = Query(...),
     axis:  str = Query(...),
 ):
+    return _chart_data(group, piece, point, axis)
+
+
+def _chart_data(group: str, piece: str, point: str, axis: str):
     """
     Regra de negócio:
       - Usa APENAS o CSV mais recente da pasta (semana/ano mais atual).
@@ -106,8 +117,9 @@ def get_chart_data(
         → 1 Origem = 1 ponto no gráfico, com a data e hora daquela origem.
       - A ordem segue a aparição das Origens no arquivo (= ordem cronológica).
     """
-    analysis_dir = _piece_analysis_dir(group, piece)
-    csv_path     = _latest_csv_file(analysis_dir)   # sempre o mais recente
+    _piece_analysis_dir(group, piece)
+    stats_data, year, week = _latest(group, piece)
+    csv_path     = _latest_csv_file(group, piece, year, week)   # sempre o mais recente
     point_upper  = point.upper()
     axis_upper   = axis.upper()
 
@@ -154,11 +166,7 @@ def get_chart_data(
             "tol_minus": _safe_float(row.get("Tol-")),
         })
 
-    # Stats do JSON mais recente
-    stats_file = _latest_stats_file(analysis_dir)
-    with open(stats_file, encoding="utf-8") as f:
-        stats_data = json.load(f)
-
+    # Stats da mesma semana do CSV
     char_key = f"{point_upper}_{axis_upper}"
     stats = {}
     for ch in stats_data.get("characteristics", []):
@@ -223,11 +231,12 @@ class ChartsRequest(BaseModel):
 
 
 @router.post("/pieces/{group}/{piece}/charts")
+@offload
 def get_multiple_charts(group: str, piece: str, body: ChartsRequest):
     results = []
     for sel in body.selections:
         try:
-            data = get_chart_data(group, piece, point=sel.point, axis=sel.axis)
+            data = _chart_data(group, piece, point=sel.point, axis=sel.axis)
             results.append(data)
         except HTTPException as e:
             results.append({"point": sel.point, "axis": sel.axis, "error": e.detail})
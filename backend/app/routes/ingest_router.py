@@ -0,0 +1,44 @@
+"""
+Endpoints:
+  GET  /ingest/status  → estado do pipeline de ingestão (fila, pendentes, erros)
+  POST /ingest/scan    → força uma varredura da pasta de entrada
+  POST /ingest/archive → ingestão em lote de um .zip / .tar.gz
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+
+from app.services import bulk_ingest, ingest
+from app.services.workers import admit
+
+router = APIRouter(prefix="/ingest", tags=["ingest"])
+
+
+@router.get("/status")
+async def ingest_status():
+    return ingest.status()
+
+
+@router.post("/scan")
+def ingest_scan():
+    ingest.trigger_scan()
+    return ingest.status()
+
+
+@router.post("/archive")
+@admit("ingest")
+def ingest_archive(
+    file: UploadFile = File(...),
+    group: Optional[str] = Form(None),
+):
+    """
+    Recebe um pacote com TXT de várias peças ({grupo}/{peça}/x.txt ou
+    {peça}/x.txt com `group`) e devolve o resumo por arquivo.
+    """
+    if not bulk_ingest.is_archive(file.filename or ""):
+        raise HTTPException(400, "Envie um .zip, .tar.gz, .tgz ou .tar")
+    try:
+        return bulk_ingest.ingest_archive(file.file, file.filename, group)
+    except bulk_ingest.ARCHIVE_ERRORS as e:
+        raise HTTPException(400, f"Arquivo inválido: {e}")
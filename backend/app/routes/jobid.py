@@ -210,6 +210,8 @@ from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 import asyncio
 import os
+
+from app.services.workers import admission
  
 _executor = ThreadPoolExecutor(max_workers=2)
  
@@ -267,9 +269,12 @@ async def screenshot_action_plan(job_id: str, body: ScreenshotRequest):
         raise HTTPException(404, "JobID não encontrado")
  
     try:
-        png_bytes = await asyncio.get_event_loop().run_in_executor(
-            _executor, _shoot, body.page_url
-        )
+        async with admission("render"):
+            png_bytes = await asyncio.get_event_loop().run_in_executor(
+                _executor, _shoot, body.page_url
+            )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Screenshot falhou: {e}")
  
@@ -1,7 +1,7 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 from app.services.pieces_service import(
     list_pieces, 
     create_piece, 
@@ -10,10 +10,16 @@ from app.services.pieces_service import(
     sanitize_piece_name, 
     list_txt_files, 
     delete_txt_file, 
-    get_piece_info
+    get_piece_info,
+    set_piece_image
 ) 
-from app.services.pcdmis_csv_service import extract_all_txt_to_csv, load_all_csv_as_dataframe, save_analysis_csv
-from app.services.statistics_service import calculate_statistics
+from app.services.pcdmis_csv_service import extract_all_txt_to_csv, list_csv_files, load_all_csv_as_dataframe, query_csv_dataframe, save_analysis_csv
+from app.services.workers import admit, coalesce, offload, run_heavy
+from app.services.responses import FastJSONResponse, dataframe_rows, stream_table
+from app.services import arrow_format, catalog, ingest, piece_analysis, piece_images, report_registry, rollup, tasks
+from app.services.utils.fileio import atomic_write_bytes, atomic_write_text
+from app.services.utils.weeks import week_range
+from app.services.table_query import QueryError, TableQuery, table_query_params
 
 import os 
 import shutil 
@@ -51,6 +57,11 @@ def delete_piece_route(group: str, part_number: str):
 
     return {"deleted": info}
 
+def _save_upload(src, out_path: str):
+    with open(out_path, "wb") as f:
+        shutil.copyfileobj(src, f)
+
+
 @router.post("/upload_txt")
 async def upload_txt(
     group: str = Form(...),
@@ -64,21 +75,35 @@ async def upload_txt(
     txt_path = ensure_piece_dirs(group_safe, piece_safe)
 
     saved_files = []
+    duplicates = []
 
     for file in files:
         if not file.filename.lower().endswith(".txt"):
             raise HTTPException(400, f"Arquivo inválido: {file.filename}")
 
+        #mesmo conteúdo já enviado com outro nome → pula
+        data = await file.read()
+        sha = report_registry.raw_hash(data)
+        try:
+            await run_heavy(report_registry.check_and_register, group_safe, piece_safe, file.filename, sha)
+        except report_registry.DuplicateReport as e:
+            duplicates.append({"file": file.filename, "duplicate_of": e.duplicate_of})
+            continue
+
         out_path = os.path.join(txt_path, file.filename)
 
-        with open(out_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+        try:
+            await run_heavy(atomic_write_bytes, out_path, data)
+        except Exception:
+            await run_heavy(report_registry.forget, group_safe, piece_safe, file.filename)
+            raise
 
         saved_files.append(file.filename)
 
     return {
         "status": "ok",
         "saved": saved_files,
+        "duplicates": duplicates,
         "path": txt_path
     }
     
@@ -99,34 +124,99 @@ def delete_txt(group: str, piece: str, filename: str):
     if not ok:
         raise HTTPException(status_code=404, detail=info)
 
+    report_registry.forget(group, piece, filename)
+
     return {"deleted": info}
 
 @router.post("/{group}/{piece}/extract_to_csv")
-def extract_to_csv_route(group: str, piece: str):
+@admit("ingest")
+def extract_to_csv_route(
+    group: str,
+    piece: str,
+    background: bool = Query(False, description="Roda como tarefa (ver /tasks)"),
+    force: bool = Query(False, description="Reprocessa também os TXT já extraídos")
+):
     """
     Extrai TODOS os TXT (na pasta txt/) da peça para CSVs (pasta csv/).
+    TXT cujo CSV já está em dia não é reprocessado (a não ser com force).
+    Os CSVs novos entram no analysis + _stats.json da semana atual na hora,
+    como no pipeline de ingestão.
     """
-    saved = extract_all_txt_to_csv(group, piece)
+    if background:
+        return tasks.submit_response("extract_to_csv", group, piece)
+    saved = extract_all_txt_to_csv(group, piece, force=force)
     if saved is None:
         raise HTTPException(status_code=500, detail="Erro interno")
+    if saved:
+        ingest.refresh_piece(sanitize_piece_name(group), sanitize_piece_name(piece), saved)
     return {"status": "ok", "saved": saved, "count": len(saved)}
 
 
 @router.get("/{group}/{piece}/dataframe")
-def get_piece_dataframe(group: str, piece: str):
+@offload
+def get_piece_dataframe(
+    request: Request,
+    group: str,
+    piece: str,
+    fast: bool = Query(False, description="orjson + gzip/br"),
+    orient: Literal["records", "split"] = Query("records"),
+    query: TableQuery = Depends(table_query_params),
+    format: Literal["json", "ndjson", "csv", "arrow"] = Query("json", description="ndjson/csv = streaming"),
+):
     """
     Carrega todos os CSVs em csv/ e retorna os dados concatenados
     como JSON (lista de registros).
+    Aceita columns=, filtros (point, axis, origem, date_from/date_to)
+    e paginação (limit + offset ou cursor) aplicados já na leitura.
+    Com format=ndjson|csv as linhas vão em streaming, bloco a bloco.
+    format=arrow (ou Accept: application/vnd.apache.arrow.stream) → Arrow IPC.
     """
-    df = load_all_csv_as_dataframe(group, piece)
+    if arrow_format.wants_arrow(request, format):
+        files = list_csv_files(group, piece)
+        if query.is_projection_only:
+            table = arrow_format.read_csv_files_table(files, "RelatorioCSV", query.columns)
+        else:
+            try:
+                table = arrow_format.table_from_chunks(query.iter_chunks(files, label_column="RelatorioCSV"))
+            except QueryError as e:
+                raise HTTPException(400, str(e))
+        return arrow_format.arrow_response(table)
+
+    if format != "json":
+        try:
+            chunks = query.iter_chunks(list_csv_files(group, piece), label_column="RelatorioCSV")
+            return stream_table(chunks, format, f"{sanitize_piece_name(piece)}_dataframe")
+        except QueryError as e:
+            raise HTTPException(400, str(e))
+
+    next_cursor = None
+    if query.is_plain:
+        df = load_all_csv_as_dataframe(group, piece)
+    else:
+        try:
+            df, next_cursor = query_csv_dataframe(group, piece, query)
+        except QueryError as e:
+            raise HTTPException(400, str(e))
     if df.empty:
-        return {"status": "empty", "rows": 0, "data": []}
+        return {"status": "empty", "rows": 0, "data": [], **query.page_info(None)}
+
+    if fast:
+        return FastJSONResponse(
+            {
+                "status": "ok",
+                "rows": len(df),
+                "data": dataframe_rows(df.fillna(""), orient),
+                **query.page_info(next_cursor),
+            },
+            request=request,
+        )
 
     #tipos serializáveis
     records = df.fillna("").to_dict(orient="records")
-    return {"status": "ok", "rows": len(records), "data": records}
+    return {"status": "ok", "rows": len(records), "data": records, **query.page_info(next_cursor)}
 
 @router.post("/{group}/{piece}/extract_analysis")
+@offload
 def extract_analysis_csv(group: str, piece: str):
     """
     DEPRECATED: Use /generate_analysis com parâmetros week/year.
@@ -163,7 +253,7 @@ def extract_analysis_csv(group: str, piece: str):
         raise HTTPException(404, "Nenhum CSV válido encontrado.")
 
     df_total = pd.concat(dfs, ignore_index=True)
-    df_total.to_csv(analysis_path, index=False)
+    atomic_write_text(analysis_path, df_total.to_csv(index=False))
 
     return {
         "status": "ok",
@@ -173,40 +263,29 @@ def extract_analysis_csv(group: str, piece: str):
     }
 
 @router.post("/{group}/{piece}/generate_analysis")
+@admit("ingest")
 def generate_analysis(
     group: str, 
     piece: str,
     week: Optional[int] = Query(None, description="Semana ISO (1-53)"),
-    year: Optional[int] = Query(None, description="Ano (ex: 2024)")
+    year: Optional[int] = Query(None, description="Ano (ex: 2024)"),
+    background: bool = Query(False, description="Roda como tarefa (ver /tasks)")
 ):
     """
     Gera analysis_YYYY_WXX.csv com os dados da semana/ano especificados.
     Se week/year não forem passados, usa a semana atual.
     Se o arquivo já existir, sobrescreve.
     """
-    import pandas as pd
-
     group_safe = sanitize_piece_name(group)
     piece_safe = sanitize_piece_name(piece)
 
-    base_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)),
-        "data", "groups", group_safe, "pieces", piece_safe
-    )
-
-    csv_dir = os.path.join(base_path, "csv")
-    
-    #create folder analysis/
-    analysis_dir = os.path.join(base_path, "analysis")
-    os.makedirs(analysis_dir, exist_ok=True)
+    csv_dir = os.path.join(piece_analysis.piece_dir(group_safe, piece_safe), "csv")
 
     if not os.path.exists(csv_dir):
         raise HTTPException(404, "Nenhum CSV encontrado. Extraia os TXT primeiro.")
 
     if week is None or year is None:
-        now = datetime.now()
-        week = now.isocalendar()[1]  #semana ISO (1-53)
-        year = now.year
+        year, week = piece_analysis.current_week()
 
     #validação
     if not (1 <= week <= 53):
@@ -214,30 +293,20 @@ def generate_analysis(
     if not (2020 <= year <= 2050):
         raise HTTPException(400, "Ano inválido")
 
+    if background:
+        return tasks.submit_response("generate_analysis", group_safe, piece_safe, week, year)
+
     #name file with week/year
     filename = f"analysis_{year}_W{week:02d}.csv"
-    analysis_path = os.path.join(analysis_dir, filename)
+    analysis_path = piece_analysis.analysis_path(group_safe, piece_safe, year, week)
 
-    #read all CSV file
-    dfs = []
-    for file in os.listdir(csv_dir):
-        if file.lower().endswith(".csv"):
-            try:
-                df = pd.read_csv(os.path.join(csv_dir, file))
-                df["Origem"] = file
-                dfs.append(df)
-            except Exception as e:
-                print(f"Erro ao ler {file}: {e}")
-                continue
+    #todos os CSV + coluna Origem (refeito só se algum CSV mudou)
+    df_total, rebuilt = piece_analysis.ensure_week_analysis(group_safe, piece_safe, year, week)
 
-    if not dfs:
+    if df_total is None:
         raise HTTPException(404, "Nenhum CSV válido encontrado.")
 
-    df_total = pd.concat(dfs, ignore_index=True)
-    
     # TODO: Futuramente filtrar por data/semana quando tiver a coluna
-    
-    df_total.to_csv(analysis_path, index=False)
 
     return {
         "status": "ok",
@@ -245,20 +314,28 @@ def generate_analysis(
         "file": filename,
         "week": week,
         "year": year,
-        "path": analysis_path
+        "path": analysis_path,
+        "cached": not rebuilt
     }
 
 
 @router.get("/{group}/{piece}/analysis")
+@offload
 def load_analysis_csv(
+    request: Request,
     group: str, 
     piece: str,
     week: Optional[int] = Query(None, description="Semana ISO (1-53)"),
-    year: Optional[int] = Query(None, description="Ano (ex: 2024)")
+    year: Optional[int] = Query(None, description="Ano (ex: 2024)"),
+    fast: bool = Query(False, description="orjson + gzip/br"),
+    orient: Literal["records", "split"] = Query("records"),
+    query: TableQuery = Depends(table_query_params),
+    format: Literal["json", "ndjson", "csv", "arrow"] = Query("json", description="ndjson/csv = streaming"),
 ):
     """
     Carrega o analysis de uma semana específica.
     Se não passar semana/ano, usa a semana atual.
+    Aceita columns=, filtros, paginação e format= como o /dataframe.
     """
     import pandas as pd
 
@@ -282,14 +359,51 @@ def load_analysis_csv(
     if not os.path.exists(path):
         raise HTTPException(404, f"{filename} não encontrado. Gere ele primeiro.")
 
-    df = pd.read_csv(path)
+    if arrow_format.wants_arrow(request, format):
+        if query.is_projection_only:
+            table = arrow_format.read_csv_table(path, query.columns)
+        else:
+            try:
+                table = arrow_format.table_from_chunks(query.iter_chunks([(path, filename)]))
+            except QueryError as e:
+                raise HTTPException(400, str(e))
+        return arrow_format.arrow_response(table, {"week": week, "year": year, "file": filename})
+
+    if format != "json":
+        try:
+            return stream_table(query.iter_chunks([(path, filename)]), format, filename[:-4])
+        except QueryError as e:
+            raise HTTPException(400, str(e))
+
+    next_cursor = None
+    if query.is_plain:
+        df = pd.read_csv(path)
+    else:
+        try:
+            df, next_cursor = query.run([(path, filename)])
+        except QueryError as e:
+            raise HTTPException(400, str(e))
+
+    if fast:
+        return FastJSONResponse(
+            {
+                "week": week,
+                "year": year,
+                "file": filename,
+                "rows": len(df),
+                "data": dataframe_rows(df, orient),
+                **query.page_info(next_cursor),
+            },
+            request=request,
+        )
     
     return {
         "week": week,
         "year": year,
         "file": filename,
         "rows": len(df),
-        "data": df.to_dict(orient="records")
+        "data": df.to_dict(orient="records"),
+        **query.page_info(next_cursor),
     }
 
 
@@ -370,20 +484,31 @@ def delete_analysis_file(group: str, piece: str, filename: str):
     except Exception as e:
         raise HTTPException(500, f"Erro ao apagar arquivo: {e}")
 
+    #cópia Arrow em cache, se houver
+    try:
+        os.remove(arrow_format.cache_path(analysis_path))
+    except OSError:
+        pass
+
     return {"deleted": filename_safe}
 
 @router.post("/{group}/{piece}/calculate_statistics")
+@coalesce("calculate_statistics")
+@admit("statistics")
 def calculate_piece_statistics(
+    request: Request,
     group: str, 
     piece: str,
     week: Optional[int] = Query(None),
-    year: Optional[int] = Query(None)
+    year: Optional[int] = Query(None),
+    format: Literal["json", "arrow"] = Query("json"),
 ):
     """
     Calcula estatísticas detalhadas do analysis.csv da semana especificada.
     Retorna dados processados prontos para exibição.
+    Em Arrow: uma linha por característica, summary no metadata do schema.
     """
-    import pandas as pd
+    arrow = arrow_format.wants_arrow(request, format)
 
     group_safe = sanitize_piece_name(group)
     piece_safe = sanitize_piece_name(piece)
@@ -407,21 +532,20 @@ def calculate_piece_statistics(
     if not os.path.exists(path):
         raise HTTPException(404, f"{filename} não encontrado. Gere ele primeiro.")
 
-    #read csv
-    df = pd.read_csv(path)
-    
-    stats = calculate_statistics(df)
-    
-    #save result json
-    stats_file = path.replace(".csv", "_stats.json")
-    import json
-    with open(stats_file, "w") as f:
-        json.dump(stats, f, indent=2)
+    #_stats.json em dia com o analysis: recalcula só se o analysis mudou
+    stats, rebuilt = piece_analysis.ensure_week_stats(group_safe, piece_safe, year, week)
+
+    if arrow:
+        table = arrow_format.pa.Table.from_pylist(stats.get("characteristics", []))
+        return arrow_format.arrow_response(
+            table, {"week": week, "year": year, "summary": stats.get("summary", {})}
+        )
     
     return {
         "status": "ok",
         "week": week,
         "year": year,
+        "cached": not rebuilt,
         "statistics": stats
     }
 
@@ -438,7 +562,8 @@ async def post_piece(
         group_safe = sanitize_piece_name(group)
         part_safe = sanitize_piece_name(part_number)
         
-        ok, info = create_piece(
+        ok, info = await run_heavy(
+            create_piece,
             group,
             part_number,
             part_name,
@@ -462,8 +587,8 @@ async def post_piece(
             image_path = os.path.join(image_dir, f"peca{ext}")
             
             #save img
-            with open(image_path, "wb") as f:
-                shutil.copyfileobj(image.file, f)
+            await run_heavy(_save_upload, image.file, image_path)
+            await run_heavy(set_piece_image, group_safe, part_safe, f"peca{ext}")
             
             return {"created": info, "image": f"peca{ext}"}
         
@@ -474,11 +599,7 @@ async def post_piece(
     
 
 
-@router.get("/{group}/{piece}/imagens")
-def get_piece_image(group: str, piece: str):
-    """
-    Retorna a imagem da peça.
-    """
+def _piece_image_path(group: str, piece: str) -> str:
     group_safe = sanitize_piece_name(group)
     piece_safe = sanitize_piece_name(piece)
     
@@ -490,84 +611,115 @@ def get_piece_image(group: str, piece: str):
     if not os.path.exists(image_dir):
         raise HTTPException(404, "Pasta de imagens não encontrada")
     
-    # Procura por qualquer arquivo que comece com "peca"
-    for file in os.listdir(image_dir):
-        if file.startswith("peca"):
-            image_path = os.path.join(image_dir, file)
-            return FileResponse(
-                image_path, 
-                headers={"Access-Control-Allow-Origin": "*"}
-            )
-    
-    raise HTTPException(404, "Imagem não encontrada")
+    #arquivo peca.* vem do catálogo
+    image_filename = catalog.piece_image(group_safe, piece_safe)
+    if not image_filename:
+        raise HTTPException(404, "Imagem não encontrada")
+    return os.path.join(image_dir, image_filename)
+
+
+@router.get("/{group}/{piece}/imagens")
+@offload
+def get_piece_image(
+    request: Request,
+    group: str,
+    piece: str,
+    v: Optional[str] = Query(None, description="etag da imagem (URL versionada)"),
+):
+    """
+    Retorna a imagem da peça.
+    ETag = hash do conteúdo; com ?v=<etag> vai com cache imutável.
+    """
+    image_path = _piece_image_path(group, piece)
+    etag = piece_images.image_etag(image_path)
+    headers = piece_images.cache_headers(etag, v)
+    if piece_images.not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(image_path, headers=headers)
+
+
+@router.get("/{group}/{piece}/imagens/thumb")
+@offload
+def get_piece_thumbnail(
+    request: Request,
+    group: str,
+    piece: str,
+    w: int = Query(320, ge=16, le=2048, description="largura (arredonda para 160/320/640)"),
+    v: Optional[str] = Query(None, description="etag da imagem (URL versionada)"),
+):
+    """Miniatura JPEG da imagem da peça (cards dos relatórios)."""
+    image_path = _piece_image_path(group, piece)
+    try:
+        thumb_path, etag = piece_images.thumbnail(image_path, w)
+    except OSError:
+        raise HTTPException(415, "Imagem não suportada")
+    headers = piece_images.cache_headers(etag, v)
+    if piece_images.not_modified(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumb_path, media_type="image/jpeg", headers=headers)
+
+@router.get("/{group}/{piece}/trend")
+@coalesce("trend")
+@admit("statistics")
+def get_piece_trend(
+    group: str,
+    piece: str,
+    week: Optional[int] = Query(None),
+    year: Optional[int] = Query(None),
+    from_year: Optional[int] = Query(None),
+    from_week: Optional[int] = Query(None),
+    to_year: Optional[int] = Query(None),
+    to_week: Optional[int] = Query(None)
+):
+    """
+    Tendência semanal da peça com todas as métricas numa resposta só:
+    CG/CP/CPK (contagem e % por cor), avg_cp, avg_cpk, avg_sigma, avg_r e
+    ok_percent. Mesmos filtros de /report. Só calcula o _stats.json das
+    semanas que ainda não têm (o resto vem do rollup do grupo).
+    """
+    try:
+        start, end = week_range(from_year, from_week, to_year, to_week, year=year, week=week)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {"weeks": rollup.piece_trend(group, piece, start, end)}
+
 
 @router.get("/{group}/{piece}/report")
+@coalesce("report")
+@admit("statistics")
 def get_report_data(
     group: str,
     piece: str,
     week: Optional[int] = Query(None),
-    year: Optional[int] = Query(None)
+    year: Optional[int] = Query(None),
+    from_year: Optional[int] = Query(None),
+    from_week: Optional[int] = Query(None),
+    to_year: Optional[int] = Query(None),
+    to_week: Optional[int] = Query(None)
 ):
     """
     Retorna dados agregados por semana para gerar o gráfico de relatório.
+    Filtro: week+year (uma semana) ou from_year/from_week até
+    to_year/to_week. Recorte CG de /trend.
     """
-    import pandas as pd
-    from datetime import datetime
-
-    group_safe = sanitize_piece_name(group)
-    piece_safe = sanitize_piece_name(piece)
-
-    analysis_dir = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)),
-        "data", "groups", group_safe, "pieces", piece_safe, "analysis"
-    )
-
-    if not os.path.exists(analysis_dir):
-        return {"weeks": []}
-
-    #list all file of analysis disponíveis
-    weeks_data = []
-
-    for file in sorted(os.listdir(analysis_dir)):
-        if file.startswith("analysis_") and file.endswith(".csv"):
-            try:
-                #extrai semana/ano do nome
-                parts = file.replace("analysis_", "").replace(".csv", "").split("_")
-                if len(parts) != 2:
-                    continue
-
-                file_year = int(parts[0])
-                file_week = int(parts[1].replace("W", ""))
-
-                #se semana/ano - filtra
-                if week and year:
-                    if file_week != week or file_year != year:
-                        continue
-
-                #carrega o CSV
-                csv_path = os.path.join(analysis_dir, file)
-                df = pd.read_csv(csv_path)
-
-                #calcula estatísticas
-                stats = calculate_statistics(df)
-
-                if stats and "summary" in stats:
-                    weeks_data.append({
-                        "year": file_year,
-                        "week": file_week,
-                        "green": stats["summary"]["cg_green"],
-                        "green_percent": stats["summary"]["cg_green_percent"],
-                        "yellow": stats["summary"]["cg_yellow"],
-                        "yellow_percent": stats["summary"]["cg_yellow_percent"],
-                        "red": stats["summary"]["cg_red"],
-                        "red_percent": stats["summary"]["cg_red_percent"],
-                        "total": stats["summary"]["total_characteristics"]
-                    })
-            except Exception as e:
-                print(f"Erro ao processar {file}: {e}")
-                continue
-
-    #ordena por ano/semana
-    weeks_data.sort(key=lambda x: (x["year"], x["week"]))
+    try:
+        start, end = week_range(from_year, from_week, to_year, to_week, year=year, week=week)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    weeks_data = [
+        {
+            "year": w["year"],
+            "week": w["week"],
+            "green": w["cg_green"],
+            "green_percent": w["cg_green_percent"],
+            "yellow": w["cg_yellow"],
+            "yellow_percent": w["cg_yellow_percent"],
+            "red": w["cg_red"],
+            "red_percent": w["cg_red_percent"],
+            "total": w["total"]
+        }
+        for w in rollup.piece_trend(group, piece, start, end)
+    ]
 
     return {"weeks": weeks_data}
@@ -5,15 +5,26 @@ Salva o estado do canvas no nível do CONJUNTO (group), não da peça.
 Estrutura resultante:
   app/data/jobs/{group}/reportbuilder/
       _autosave.json
+      _autosave.journal.jsonl  → patches do auto-save ainda não compactados
+      _index.json              → metadados dos snapshots (listagem)
+      _render_cache/{hash}.png → páginas já renderizadas para PDF
       MinhaVersao.json
+      _assets/{sha256}.png     → imagens extraídas do canvas (compartilhadas)
 
 Rotas:
   GET  /reportbuilder/{group}/layout        → carrega auto-save
-  POST /reportbuilder/{group}/layout        → salva auto-save
-  GET  /reportbuilder/{group}/list          → lista snapshots nomeados
+  POST /reportbuilder/{group}/layout        → salva auto-save (estado completo)
+  PATCH /reportbuilder/{group}/layout       → auto-save incremental (JSON Patch)
+  GET  /reportbuilder/{group}/list          → lista snapshots nomeados (via _index.json)
+  POST /reportbuilder/{group}/reindex       → reconstrói o _index.json da pasta
   POST /reportbuilder/{group}/list/{name}   → salva snapshot nomeado
   GET  /reportbuilder/{group}/list/{name}   → carrega snapshot nomeado
   DEL  /reportbuilder/{group}/list/{name}   → deleta snapshot nomeado
+  GET  /reportbuilder/{group}/assets/{file} → serve um asset pelo hash
+  GET  /reportbuilder/{group}/pdf           → PDF do auto-save (?name= para um snapshot)
+
+Os GETs de layout/snapshot aceitam ?assets=ref para receber as referências
+asset:// em vez das imagens inline (padrão: inline, compatível com o front).
 """
 
 import json
@@ -21,9 +32,25 @@ import os
 from datetime import datetime
 from pathlib import Path
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-from typing import Any
+from typing import Any, Literal, Optional
+
+from app.services.reportbuilder_assets import (
+    ASSETS_DIRNAME,
+    assets_lock,
+    extract_assets,
+    gc_assets,
+    inline_assets,
+    is_valid_asset_name,
+)
+from app.services import reportbuilder_autosave as autosave
+from app.services import reportbuilder_index
+from app.services.reportbuilder_pdf import render_pdf
+from app.services.utils.fileio import atomic_write_text
+from app.services.workers import admit
+from app.services.utils.jsonpatch import JsonPatchError
 
 router = APIRouter(prefix="/reportbuilder", tags=["reportbuilder"])
 
@@ -44,6 +71,44 @@ def _rb_dir(group: str) -> Path:
     return path
 
 
+def _safe_name(name: str) -> str:
+    """Nome de snapshot só com letras, dígitos, '-', '_' e espaço (400 se inválido)."""
+    safe = "".join(c for c in name if c.isalnum() or c in "-_ ").strip()
+    if not safe:
+        raise HTTPException(status_code=400, detail="Nome inválido.")
+    if safe.startswith("_"):
+        raise HTTPException(status_code=400, detail="Nomes iniciados com '_' são reservados.")
+    return safe
+
+
+def _state_payload(group: str, state: "ReportState") -> dict:
+    """Estado + updated_at, com os blobs já extraídos para _assets/."""
+    payload = {
+        **state.model_dump(),
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+    payload["pages"] = extract_assets(payload["pages"], _rb_dir(group))
+    return payload
+
+
+def _write_state(group: str, target: Path, state: "ReportState"):
+    with assets_lock(_rb_dir(group)):
+        payload = _state_payload(group, state)
+        atomic_write_text(target, json.dumps(payload, ensure_ascii=False, indent=2))
+    return payload
+
+
+def _read_state(group: str, target: Path, assets: str):
+    data = json.loads(target.read_text(encoding="utf-8"))
+    return _with_assets(group, data, assets)
+
+
+def _with_assets(group: str, data: dict, assets: str):
+    if assets == "inline":
+        data = inline_assets(data, _rb_dir(group))
+    return data
+
+
 # ── schemas ───────────────────────────────────────────────────────────────────
 
 class ReportState(BaseModel):
@@ -52,28 +117,58 @@ class ReportState(BaseModel):
     reportName: str = "Relatório sem título"
 
 
+class LayoutPatch(BaseModel):
+    base_version: int
+    ops: list[dict[str, Any]]
+
+
 # ── auto-save ─────────────────────────────────────────────────────────────────
 
+AssetsMode = Literal["inline", "ref"]
+
+
 @router.get("/{group}/layout")
-def load_layout(group: str):
+def load_layout(group: str, assets: AssetsMode = Query("inline")):
     """Carrega o auto-save do conjunto. Retorna {} se ainda não existe."""
-    target = _rb_dir(group) / "_autosave.json"
-    if not target.exists():
+    data = autosave.load(_rb_dir(group))
+    if not data.get("pages") and data.get("version", 0) == 0:
         return {}
-    return json.loads(target.read_text(encoding="utf-8"))
+    return _with_assets(group, data, assets)
 
 
 @router.post("/{group}/layout")
 def save_layout(group: str, state: ReportState):
     """Persiste o estado atual do canvas (auto-save, sempre sobrescreve)."""
-    target = _rb_dir(group) / "_autosave.json"
-    payload = {
-        **state.model_dump(),
-        "updated_at": datetime.utcnow().isoformat(),
-    }
-    target.write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    rb = _rb_dir(group)
+    with assets_lock(rb):
+        version = autosave.save_full(rb, _state_payload(group, state))
+    gc_assets(rb)
+    return {"ok": True, "version": version}
+
+
+@router.patch("/{group}/layout")
+def patch_layout(group: str, body: LayoutPatch):
+    """
+    Auto-save incremental: aplica um JSON Patch sobre `base_version`.
+    409 → o cliente está atrasado; deve recarregar ou mandar o POST completo.
+    """
+    try:
+        version = autosave.apply_ops(_rb_dir(group), body.base_version, body.ops)
+    except autosave.VersionConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "version": e.current},
+        )
+    except JsonPatchError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"ok": True, "version": version}
+
+
+@router.post("/{group}/layout/compact")
+def compact_layout(group: str):
+    """Grava os patches pendentes e compacta o journal num snapshot completo."""
+    autosave.compact(_rb_dir(group))
+    gc_assets(_rb_dir(group))
     return {"ok": True}
 
 
@@ -82,52 +177,34 @@ def save_layout(group: str, state: ReportState):
 @router.get("/{group}/list")
 def list_reports(group: str):
     """Lista todos os snapshots nomeados (exclui _autosave)."""
-    rb = _rb_dir(group)
-    reports = []
-
-    for f in sorted(rb.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
-        if f.stem == "_autosave":
-            continue
-        try:
-            data = json.loads(f.read_text(encoding="utf-8"))
-            reports.append({
-                "name": f.stem,
-                "reportName": data.get("reportName", f.stem),
-                "updated_at": data.get("updated_at", ""),
-                "page_count": len(data.get("pages", [])),
-                "pageOrientation": data.get("pageOrientation", "landscape"),
-            })
-        except Exception:
-            continue
-
-    return reports
+    return reportbuilder_index.list_entries(_rb_dir(group))
+
+
+@router.post("/{group}/reindex")
+def reindex_reports(group: str):
+    """Reconstrói o índice lendo todos os snapshots da pasta."""
+    reports = reportbuilder_index.rebuild(_rb_dir(group))
+    return {"ok": True, "count": len(reports)}
 
 
 @router.post("/{group}/list/{name}")
 def save_named_report(group: str, name: str, state: ReportState):
     """Salva um snapshot com nome escolhido pelo usuário."""
-    safe = "".join(c for c in name if c.isalnum() or c in "-_ ").strip()
-    if not safe:
-        raise HTTPException(status_code=400, detail="Nome inválido.")
-
+    safe = _safe_name(name)
     target = _rb_dir(group) / f"{safe}.json"
-    payload = {
-        **state.model_dump(),
-        "updated_at": datetime.utcnow().isoformat(),
-    }
-    target.write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    payload = _write_state(group, target, state)
+    reportbuilder_index.upsert(_rb_dir(group), safe, payload)
+    gc_assets(_rb_dir(group))
     return {"ok": True, "name": safe}
 
 
 @router.get("/{group}/list/{name}")
-def load_named_report(group: str, name: str):
+def load_named_report(group: str, name: str, assets: AssetsMode = Query("inline")):
     """Carrega um snapshot nomeado."""
     target = _rb_dir(group) / f"{name}.json"
     if not target.exists():
         raise HTTPException(status_code=404, detail=f"Report '{name}' não encontrado.")
-    return json.loads(target.read_text(encoding="utf-8"))
+    return _read_state(group, target, assets)
 
 
 @router.delete("/{group}/list/{name}")
@@ -137,7 +214,58 @@ def delete_named_report(group: str, name: str):
     if not target.exists():
         raise HTTPException(status_code=404, detail=f"Report '{name}' não encontrado.")
     target.unlink()
-    return {"ok": True, "deleted": name}  
- 
-  
-   
\ No newline at end of file
+    reportbuilder_index.remove(_rb_dir(group), name)
+    autosave.flush(_rb_dir(group))
+    gc_assets(_rb_dir(group))
+    return {"ok": True, "deleted": name}
+
+
+# ── assets ────────────────────────────────────────────────────────────────────
+
+@router.get("/{group}/assets/{filename}")
+def get_asset(group: str, filename: str):
+    """Serve um asset extraído. O nome é o hash do conteúdo → cache imutável."""
+    if not is_valid_asset_name(filename):
+        raise HTTPException(status_code=400, detail="Nome de asset inválido.")
+    path = _rb_dir(group) / ASSETS_DIRNAME / filename
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Asset não encontrado.")
+    return FileResponse(
+        path,
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+# ── PDF ───────────────────────────────────────────────────────────────────────
+
+@router.get("/{group}/pdf")
+@admit("render")
+def export_pdf(group: str, name: Optional[str] = Query(None)):
+    """
+    Renderiza no servidor o auto-save (ou o snapshot `name`) em PDF,
+    na orientação salva. Páginas sem mudança vêm do cache.
+    """
+    rb = _rb_dir(group)
+    if name is None:
+        state = autosave.load(rb)
+    else:
+        target = (rb / f"{_safe_name(name)}.json").resolve()
+        #nunca fora da pasta do reportbuilder
+        if target.parent != rb.resolve() or not target.exists():
+            raise HTTPException(status_code=404, detail=f"Report '{name}' não encontrado.")
+        state = json.loads(target.read_text(encoding="utf-8"))
+
+    if not state.get("pages"):
+        raise HTTPException(status_code=404, detail="Relatório sem páginas.")
+
+    pdf, info = render_pdf(rb, state)
+    filename = "".join(c for c in state.get("reportName", "relatorio") if c.isalnum() or c in "-_ ").strip()
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename or "relatorio"}.pdf"',
+            "X-Pages-Rendered": str(info["rendered"]),
+            "X-Pages-Cached": str(info["cached"]),
+        },
+    )
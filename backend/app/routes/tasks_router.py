@@ -0,0 +1,84 @@
+"""
+Tarefas em segundo plano (ver services/tasks):
+
+  POST   /tasks               → {kind, group, piece?, week?, year?} → 202 + tarefa
+  GET    /tasks               → últimas tarefas (?status=running)
+  GET    /tasks/{id}          → estado, progresso, resultado por peça e final
+  GET    /tasks/{id}/events   → o mesmo por SSE, até a tarefa terminar
+  DELETE /tasks/{id}          → cancela
+
+As rotas extract_to_csv, generate_analysis e generate-week-* também aceitam
+?background=true e devolvem a tarefa direto.
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.services import tasks
+
+router = APIRouter(prefix="/tasks", tags=["tasks"])
+
+SSE_INTERVAL_SECONDS = 0.5
+
+
+class TaskRequest(BaseModel):
+    kind: str
+    group: str
+    piece: Optional[str] = None
+    week: Optional[int] = None
+    year: Optional[int] = None
+
+
+@router.post("", status_code=202)
+def create_task(body: TaskRequest):
+    return tasks.submit_response(body.kind, body.group, body.piece, body.week, body.year)
+
+
+@router.get("")
+def list_tasks(status: Optional[str] = Query(None), limit: int = Query(50, ge=1, le=500)):
+    return {"tasks": tasks.list_tasks(status, limit)}
+
+
+@router.get("/{task_id}")
+def get_task(task_id: str):
+    try:
+        return tasks.get(task_id)
+    except tasks.TaskNotFound:
+        raise HTTPException(404, "Tarefa não encontrada")
+
+
+@router.get("/{task_id}/events")
+async def task_events(task_id: str):
+    #tasks.get pode ler o diário do disco: fora do event loop (leitura
+    #leve, vai para o pool padrão e não ocupa o pesado)
+    try:
+        await asyncio.to_thread(tasks.get, task_id)
+    except tasks.TaskNotFound:
+        raise HTTPException(404, "Tarefa não encontrada")
+
+    async def events():
+        last = None
+        while True:
+            task = await asyncio.to_thread(tasks.get, task_id)
+            payload = json.dumps(task, ensure_ascii=False)
+            if payload != last:
+                yield f"event: {task['status']}\ndata: {payload}\n\n"
+                last = payload
+            if task["status"] in tasks.FINISHED:
+                return
+            await asyncio.sleep(SSE_INTERVAL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.delete("/{task_id}")
+def cancel_task(task_id: str):
+    try:
+        return tasks.cancel(task_id)
+    except tasks.TaskNotFound:
+        raise HTTPException(404, "Tarefa não encontrada")
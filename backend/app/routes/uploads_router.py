@@ -0,0 +1,77 @@
+"""
+Upload em partes, retomável (ver services/chunked_upload):
+
+  POST   /uploads                     → inicia: {filename, size, group?, piece?, sha256?}
+  GET    /uploads/{id}                → status + bytes recebidos (de onde continuar)
+  PUT    /uploads/{id}?offset=N       → corpo = bytes da parte, gravados na posição N
+  POST   /uploads/{id}/finalize       → confere e processa em segundo plano (202)
+  DELETE /uploads/{id}                → cancela
+
+Offset fora de ordem devolve 409 com o `received` atual no corpo e no
+header Upload-Offset.
+"""
+
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.services import chunked_upload
+from app.services.workers import run_heavy
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+    group: Optional[str] = None
+    piece: Optional[str] = None
+    sha256: Optional[str] = None
+
+
+def _offset_response(status: dict, code: int = 200):
+    return JSONResponse(status, status_code=code, headers={"Upload-Offset": str(status["received"])})
+
+
+async def _call(fn, *args):
+    try:
+        return await run_heavy(fn, *args)
+    except chunked_upload.UploadNotFound:
+        raise HTTPException(404, "Upload não encontrado")
+    except chunked_upload.UploadConflict as e:
+        raise HTTPException(409, {"error": str(e), "received": e.received}, headers={"Upload-Offset": str(e.received)})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@router.post("", status_code=201)
+async def init_upload(body: UploadInit):
+    status = await _call(chunked_upload.init_upload, body.filename, body.size, body.group, body.piece, body.sha256)
+    return _offset_response(status, 201)
+
+
+@router.get("/{upload_id}")
+async def upload_status(upload_id: str):
+    return _offset_response(await _call(chunked_upload.get_status, upload_id))
+
+
+@router.put("/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    length = request.headers.get("content-length")
+    if length and int(length) > chunked_upload.MAX_CHUNK_BYTES:
+        raise HTTPException(413, f"Parte maior que {chunked_upload.MAX_CHUNK_BYTES} bytes")
+    data = await request.body()
+    return _offset_response(await _call(chunked_upload.write_chunk, upload_id, offset, data))
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(upload_id: str):
+    return _offset_response(await _call(chunked_upload.finalize, upload_id), 202)
+
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str):
+    await _call(chunked_upload.abort, upload_id)
+    return {"status": "ok"}
@@ -0,0 +1,130 @@
+"""
+Respostas em Arrow IPC (application/vnd.apache.arrow.stream) para clientes
+analíticos — pandas/polars leem direto, sem encode/decode de JSON.
+
+Negociação: Accept: application/vnd.apache.arrow.stream ou ?format=arrow.
+
+Os CSVs continuam sendo a fonte; na primeira leitura cada um é convertido
+para um arquivo Arrow em <peça>/.arrow/<nome>.arrow, refeito quando o CSV
+fica mais novo. As leituras seguintes fazem memory-map desse arquivo, sem
+copiar nem reconverter os dados.
+
+pyarrow é opcional — sem o pacote, pedir Arrow devolve 406.
+"""
+
+import io
+import json
+import os
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from .utils.fileio import atomic_write_bytes
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pragma: no cover - dependência opcional
+    pa = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+CACHE_DIRNAME = ".arrow"
+
+
+def wants_arrow(request: Request, format: Optional[str] = None) -> bool:
+    """True se o cliente pediu Arrow (format=arrow ou Accept)."""
+    if format == "arrow":
+        wanted = True
+    else:
+        wanted = ARROW_MEDIA_TYPE in request.headers.get("accept", "")
+    if wanted and pa is None:
+        raise HTTPException(406, "Formato Arrow indisponível (pyarrow não instalado)")
+    return wanted
+
+
+def cache_path(csv_path: str) -> str:
+    """Arquivo Arrow em cache correspondente a um CSV da peça."""
+    #csv/ e analysis/ ficam dentro da pasta da peça
+    piece_dir = os.path.dirname(os.path.dirname(csv_path))
+    sub = os.path.basename(os.path.dirname(csv_path))
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(piece_dir, CACHE_DIRNAME, f"{sub}_{name}.arrow")
+
+
+def _convert(csv_path: str, target: str):
+    table = pa_csv.read_csv(
+        csv_path,
+        #mantém Data/Hora como texto, igual ao pandas
+        convert_options=pa_csv.ConvertOptions(timestamp_parsers=[], column_types={"Hora": pa.string()}),
+    )
+    sink = io.BytesIO()
+    with pa_ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    atomic_write_bytes(target, sink.getvalue())
+
+
+def read_csv_table(csv_path: str, columns: Optional[list[str]] = None):
+    """
+    Tabela Arrow do CSV, via arquivo em cache (memory-map).
+    `columns` projeta sem materializar as outras colunas.
+    """
+    cached = cache_path(csv_path)
+    try:
+        fresh = os.path.getmtime(cached) >= os.path.getmtime(csv_path)
+    except OSError:
+        fresh = False
+    if not fresh:
+        _convert(csv_path, cached)
+
+    with pa.memory_map(cached, "r") as source:
+        table = pa_ipc.open_file(source).read_all()
+    if columns:
+        unknown = [c for c in columns if c not in table.column_names]
+        if unknown:
+            raise HTTPException(400, f"Colunas inexistentes: {', '.join(unknown)}")
+        table = table.select(columns)
+    return table
+
+
+def read_csv_files_table(files: list[tuple[str, str]], label_column: str, columns: Optional[list[str]] = None):
+    """Concatena vários CSVs (como o /dataframe), com a coluna de origem."""
+    tables = []
+    for path, label in files:
+        try:
+            table = read_csv_table(path)
+        except (pa.ArrowInvalid, OSError):
+            #pula arquivos inválidos
+            continue
+        tables.append(table.append_column(label_column, pa.array([label] * table.num_rows, pa.string())))
+    if not tables:
+        return pa.table({})
+    table = pa.concat_tables(tables, promote_options="permissive")
+    if columns:
+        unknown = [c for c in columns if c not in table.column_names]
+        if unknown:
+            raise HTTPException(400, f"Colunas inexistentes: {', '.join(unknown)}")
+        table = table.select(columns)
+    return table
+
+
+def table_from_chunks(chunks):
+    """Tabela Arrow a partir dos blocos pandas de TableQuery.iter_chunks."""
+    tables = [pa.Table.from_pandas(df, preserve_index=False) for df, _cursor in chunks if len(df)]
+    if not tables:
+        return pa.table({})
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def arrow_response(table, metadata: Optional[dict] = None) -> Response:
+    """Serializa a tabela no formato IPC stream; `metadata` vai no schema (JSON)."""
+    if metadata:
+        table = table.replace_schema_metadata(
+            {k: json.dumps(v, ensure_ascii=False, default=str) for k, v in metadata.items()}
+        )
+    sink = pa.BufferOutputStream()
+    with pa_ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), media_type=ARROW_MEDIA_TYPE)
@@ -0,0 +1,207 @@
+"""
+Ingestão em lote: um .zip / .tar.gz com os relatórios da semana do grupo.
+
+Organização esperada dentro do arquivo (pastas extras no início são ignoradas):
+  {grupo}/{peça}/relatorio.txt
+  {peça}/relatorio.txt              (com o grupo informado no formulário)
+
+Os TXT do PC-DMIS não trazem o part number no cabeçalho (só DATA/HORA),
+então o destino vem sempre das pastas.
+
+  - zip: lido entrada por entrada direto do upload; tar.gz: modo stream
+    ("r|*"), sem seek. Nada é extraído para pasta temporária;
+  - cada TXT é enviado para o pool de processos assim que sai do arquivo,
+    enquanto as próximas entradas ainda estão sendo lidas; no máximo
+    MAX_IN_FLIGHT ficam em andamento (a leitura espera o mais antigo), e
+    cada um é gravado em txt/ + csv/ assim que termina, largando os bytes;
+  - por fim roda a atualização incremental
+    (analysis da semana, _stats.json, relatórios de grupo) uma vez por peça.
+"""
+
+import os
+import tarfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import catalog, group_reports, ingest, piece_analysis
+from .pcdmis_csv_service import store_report
+from .pieces_service import sanitize_piece_name
+from .report_registry import DuplicateReport, find_duplicate, raw_hash
+from .utils.pcdmis_parser import ler_relatorio_pcdmis_bytes
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+#TXT lidos do pacote e ainda não gravados (limita a memória do lote)
+MAX_IN_FLIGHT = MAX_WORKERS * 4
+#proteção contra zip bomb: TXT do PC-DMIS tem poucos KB
+MAX_ENTRY_BYTES = 20 * 1024 * 1024
+MAX_ENTRIES = 20_000
+
+ARCHIVE_SUFFIXES = (".zip", ".tar.gz", ".tgz", ".tar")
+
+#pacote corrompido / formato errado
+ARCHIVE_ERRORS = (ValueError, OSError, EOFError, zipfile.BadZipFile, tarfile.TarError)
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return _pool
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_entries(fileobj, filename: str):
+    """Gera (nome, bytes ou None, erro) para cada arquivo do pacote."""
+    name = filename.lower()
+    count = 0
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                count += 1
+                if count > MAX_ENTRIES:
+                    raise ValueError(f"Arquivo com mais de {MAX_ENTRIES} entradas")
+                if info.file_size > MAX_ENTRY_BYTES:
+                    yield info.filename, None, "arquivo grande demais"
+                    continue
+                yield info.filename, zf.read(info), None
+    else:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+            for member in tf:
+                if not member.isfile():
+                    continue
+                count += 1
+                if count > MAX_ENTRIES:
+                    raise ValueError(f"Arquivo com mais de {MAX_ENTRIES} entradas")
+                if member.size > MAX_ENTRY_BYTES:
+                    yield member.name, None, "arquivo grande demais"
+                    continue
+                yield member.name, tf.extractfile(member).read(), None
+
+
+def route_entry(entry_name: str, default_group=None):
+    """(grupo, peça, nome do txt) a partir das pastas da entrada."""
+    parts = [p for p in entry_name.replace("\\", "/").split("/") if p and p != "."]
+    fname = os.path.basename(parts[-1]) if parts else ""
+    folders = parts[:-1]
+
+    if len(folders) >= 2:
+        group, piece = folders[-2], folders[-1]
+        #pasta extra do tipo "semana_12/{peça}/x.txt" com grupo no formulário
+        if default_group and catalog.piece_info(sanitize_piece_name(group), sanitize_piece_name(piece)) is None:
+            group = default_group
+    elif len(folders) == 1 and default_group:
+        group, piece = default_group, folders[0]
+    else:
+        raise ValueError("caminho sem pasta de peça")
+
+    return sanitize_piece_name(group), sanitize_piece_name(piece), fname
+
+
+def _parse(data: bytes):
+    return ler_relatorio_pcdmis_bytes(data)
+
+
+def _store(job, files: list, touched: dict):
+    """Espera o parse de um TXT e grava txt/ + csv/ da peça."""
+    global _pool
+    idx, group, piece, fname, data, future = job
+    item = files[idx]
+    try:
+        df = future.result()
+    except BrokenProcessPool:
+        _pool = None
+        df = _parse(data)
+    except Exception as e:
+        item.update(status="error", error=f"falha ao ler: {e}")
+        return
+    if df.empty:
+        item.update(status="error", error="nenhuma medição encontrada")
+        return
+    try:
+        csv_name = store_report(group, piece, fname, data, df)
+    except DuplicateReport as e:
+        #duplicado dentro do próprio pacote, ou só com Data/Hora/medições iguais
+        item.update(status="duplicate", duplicate_of=e.duplicate_of)
+        return
+    item.update(status="ok", rows=len(df), csv=csv_name)
+    touched.setdefault((group, piece), []).append(csv_name)
+
+
+def ingest_archive(fileobj, filename: str, default_group=None) -> dict:
+    """Processa o pacote inteiro e devolve o resumo por arquivo e por peça."""
+    global _pool
+    default_group = sanitize_piece_name(default_group) if default_group else None
+
+    files = []
+    touched = {}
+    window = deque()  #(índice em files, grupo, peça, nome, bytes, future), na ordem do pacote
+    pool = _get_pool()
+
+    for entry, data, error in iter_entries(fileobj, filename):
+        item = {"entry": entry}
+        files.append(item)
+        if error:
+            item.update(status="error", error=error)
+            continue
+        if not entry.lower().endswith(".txt"):
+            item.update(status="skipped", error="não é .txt")
+            continue
+        try:
+            group, piece, fname = route_entry(entry, default_group)
+        except ValueError as e:
+            item.update(status="rejected", error=str(e))
+            continue
+        item.update(group=group, piece=piece, file=fname)
+        if catalog.piece_info(group, piece) is None:
+            item.update(status="rejected", error="peça não cadastrada")
+            continue
+        #mesmo conteúdo já na peça → nem parseia
+        other = find_duplicate(group, piece, fname, raw_hash(data))
+        if other:
+            item.update(status="duplicate", duplicate_of=other)
+            continue
+        try:
+            future = pool.submit(_parse, data)
+        except BrokenProcessPool:
+            _pool = None
+            pool = _get_pool()
+            future = pool.submit(_parse, data)
+        window.append((len(files) - 1, group, piece, fname, data, future))
+        if len(window) >= MAX_IN_FLIGHT:
+            _store(window.popleft(), files, touched)
+        #o _store pode ter refeito o pool quebrado
+        pool = _get_pool()
+
+    while window:
+        _store(window.popleft(), files, touched)
+
+    pieces = []
+    for (group, piece), csv_names in touched.items():
+        entry = {"group": group, "piece": piece, "files": len(csv_names)}
+        try:
+            stats = ingest.refresh_piece(group, piece, csv_names, refresh_group=False)
+            if stats and "summary" in stats:
+                entry["total_characteristics"] = stats["summary"].get("total_characteristics")
+        except Exception as e:
+            entry["error"] = str(e)
+        pieces.append(entry)
+
+    #relatórios de grupo uma vez por grupo, não por peça
+    year, week = piece_analysis.current_week()
+    for group in {g for g, _ in touched}:
+        group_reports.refresh_from_stats(group, year, week)
+
+    counts = {}
+    for item in files:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+
+    return {"counts": counts, "pieces": pieces, "files": files}
@@ -0,0 +1,296 @@
+"""
+Catálogo em memória de grupos e peças.
+
+list_groups / list_pieces / get_piece_info liam o disco a cada chamada
+(listdir + abrir e parsear todo info.json) e todo relatório de grupo começa
+por list_pieces. Agora tudo vem daqui:
+
+  grupo → peça → {info (info.json), imagem (peca.*), semanas de análise}
+
+  - carregado uma vez (na subida do app ou no primeiro acesso);
+  - create/delete em groups_service / pieces_service atualizam o catálogo;
+  - imagem e semanas são revalidadas pelo mtime da pasta (imagens/, analysis/),
+    então qualquer rota que grave ali aparece na hora;
+  - fallback: uma thread de polling (CATALOG_POLL_SECONDS, padrão 5; 0 desliga)
+    compara mtimes das pastas e do info.json e recarrega o que mudou por fora
+    (pasta copiada à mão, outro processo etc.).
+"""
+
+import json
+import os
+import re
+import threading
+
+from .utils.weeks import in_range
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
+
+POLL_SECONDS = float(os.environ.get("CATALOG_POLL_SECONDS", "5"))
+
+ANALYSIS_RE = re.compile(r"^analysis_(\d{4})_W(\d{1,2})\.csv$")
+
+_lock = threading.RLock()
+_groups: dict = {}
+_groups_mtime = None
+_loaded = False
+_watcher = None
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_info(info_file: str):
+    try:
+        with open(info_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class _Piece:
+    __slots__ = ("path", "info", "info_mtime", "image", "image_mtime", "weeks", "weeks_mtime")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.info = None
+        self.info_mtime = None
+        self.image = None
+        self.image_mtime = -1
+        self.weeks = []
+        self.weeks_mtime = -1
+        self.reload_info()
+
+    def reload_info(self):
+        info_file = os.path.join(self.path, "info.json")
+        self.info_mtime = _mtime(info_file)
+        self.info = _read_info(info_file) if self.info_mtime is not None else None
+
+    def image_filename(self):
+        #indexada no info.json desde o upload; pastas antigas caem na varredura
+        indexed = (self.info or {}).get("image")
+        if indexed and os.path.isfile(os.path.join(self.path, "imagens", indexed)):
+            return indexed
+
+        image_dir = os.path.join(self.path, "imagens")
+        mtime = _mtime(image_dir)
+        if mtime != self.image_mtime:
+            image = None
+            if mtime is not None:
+                for f in sorted(os.listdir(image_dir)):
+                    if f.startswith("peca"):
+                        image = f
+                        break
+            self.image, self.image_mtime = image, mtime
+        return self.image
+
+    def analysis_weeks(self):
+        analysis_dir = os.path.join(self.path, "analysis")
+        mtime = _mtime(analysis_dir)
+        if mtime != self.weeks_mtime:
+            weeks = []
+            if mtime is not None:
+                for f in os.listdir(analysis_dir):
+                    m = ANALYSIS_RE.match(f)
+                    if m:
+                        weeks.append((int(m.group(1)), int(m.group(2))))
+            self.weeks, self.weeks_mtime = sorted(weeks), mtime
+        return self.weeks
+
+
+class _Group:
+    __slots__ = ("path", "pieces", "pieces_mtime")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pieces = {}
+        self.pieces_mtime = None
+        self.scan()
+
+    def scan(self):
+        pieces_dir = os.path.join(self.path, "pieces")
+        self.pieces_mtime = _mtime(pieces_dir)
+        found = {}
+        if self.pieces_mtime is not None:
+            for folder in sorted(os.listdir(pieces_dir)):
+                piece_path = os.path.join(pieces_dir, folder)
+                if os.path.isdir(piece_path):
+                    found[folder] = self.pieces.get(folder) or _Piece(piece_path)
+        self.pieces = found
+
+
+def _scan_groups():
+    global _groups, _groups_mtime
+    _groups_mtime = _mtime(BASE_DIR)
+    found = {}
+    if _groups_mtime is not None:
+        for name in sorted(os.listdir(BASE_DIR)):
+            path = os.path.join(BASE_DIR, name)
+            if os.path.isdir(path):
+                found[name] = _groups.get(name) or _Group(path)
+    _groups = found
+
+
+def load():
+    """(Re)carrega o catálogo inteiro do disco."""
+    global _loaded
+    with _lock:
+        _groups.clear()
+        _scan_groups()
+        _loaded = True
+
+
+def _ensure_loaded():
+    if not _loaded:
+        load()
+
+
+#consultas
+
+def groups() -> list[str]:
+    with _lock:
+        _ensure_loaded()
+        return list(_groups)
+
+
+def pieces(group: str) -> list[dict]:
+    """info.json de cada peça do grupo (cópias)."""
+    with _lock:
+        _ensure_loaded()
+        g = _groups.get(group)
+        if g is None:
+            return []
+        return [dict(p.info) for p in g.pieces.values() if p.info is not None]
+
+
+def _piece(group: str, piece: str):
+    _ensure_loaded()
+    g = _groups.get(group)
+    return g.pieces.get(piece) if g else None
+
+
+def piece_info(group: str, piece: str):
+    with _lock:
+        p = _piece(group, piece)
+        return dict(p.info) if p and p.info is not None else None
+
+
+def piece_image(group: str, piece: str):
+    """Nome do arquivo peca.* da peça, ou None."""
+    with _lock:
+        p = _piece(group, piece)
+        return p.image_filename() if p else None
+
+
+def piece_image_version(group: str, piece: str):
+    """Etag (hash do conteúdo) da imagem da peça, para URLs versionadas."""
+    from .piece_images import image_etag
+
+    with _lock:
+        p = _piece(group, piece)
+        image = p.image_filename() if p else None
+        if not image:
+            return None
+        path = os.path.join(p.path, "imagens", image)
+    try:
+        return image_etag(path)
+    except OSError:
+        return None
+
+
+def analysis_weeks(group: str, piece: str, start=None, end=None) -> list[tuple[int, int]]:
+    """
+    [(ano, semana)] com analysis_*.csv gerado, em ordem. start/end
+    ((ano, semana), inclusivos) cortam o índice sem tocar nos arquivos.
+    """
+    with _lock:
+        p = _piece(group, piece)
+        return in_range(p.analysis_weeks(), start, end) if p else []
+
+
+#atualizações (chamadas pelos services)
+
+def group_added(group: str):
+    global _groups
+    with _lock:
+        if _loaded:
+            _groups[group] = _Group(os.path.join(BASE_DIR, group))
+            _groups = dict(sorted(_groups.items()))
+
+
+def group_removed(group: str):
+    with _lock:
+        _groups.pop(group, None)
+
+
+def piece_added(group: str, piece: str):
+    with _lock:
+        if not _loaded:
+            return
+        g = _groups.get(group)
+        if g is None:
+            group_added(group)
+            return
+        g.pieces[piece] = _Piece(os.path.join(g.path, "pieces", piece))
+        g.pieces = dict(sorted(g.pieces.items()))
+
+
+def piece_updated(group: str, piece: str):
+    """info.json da peça foi regravado."""
+    with _lock:
+        p = _piece(group, piece) if _loaded else None
+        if p is not None:
+            p.reload_info()
+
+
+def piece_removed(group: str, piece: str):
+    with _lock:
+        g = _groups.get(group)
+        if g is not None:
+            g.pieces.pop(piece, None)
+
+
+#fallback: polling das pastas
+
+def check():
+    """Compara mtimes com o disco e recarrega o que mudou por fora."""
+    with _lock:
+        if not _loaded:
+            return
+        if _mtime(BASE_DIR) != _groups_mtime:
+            _scan_groups()
+        for g in _groups.values():
+            if _mtime(os.path.join(g.path, "pieces")) != g.pieces_mtime:
+                g.scan()
+            for p in g.pieces.values():
+                if _mtime(os.path.join(p.path, "info.json")) != p.info_mtime:
+                    p.reload_info()
+
+
+def _watch(stop: threading.Event):
+    while not stop.wait(POLL_SECONDS):
+        try:
+            check()
+        except Exception as e:
+            print(f"Erro no catálogo: {e}")
+
+
+def start():
+    """Carrega o catálogo e inicia o polling (startup do app)."""
+    global _watcher
+    load()
+    if POLL_SECONDS > 0 and _watcher is None:
+        stop = threading.Event()
+        thread = threading.Thread(target=_watch, args=(stop,), name="catalog-watch", daemon=True)
+        thread.start()
+        _watcher = (thread, stop)
+
+
+def stop():
+    global _watcher
+    if _watcher is not None:
+        _watcher[1].set()
+        _watcher = None
@@ -0,0 +1,323 @@
+"""
+Upload em partes, retomável, para lotes grandes vindos da rede da fábrica.
+
+  1. init     → cria data/uploads/{id}/ com meta.json (destino, tamanho total,
+                sha256 opcional) e o arquivo data.part vazio;
+  2. chunk    → cada parte é gravada direto na posição (offset) do data.part.
+                As partes vêm em ordem: offset maior que o recebido = 409 com
+                o offset certo; reenviar um pedaço já recebido só sobrescreve
+                os mesmos bytes;
+  3. finalize → confere tamanho (e sha256) e dispara o processamento em
+                segundo plano; o cliente acompanha pelo status.
+
+O recebido é o tamanho do data.part: depois de uma queda (do cliente ou do
+servidor) basta perguntar o status e continuar do offset devolvido.
+
+Com vários workers do uvicorn cada pedido pode cair num processo: partes e
+finalize se ordenam pelo lock de arquivo .lock da pasta do upload, e quem
+processa segura o .run enquanto isso. Um status de "processing" só
+resubmete se ninguém estiver com o .run (o processo que o tinha caiu).
+
+Um upload é um arquivo: um TXT (grupo + peça obrigatórios) ou um pacote
+.zip/.tar.gz (mesmas regras de /ingest/archive). Uploads parados há mais de
+UPLOAD_TTL_HOURS são apagados.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import bulk_ingest, catalog, ingest
+from .pcdmis_csv_service import store_report
+from .pieces_service import sanitize_piece_name
+from .report_registry import DuplicateReport
+from .utils.fileio import atomic_write_json
+from .utils.filelock import file_lock
+
+UPLOADS_DIR = os.environ.get(
+    "UPLOADS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "uploads"),
+)
+CHUNK_SIZE = 4 * 1024 * 1024              #tamanho sugerido ao cliente
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+TTL_SECONDS = float(os.environ.get("UPLOAD_TTL_HOURS", "24")) * 3600
+
+PART_FILENAME = "data.part"
+META_FILENAME = "meta.json"
+LOCK_FILENAME = ".lock"
+RUN_LOCK_FILENAME = ".run"
+
+#uploads que este processo já pôs no executor
+_lock = threading.Lock()
+_running: set = set()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload")
+
+
+class UploadError(ValueError):
+    """Pedido inválido (400)."""
+
+
+class UploadNotFound(LookupError):
+    pass
+
+
+class UploadConflict(ValueError):
+    """Offset/estado fora de ordem (409); `received` é onde continuar."""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+def _dir(upload_id: str) -> str:
+    #o id vira nome de pasta: só aceita o que nós mesmos geramos
+    if not upload_id or not all(c in "0123456789abcdef" for c in upload_id):
+        raise UploadNotFound(upload_id)
+    return os.path.join(UPLOADS_DIR, upload_id)
+
+
+def _upload_lock(upload_id: str):
+    """Lock de arquivo do upload (partes, finalize, abort), entre processos."""
+    path = _dir(upload_id)
+    #file_lock recriaria a pasta de um upload que não existe
+    if not os.path.isdir(path):
+        raise UploadNotFound(upload_id)
+    return file_lock(os.path.join(path, LOCK_FILENAME))
+
+
+def _run_lock(upload_id: str):
+    """Segurado por quem processa o upload (BlockingIOError se outro já está)."""
+    return file_lock(os.path.join(_dir(upload_id), RUN_LOCK_FILENAME), blocking=False)
+
+
+def _is_running(upload_id: str) -> bool:
+    """Algum processo está processando o upload agora?"""
+    try:
+        with _run_lock(upload_id):
+            return False
+    except BlockingIOError:
+        return True
+
+
+def _read_meta(upload_id: str) -> dict:
+    try:
+        with open(os.path.join(_dir(upload_id), META_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        raise UploadNotFound(upload_id)
+
+
+def _write_meta(meta: dict):
+    meta["updated_at"] = time.time()
+    atomic_write_json(os.path.join(_dir(meta["id"]), META_FILENAME), meta)
+
+
+def _received(upload_id: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(_dir(upload_id), PART_FILENAME))
+    except OSError:
+        return 0
+
+
+def _public(meta: dict) -> dict:
+    uploading = meta["status"] == "uploading"
+    return {
+        "upload_id": meta["id"],
+        "filename": meta["filename"],
+        "group": meta.get("group"),
+        "piece": meta.get("piece"),
+        "size": meta["size"],
+        "received": _received(meta["id"]) if uploading else meta["size"],
+        "chunk_size": CHUNK_SIZE,
+        "status": meta["status"],
+        "result": meta.get("result"),
+        "error": meta.get("error"),
+    }
+
+
+def prune():
+    """Apaga uploads abandonados (sem atividade há mais de TTL)."""
+    if not os.path.isdir(UPLOADS_DIR):
+        return
+    now = time.time()
+    for upload_id in os.listdir(UPLOADS_DIR):
+        path = os.path.join(UPLOADS_DIR, upload_id)
+        try:
+            #partes gravadas no data.part não mudam o mtime da pasta
+            last = max(
+                [os.stat(path).st_mtime]
+                + [os.stat(os.path.join(path, name)).st_mtime for name in os.listdir(path)]
+            )
+            if now - last <= TTL_SECONDS or _is_running(upload_id):
+                continue
+        except (OSError, UploadNotFound):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def init_upload(filename: str, size: int, group=None, piece=None, sha256=None) -> dict:
+    filename = os.path.basename(filename or "")
+    if not filename:
+        raise UploadError("Nome de arquivo vazio")
+    if size <= 0 or size > MAX_UPLOAD_BYTES:
+        raise UploadError(f"Tamanho inválido (máximo {MAX_UPLOAD_BYTES} bytes)")
+
+    group = sanitize_piece_name(group) if group else None
+    piece = sanitize_piece_name(piece) if piece else None
+
+    if filename.lower().endswith(".txt"):
+        if not group or not piece:
+            raise UploadError("TXT precisa de grupo e peça")
+        if catalog.piece_info(group, piece) is None:
+            raise UploadError("Peça não cadastrada")
+        kind = "txt"
+    elif bulk_ingest.is_archive(filename):
+        kind = "archive"
+    else:
+        raise UploadError("Envie um .txt, .zip, .tar.gz, .tgz ou .tar")
+
+    prune()
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_dir(upload_id))
+    open(os.path.join(_dir(upload_id), PART_FILENAME), "wb").close()
+    meta = {
+        "id": upload_id,
+        "kind": kind,
+        "filename": filename,
+        "group": group,
+        "piece": piece,
+        "size": size,
+        "sha256": sha256.lower() if sha256 else None,
+        "status": "uploading",
+        "created_at": time.time(),
+    }
+    _write_meta(meta)
+    return _public(meta)
+
+
+def get_status(upload_id: str) -> dict:
+    meta = _read_meta(upload_id)
+    #processo que processava caiu (ninguém com o .run) → retoma
+    if meta["status"] == "processing" and upload_id not in _running and not _is_running(upload_id):
+        _submit(upload_id)
+    return _public(meta)
+
+
+def write_chunk(upload_id: str, offset: int, data: bytes) -> dict:
+    if len(data) > MAX_CHUNK_BYTES:
+        raise UploadError(f"Parte maior que {MAX_CHUNK_BYTES} bytes")
+    with _upload_lock(upload_id):
+        meta = _read_meta(upload_id)
+        received = _received(upload_id)
+        if meta["status"] != "uploading":
+            raise UploadConflict(f"Upload já está {meta['status']}", received)
+        if offset < 0 or offset > received:
+            raise UploadConflict(f"Offset {offset} fora de ordem", received)
+        if offset + len(data) > meta["size"]:
+            raise UploadError("Parte passa do tamanho declarado")
+
+        fd = os.open(os.path.join(_dir(upload_id), PART_FILENAME), os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+    return _public(meta)
+
+
+def abort(upload_id: str):
+    with _upload_lock(upload_id):
+        _read_meta(upload_id)
+        try:
+            with _run_lock(upload_id):
+                shutil.rmtree(_dir(upload_id), ignore_errors=True)
+        except BlockingIOError:
+            raise UploadConflict("Upload em processamento", _received(upload_id))
+
+
+def finalize(upload_id: str) -> dict:
+    with _upload_lock(upload_id):
+        meta = _read_meta(upload_id)
+        if meta["status"] != "uploading":
+            return _public(meta)
+        received = _received(upload_id)
+        if received != meta["size"]:
+            raise UploadConflict(f"Faltam {meta['size'] - received} bytes", received)
+
+        if meta.get("sha256"):
+            h = hashlib.sha256()
+            with open(os.path.join(_dir(upload_id), PART_FILENAME), "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(block)
+            if h.hexdigest() != meta["sha256"]:
+                #volta para o começo: o conteúdo não bate
+                open(os.path.join(_dir(upload_id), PART_FILENAME), "wb").close()
+                raise UploadConflict("sha256 não confere, reenvie o arquivo", 0)
+
+        meta["status"] = "processing"
+        _write_meta(meta)
+        _submit(upload_id)
+    return _public(meta)
+
+
+def _submit(upload_id: str):
+    with _lock:
+        if upload_id in _running:
+            return
+        _running.add(upload_id)
+    _executor.submit(_process, upload_id)
+
+
+def _process(upload_id: str):
+    try:
+        with _run_lock(upload_id):
+            #outro processo pode ter terminado entre o status e o lock
+            if _read_meta(upload_id)["status"] == "processing":
+                _process_claimed(upload_id)
+    except (BlockingIOError, UploadNotFound):
+        #outro processo está com ele / foi cancelado
+        pass
+    finally:
+        with _lock:
+            _running.discard(upload_id)
+
+
+def _process_claimed(upload_id: str):
+    meta = _read_meta(upload_id)
+    part = os.path.join(_dir(upload_id), PART_FILENAME)
+    try:
+        if meta["kind"] == "txt":
+            meta["result"] = _process_txt(meta, part)
+        else:
+            with open(part, "rb") as f:
+                meta["result"] = bulk_ingest.ingest_archive(f, meta["filename"], meta.get("group"))
+        meta["status"] = "done"
+    except DuplicateReport as e:
+        meta.update(status="duplicate", error=str(e), result={"duplicate_of": e.duplicate_of})
+    except Exception as e:
+        meta.update(status="error", error=str(e))
+    finally:
+        #os bytes já foram para txt/ (ou eram um pacote): só o meta fica até o TTL
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        _write_meta(meta)
+
+
+def _process_txt(meta: dict, part: str) -> dict:
+    group, piece = meta["group"], meta["piece"]
+    with open(part, "rb") as f:
+        data = f.read()
+    csv_name = store_report(group, piece, meta["filename"], data)
+    result = {"file": meta["filename"], "csv": csv_name}
+    if csv_name:
+        stats = ingest.refresh_piece(group, piece, [csv_name])
+        if stats and "summary" in stats:
+            result["total_characteristics"] = stats["summary"].get("total_characteristics")
+    return result
@@ -0,0 +1,262 @@
+"""
+Relatórios semanais de grupo (CG / CP / CPK).
+
+Cada um soma as contagens verde/amarelo/vermelho das peças na semana:
+  cg  → reports/group_report_{ano}_W{semana}.json
+  cp  → reports_cp/group_cp_report_...
+  cpk → reports_cpk/group_cpk_report_...
+
+refresh_from_stats monta os três a partir dos _stats.json das peças
+(já calculados), sem reler CSV nenhum. generate_week é o caminho completo
+dos generate-week-*: deixa CSVs + analysis + _stats.json de cada peça em dia
+antes.
+
+Os relatórios registram a linhagem (ver lineage) no lineage.json do grupo:
+com os _stats.json das peças iguais, generate_week devolve o já gravado.
+A soma usa a contribuição guardada de cada peça (piece_contributions): só
+as peças que mudaram são recalculadas/relidas.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from . import catalog, lineage, rollup
+from .piece_analysis import (
+    analysis_path, ensure_week, outdated_csvs, piece_dir, stats_path, week_fresh, week_lock,
+)
+from .pieces_service import sanitize_piece_name
+from .utils.fileio import atomic_write_json
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
+
+REPORT_KINDS = {
+    "cg": ("reports", "group_report_"),
+    "cp": ("reports_cp", "group_cp_report_"),
+    "cpk": ("reports_cpk", "group_cpk_report_"),
+}
+CONTRIB_DIR = "contributions"
+
+
+def group_dir(group: str) -> str:
+    return os.path.join(BASE_DIR, sanitize_piece_name(group))
+
+
+def report_rel(kind: str, year: int, week: int) -> str:
+    folder, prefix = REPORT_KINDS[kind]
+    return f"{folder}/{prefix}{year}_W{week:02d}.json"
+
+
+def report_path(group: str, kind: str, year: int, week: int) -> str:
+    return os.path.join(group_dir(group), *report_rel(kind, year, week).split("/"))
+
+
+def _stats_rel(piece: str, year: int, week: int) -> str:
+    return f"pieces/{sanitize_piece_name(piece)}/analysis/analysis_{year}_W{week:02d}_stats.json"
+
+
+def stats_inputs(group: str, year: int, week: int) -> dict:
+    """Impressões dos _stats.json da semana de todas as peças (entradas do relatório)."""
+    rels = [_stats_rel(info["part_number"], year, week) for info in catalog.pieces(sanitize_piece_name(group))]
+    return lineage.fingerprints(group_dir(group), rels)
+
+
+def build_report(kind: str, year: int, week: int, summaries: list[dict]) -> dict:
+    """Soma os summaries das peças no formato dos generate-week-*."""
+    total_green = sum(s[f"{kind}_green"] for s in summaries)
+    total_yellow = sum(s[f"{kind}_yellow"] for s in summaries)
+    total_red = sum(s[f"{kind}_red"] for s in summaries)
+    total_points = sum(s["total_characteristics"] for s in summaries)
+
+    def pct(v):
+        return round((v / total_points) * 100, 2) if total_points > 0 else 0
+
+    return {
+        "year": year,
+        "week": week,
+        "green": total_green,
+        "green_percent": pct(total_green),
+        "yellow": total_yellow,
+        "yellow_percent": pct(total_yellow),
+        "red": total_red,
+        "red_percent": pct(total_red),
+        "total": total_points,
+        "pieces_processed": len(summaries),
+        "generated_at": datetime.now().isoformat()
+    }
+
+
+def write_report(group: str, kind: str, report_data: dict, inputs: dict = None) -> str:
+    year, week = report_data["year"], report_data["week"]
+    path = report_path(group, kind, year, week)
+    atomic_write_json(path, report_data)
+    rollup.record_report(group, kind, report_data, lineage.fingerprint(path))
+    if inputs is not None:
+        lineage.record(group_dir(group), report_rel(kind, year, week), inputs)
+    return path
+
+
+def contributions_path(group: str, year: int, week: int) -> str:
+    return os.path.join(group_dir(group), CONTRIB_DIR, f"contrib_{year}_W{week:02d}.json")
+
+
+def contribution(summary: dict) -> dict:
+    """Só as contagens que os relatórios somam (o summary traz bem mais)."""
+    keys = ["total_characteristics"] + [f"{kind}_{color}" for kind in REPORT_KINDS for color in ("green", "yellow", "red")]
+    return {key: summary.get(key, 0) for key in keys}
+
+
+def _read_contributions(group: str, year: int, week: int) -> dict:
+    try:
+        with open(contributions_path(group, year, week), "r", encoding="utf-8") as f:
+            return json.load(f)["pieces"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _read_summary(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("summary")
+    except (OSError, ValueError):
+        return None
+
+
+def piece_contributions(group: str, year: int, week: int, ensure: bool = False, on_piece=None):
+    """
+    Contribuição (contagens) de cada peça do grupo na semana. Retorna
+    (contribuições, impressões dos _stats.json) — as impressões são as
+    tiradas antes de ler cada peça, as entradas do relatório somado delas.
+
+    O grupo guarda em contributions/contrib_{ano}_W{semana}.json a
+    contribuição de cada peça junto com a impressão do _stats.json de onde
+    saiu: só as peças cujo _stats.json mudou são relidas. Com `ensure`, as
+    peças com CSV/analysis/_stats.json desatualizados são refeitas antes
+    (generate_week); `on_piece(peça, resultado, feitas, total)` como lá.
+    """
+    group = sanitize_piece_name(group)
+    cached = _read_contributions(group, year, week)
+    pieces = [sanitize_piece_name(info["part_number"]) for info in catalog.pieces(group)]
+    current = {}
+    inputs = {}
+    for i, piece in enumerate(pieces):
+        result = {"status": "ok", "rebuilt": False}
+        try:
+            summary = None
+            with week_lock(group, piece, year, week):
+                if ensure and (outdated_csvs(group, piece) or not week_fresh(group, piece, year, week)):
+                    stats, rebuilt = ensure_week(group, piece, year, week)
+                    summary = stats.get("summary") if stats else None
+                    result["rebuilt"] = rebuilt
+                fp = lineage.fingerprint(stats_path(group, piece, year, week))
+            if fp is not None:
+                inputs[_stats_rel(piece, year, week)] = fp
+            if fp is None:
+                result = {"status": "skipped"}
+            elif summary is None and cached.get(piece, {}).get("stats") == fp:
+                current[piece] = cached[piece]
+            else:
+                summary = summary or _read_summary(stats_path(group, piece, year, week))
+                if summary:
+                    current[piece] = {"stats": fp, "summary": contribution(summary)}
+                else:
+                    result = {"status": "skipped"}
+        except Exception as e:
+            print(f"Erro ao processar peça {piece}: {e}")
+            result = {"status": "error", "error": str(e)}
+        if on_piece:
+            on_piece(piece, result, i + 1, len(pieces))
+
+    if current != cached:
+        atomic_write_json(contributions_path(group, year, week), {"year": year, "week": week, "pieces": current})
+    return [entry["summary"] for entry in current.values()], inputs
+
+
+def refresh_from_stats(group: str, year: int, week: int, kinds=tuple(REPORT_KINDS)) -> dict:
+    """Regrava os relatórios da semana a partir dos _stats.json das peças."""
+    summaries, inputs = piece_contributions(group, year, week)
+    if not summaries:
+        return {}
+    reports = {}
+    for kind in kinds:
+        report = build_report(kind, year, week, summaries)
+        write_report(group, kind, report, inputs)
+        reports[kind] = report
+    return reports
+
+
+def generate_week(group: str, year: int, week: int, kinds=tuple(REPORT_KINDS), on_piece=None) -> dict:
+    """
+    Deixa os CSVs, o analysis e o _stats.json da semana de cada peça em dia
+    (TXT mais novo que o seu CSV é re-extraído) e grava
+    os relatórios `kinds` — só o que estiver desatualizado é refeito, e as
+    peças sem mudança entram com a contribuição guardada.
+    Retorna {kind: relatório} ({} se nenhuma peça tinha CSV).
+    `on_piece(peça, resultado, feitas, total)` é chamado a cada peça
+    (progresso das tarefas em fila; pode levantar para interromper).
+    """
+    summaries, inputs = piece_contributions(group, year, week, ensure=True, on_piece=on_piece)
+    if not summaries:
+        return {}
+    reports = {}
+    for kind in kinds:
+        path = report_path(group, kind, year, week)
+        if lineage.is_fresh(group_dir(group), report_rel(kind, year, week), inputs):
+            with open(path, "r", encoding="utf-8") as f:
+                reports[kind] = json.load(f)
+            continue
+        report = build_report(kind, year, week, summaries)
+        write_report(group, kind, report, inputs)
+        reports[kind] = report
+    return reports
+
+
+def piece_status(group: str, piece: str, manifest: dict = None) -> dict:
+    """Estado (fresh/stale/missing/unknown) de cada derivado da peça."""
+    base = piece_dir(group, piece)
+    manifest = lineage.read(base) if manifest is None else manifest
+
+    txt_dir = os.path.join(base, "txt")
+    names = [f for f in os.listdir(txt_dir) if f.lower().endswith(".txt")] if os.path.isdir(txt_dir) else []
+    outdated = [{"file": fname, "csv": state} for fname, state in outdated_csvs(group, piece, manifest)]
+
+    csv_inputs = lineage.folder_inputs(base, "csv", ".csv")
+    weeks = []
+    for year, week in catalog.analysis_weeks(sanitize_piece_name(group), sanitize_piece_name(piece)):
+        a_rel = os.path.relpath(analysis_path(group, piece, year, week), base).replace(os.sep, "/")
+        s_rel = a_rel.replace(".csv", "_stats.json")
+        weeks.append({
+            "year": year,
+            "week": week,
+            "analysis": lineage.state(base, a_rel, csv_inputs, manifest),
+            "stats": lineage.state(base, s_rel, lineage.fingerprints(base, [a_rel]), manifest),
+        })
+
+    return {
+        "piece": piece,
+        "txt": {"total": len(names), "outdated": outdated},
+        "weeks": weeks,
+        "up_to_date": not outdated and all(w["analysis"] == w["stats"] == "fresh" for w in weeks),
+    }
+
+
+def group_status(group: str, piece: str = None) -> dict:
+    """piece_status de cada peça + estado dos relatórios de grupo por semana."""
+    group = sanitize_piece_name(group)
+    names = [sanitize_piece_name(info["part_number"]) for info in catalog.pieces(group)]
+    if piece:
+        names = [n for n in names if n == sanitize_piece_name(piece)]
+    pieces = [piece_status(group, name) for name in names]
+
+    manifest = lineage.read(group_dir(group))
+    weeks = sorted({(w["year"], w["week"]) for p in pieces for w in p["weeks"]})
+    reports = []
+    for year, week in weeks:
+        inputs = stats_inputs(group, year, week)
+        reports.append({
+            "year": year,
+            "week": week,
+            **{kind: lineage.state(group_dir(group), report_rel(kind, year, week), inputs, manifest) for kind in REPORT_KINDS},
+        })
+
+    return {"group": group, "pieces": pieces, "reports": reports}
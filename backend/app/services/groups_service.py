@@ -2,6 +2,8 @@ import os
 import re
 import shutil
 
+from . import catalog
+
 BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
 
 # garante que base exista
@@ -11,11 +13,8 @@ os.makedirs(BASE_DIR, exist_ok=True)
 VALID_NAME = re.compile(r"^[A-Za-z0-9_\-]+$")
 
 def list_groups():
-    """Retorna lista de nomes de pastas (grupos)."""
-    try:
-        return sorted([name for name in os.listdir(BASE_DIR) if os.path.isdir(os.path.join(BASE_DIR, name))])
-    except FileNotFoundError:
-        return []
+    """Retorna lista de nomes de pastas (grupos), pelo catálogo em memória."""
+    return catalog.groups()
 
 def sanitize_group_name(name: str) -> str:
     """Remover espaços, transformar em algo seguro."""
@@ -45,6 +44,7 @@ def create_group(name: str):
             json.dump({"group": safe}, f, ensure_ascii=False, indent=2)
     except Exception:
         pass
+    catalog.group_added(safe)
     return True, safe
 
 def delete_group(group: str):
@@ -61,4 +61,5 @@ def delete_group(group: str):
     except Exception as e:
         return False, f"Erro ao apagar grupo: {e}"
 
+    catalog.group_removed(safe_group)
     return True, safe_group
@@ -0,0 +1,444 @@
+"""
+Ingestão automática dos relatórios da CMM.
+
+A CMM grava os TXT numa pasta de entrada (compartilhamento de rede):
+
+  data/inbox/{grupo}/{peça}/*.txt        (INGEST_INBOX muda a raiz)
+
+e o pipeline faz sozinho o que hoje é manual
+(upload_txt → extract_to_csv → generate_analysis → calculate_statistics):
+
+  1. detecção: watchdog (inotify etc.) se estiver instalado; senão polling
+     a cada INGEST_POLL_SECONDS. Com watchdog ainda há uma varredura lenta
+     de segurança;
+  2. debounce: o arquivo só entra quando tamanho+mtime ficam parados por
+     INGEST_DEBOUNCE_SECONDS (a CMM escreve aos poucos);
+  3. fila limitada (INGEST_QUEUE_SIZE) consumida por INGEST_WORKERS threads.
+     Fila cheia = backpressure: o arquivo continua na pasta de entrada e
+     é tentado de novo no próximo ciclo, nada é descartado;
+     o worker pega o arquivo com um rename atômico para
+     inbox/_processing/{pid}/ (só um processo do uvicorn fica com ele); o
+     que ficou lá de um processo que morreu volta para a entrada;
+  4. cada TXT vai para txt/ da peça e vira CSV em csv/ — relatório repetido
+     (mesmo conteúdo com outro nome, ver report_registry) é pulado;
+  5. a peça é atualizada de forma incremental (agrupando os arquivos que
+     chegaram juntos): os CSVs novos são acrescentados ao analysis da semana
+     atual, o _stats.json é recalculado e os relatórios de grupo da semana
+     são refeitos a partir dos _stats.json das peças.
+
+Peça/grupo inexistente ou duplicado → o arquivo vai para inbox/_rejected/.
+Erro inesperado → volta para a entrada e é tentado de novo; depois de
+INGEST_MAX_ATTEMPTS falhas vai para _rejected/ também.
+INGEST_WATCH=0 desliga o pipeline.
+"""
+
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from . import catalog, group_reports, piece_analysis
+from .pcdmis_csv_service import store_report
+from .pieces_service import sanitize_piece_name
+from .report_registry import DuplicateReport
+from .utils.filelock import file_lock
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover - dependência opcional
+    Observer = None
+
+INBOX_DIR = os.environ.get(
+    "INGEST_INBOX",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "inbox"),
+)
+ENABLED = os.environ.get("INGEST_WATCH", "1") != "0"
+POLL_SECONDS = float(os.environ.get("INGEST_POLL_SECONDS", "2"))
+SAFETY_SCAN_SECONDS = 30.0
+DEBOUNCE_SECONDS = float(os.environ.get("INGEST_DEBOUNCE_SECONDS", "3"))
+QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "256"))
+WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.environ.get("INGEST_MAX_ATTEMPTS", "3"))
+REJECTED_DIRNAME = "_rejected"
+PROCESSING_DIRNAME = "_processing"
+OWNER_LOCK = ".owner"
+
+#espera um pouco depois do último arquivo da peça antes de recalcular
+REFRESH_DELAY_SECONDS = 1.0
+
+
+class _Pipeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.pending = {}     #caminho → (assinatura, desde quando está parado)
+        self.queued = set()   #caminhos já na fila
+        self.dirty = {}       #(grupo, peça) → {"csv": set, "since": t}
+        self.refreshing = set()
+        self.stop = threading.Event()
+        self.wake = threading.Event()
+        self.threads = []
+        self.observer = None
+        self.counters = {
+            "files_ingested": 0,
+            "files_rejected": 0,
+            "files_duplicate": 0,
+            "files_failed": 0,
+            "pieces_refreshed": 0,
+            "backpressure": 0,
+        }
+        self.errors = deque(maxlen=20)
+        self.attempts = {}    #caminho relativo → falhas seguidas
+        self.owner = None     #lock do _processing/{pid} enquanto o pipeline roda
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    #detecção
+
+    def note(self, path: str):
+        """Arquivo novo/alterado na entrada (evento do watcher ou varredura)."""
+        if not path.lower().endswith(".txt"):
+            return
+        rel = os.path.relpath(path, INBOX_DIR)
+        if rel.split(os.sep)[0] in (REJECTED_DIRNAME, PROCESSING_DIRNAME) or len(rel.split(os.sep)) != 3:
+            return
+        with self.lock:
+            if path not in self.queued and path not in self.pending:
+                self.pending[path] = (None, time.monotonic())
+        self.wake.set()
+
+    def scan(self):
+        if not os.path.isdir(INBOX_DIR):
+            return
+        for group in os.listdir(INBOX_DIR):
+            group_dir = os.path.join(INBOX_DIR, group)
+            if group in (REJECTED_DIRNAME, PROCESSING_DIRNAME) or not os.path.isdir(group_dir):
+                continue
+            for piece in os.listdir(group_dir):
+                piece_dir = os.path.join(group_dir, piece)
+                if not os.path.isdir(piece_dir):
+                    continue
+                for fname in os.listdir(piece_dir):
+                    self.note(os.path.join(piece_dir, fname))
+
+    #debounce + fila
+
+    def _promote_ready(self):
+        now = time.monotonic()
+        with self.lock:
+            items = list(self.pending.items())
+        for path, (sig, since) in items:
+            try:
+                st = os.stat(path)
+            except OSError:
+                with self.lock:
+                    self.pending.pop(path, None)
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current != sig:
+                with self.lock:
+                    self.pending[path] = (current, now)
+                continue
+            if now - since < DEBOUNCE_SECONDS:
+                continue
+            try:
+                self.queue.put_nowait(("file", path))
+            except queue.Full:
+                self.count("backpressure")
+                return
+            with self.lock:
+                self.pending.pop(path, None)
+                self.queued.add(path)
+
+    def _promote_refreshes(self):
+        now = time.monotonic()
+        with self.lock:
+            ready = [
+                key for key, d in self.dirty.items()
+                if now - d["since"] >= REFRESH_DELAY_SECONDS and key not in self.refreshing
+            ]
+        for key in ready:
+            try:
+                self.queue.put_nowait(("refresh", key))
+            except queue.Full:
+                self.count("backpressure")
+                return
+            with self.lock:
+                self.refreshing.add(key)
+
+    def _scheduler(self):
+        last_scan = 0.0
+        scan_every = SAFETY_SCAN_SECONDS if self.observer else POLL_SECONDS
+        while not self.stop.is_set():
+            now = time.monotonic()
+            if now - last_scan >= scan_every:
+                try:
+                    self.scan()
+                except OSError as e:
+                    self.errors.append(f"varredura: {e}")
+                last_scan = now
+            self._promote_ready()
+            self._promote_refreshes()
+            self.wake.wait(min(POLL_SECONDS, 1.0))
+            self.wake.clear()
+
+    #processamento
+
+    def _reject(self, path: str, rel: str, reason: str, count: bool = True):
+        target = os.path.join(INBOX_DIR, REJECTED_DIRNAME, rel)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        if count:
+            self.count("files_rejected")
+        self.errors.append(f"{rel}: {reason}")
+
+    def _claim(self, path: str, rel: str):
+        """Move para _processing/{pid}/ (rename atômico). None se outro processo já pegou."""
+        claimed = os.path.join(_processing_dir(), rel)
+        os.makedirs(os.path.dirname(claimed), exist_ok=True)
+        try:
+            os.replace(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _release(self, claimed: str, rel: str):
+        """Devolve o arquivo pego à pasta de entrada (tentado de novo no próximo ciclo)."""
+        target = os.path.join(INBOX_DIR, rel)
+        if os.path.exists(target):
+            #chegou outro com o mesmo nome enquanto isso: vale o novo
+            os.remove(claimed)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(claimed, target)
+
+    def _failed(self, claimed: str, rel: str, error: Exception):
+        self.count("files_failed")
+        with self.lock:
+            attempts = self.attempts[rel] = self.attempts.get(rel, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            with self.lock:
+                self.attempts.pop(rel, None)
+            self._reject(claimed, rel, f"falhou {attempts} vezes: {error}")
+        else:
+            self.errors.append(f"{rel}: {error}")
+            self._release(claimed, rel)
+
+    def acquire_processing(self):
+        """
+        Segura o lock do _processing/{pid} deste processo e devolve à entrada
+        o que ficou nos de processos que já não estão rodando (inclusive um
+        anterior com o mesmo pid).
+        """
+        own = _processing_dir()
+        self.owner = ExitStack()
+        self.owner.enter_context(file_lock(os.path.join(own, OWNER_LOCK)))
+        root = os.path.dirname(own)
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                with file_lock(os.path.join(path, OWNER_LOCK), blocking=False):
+                    self._release_all(path)
+            except BlockingIOError:
+                continue
+            if path != own:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def release_processing(self):
+        if self.owner is not None:
+            self.owner.close()
+            self.owner = None
+
+    def _release_all(self, path: str):
+        for dirpath, _, files in os.walk(path):
+            for fname in files:
+                if fname == OWNER_LOCK:
+                    continue
+                claimed = os.path.join(dirpath, fname)
+                self._release(claimed, os.path.relpath(claimed, path))
+
+    def _ingest_file(self, path: str):
+        rel = os.path.relpath(path, INBOX_DIR)
+        claimed = self._claim(path, rel)
+        if claimed is None:
+            return
+        try:
+            self._ingest_claimed(claimed, rel)
+        except Exception as e:
+            self._failed(claimed, rel, e)
+
+    def _ingest_claimed(self, path: str, rel: str):
+        group_dir, piece_dir, fname = rel.split(os.sep)
+        try:
+            group = sanitize_piece_name(group_dir)
+            piece = sanitize_piece_name(piece_dir)
+        except ValueError as e:
+            self._reject(path, rel, str(e))
+            return
+        if catalog.piece_info(group, piece) is None:
+            self._reject(path, rel, "peça não cadastrada")
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            csv_name = store_report(group, piece, fname, data)
+        except DuplicateReport as e:
+            self.count("files_duplicate")
+            self._reject(path, rel, str(e), count=False)
+            return
+        os.remove(path)
+        with self.lock:
+            self.attempts.pop(rel, None)
+
+        self.count("files_ingested")
+        if csv_name:
+            mark_dirty(group, piece, [csv_name])
+
+    def _refresh_piece(self, key):
+        group, piece = key
+        with self.lock:
+            d = self.dirty.pop(key, None)
+        try:
+            if d:
+                refresh_piece(group, piece, sorted(d["csv"]))
+                self.count("pieces_refreshed")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def _worker(self):
+        while not self.stop.is_set():
+            try:
+                kind, item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if kind == "file":
+                    self._ingest_file(item)
+                else:
+                    self._refresh_piece(item)
+            except Exception as e:
+                if kind == "file":
+                    self.count("files_failed")
+                self.errors.append(f"{item}: {e}")
+            finally:
+                if kind == "file":
+                    with self.lock:
+                        self.queued.discard(item)
+                self.queue.task_done()
+
+
+_pipeline = _Pipeline()
+
+
+def _processing_dir() -> str:
+    return os.path.join(INBOX_DIR, PROCESSING_DIRNAME, str(os.getpid()))
+
+
+def mark_dirty(group: str, piece: str, csv_names: list[str]):
+    """Agenda a atualização incremental da peça com estes CSVs novos."""
+    with _pipeline.lock:
+        d = _pipeline.dirty.setdefault((group, piece), {"csv": set(), "since": 0.0})
+        d["csv"].update(csv_names)
+        d["since"] = time.monotonic()
+    _pipeline.wake.set()
+
+
+def refresh_piece(group: str, piece: str, csv_names: list[str], refresh_group: bool = True):
+    """
+    Acrescenta os CSVs ao analysis da semana atual, recalcula o _stats.json
+    e refaz os relatórios de grupo dessa semana.
+    """
+    year, week = piece_analysis.current_week()
+    #um lock só: as estatísticas saem do mesmo analysis que o append gravou
+    with piece_analysis.week_lock(group, piece, year, week):
+        df = piece_analysis.append_to_week_analysis(group, piece, year, week, csv_names)
+        if df is None or df.empty:
+            return None
+        stats = piece_analysis.write_week_stats(group, piece, year, week, df)
+    if refresh_group:
+        group_reports.refresh_from_stats(group, year, week)
+    return stats
+
+
+class _Handler(FileSystemEventHandler if Observer else object):
+    def on_created(self, event):
+        if not event.is_directory:
+            _pipeline.note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            _pipeline.note(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            _pipeline.note(event.dest_path)
+
+
+def start():
+    """Sobe o pipeline (startup do app)."""
+    if not ENABLED or _pipeline.threads:
+        return
+    os.makedirs(INBOX_DIR, exist_ok=True)
+    _pipeline.acquire_processing()
+    _pipeline.stop.clear()
+
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_Handler(), INBOX_DIR, recursive=True)
+        observer.start()
+        _pipeline.observer = observer
+
+    threads = [threading.Thread(target=_pipeline._scheduler, name="ingest-scheduler", daemon=True)]
+    threads += [
+        threading.Thread(target=_pipeline._worker, name=f"ingest-worker-{i}", daemon=True)
+        for i in range(WORKERS)
+    ]
+    for t in threads:
+        t.start()
+    _pipeline.threads = threads
+
+
+def stop():
+    _pipeline.stop.set()
+    _pipeline.wake.set()
+    if _pipeline.observer is not None:
+        _pipeline.observer.stop()
+        _pipeline.observer = None
+    for t in _pipeline.threads:
+        t.join(timeout=5)
+    _pipeline.threads = []
+    _pipeline.release_processing()
+
+
+def trigger_scan():
+    """Força uma varredura da pasta de entrada."""
+    _pipeline.scan()
+    _pipeline.wake.set()
+
+
+def status() -> dict:
+    with _pipeline.lock:
+        pending = len(_pipeline.pending)
+        dirty = len(_pipeline.dirty)
+    return {
+        "enabled": ENABLED,
+        "running": bool(_pipeline.threads),
+        "mode": "watchdog" if _pipeline.observer else "polling",
+        "inbox": INBOX_DIR,
+        "pending": pending,
+        "queued": _pipeline.queue.qsize(),
+        "queue_size": QUEUE_SIZE,
+        "pieces_waiting_refresh": dirty,
+        **dict(_pipeline.counters),
+        "recent_errors": list(_pipeline.errors),
+    }
@@ -0,0 +1,118 @@
+"""
+Linhagem dos arquivos derivados: de que entradas (e em que versão) cada um
+foi gerado.
+
+  csv/X.csv                    ← txt/X.TXT
+  analysis/analysis_A_WNN.csv  ← csv/*.csv
+  analysis/..._stats.json      ← analysis/analysis_A_WNN.csv
+  reports*/group_*_A_WNN.json  ← _stats.json da semana de cada peça
+
+Cada peça guarda o seu lineage.json ({artefato: {inputs: {entrada:
+impressão}}}) e o grupo guarda o dos relatórios. A impressão de uma entrada
+é tamanho + mtime: barata e muda sempre que o arquivo é regravado.
+
+Quem grava um derivado registra as impressões das entradas lidas (tiradas
+ANTES de ler, para uma mudança no meio do caminho deixar o derivado
+desatualizado, não escondida). Os generate-* só refazem o que estiver
+desatualizado; /pieces/group/{g}/status mostra o estado de cada peça.
+
+Estados: fresh (entradas iguais às registradas), stale (alguma mudou,
+sumiu ou apareceu), missing (artefato não existe), unknown (gerado antes da
+linhagem existir — tratado como desatualizado).
+"""
+
+import json
+import os
+import time
+
+from .utils.fileio import atomic_write_json
+from .utils.filelock import file_lock
+
+MANIFEST_FILENAME = "lineage.json"
+LOCK_FILENAME = ".lineage.lock"
+
+
+def fingerprint(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+def fingerprints(base_dir: str, rel_paths) -> dict:
+    """{caminho relativo: impressão} das entradas que existem."""
+    result = {}
+    for rel in rel_paths:
+        fp = fingerprint(os.path.join(base_dir, rel))
+        if fp is not None:
+            result[rel] = fp
+    return result
+
+
+def folder_inputs(base_dir: str, folder: str, suffix: str) -> dict:
+    """Impressões de todos os arquivos `suffix` de base_dir/folder."""
+    path = os.path.join(base_dir, folder)
+    if not os.path.isdir(path):
+        return {}
+    names = sorted(f for f in os.listdir(path) if f.lower().endswith(suffix))
+    return fingerprints(base_dir, [f"{folder}/{name}" for name in names])
+
+
+def _read(base_dir: str) -> dict:
+    try:
+        with open(os.path.join(base_dir, MANIFEST_FILENAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"artifacts": {}}
+
+
+def read(base_dir: str) -> dict:
+    """{artefato: registro} do manifesto (para consultas em massa)."""
+    return _read(base_dir)["artifacts"]
+
+
+def record(base_dir: str, artifact: str, inputs: dict, merge: bool = False, empty: bool = False):
+    """
+    Registra de que entradas `artifact` saiu. `merge` soma às entradas já
+    registradas (analysis acrescentado); `empty` marca que a entrada foi
+    processada mas não gerou arquivo (TXT sem medições ou duplicado).
+    """
+    with file_lock(os.path.join(base_dir, LOCK_FILENAME)):
+        data = _read(base_dir)
+        current = data["artifacts"].get(artifact, {})
+        merged = dict(current.get("inputs", {})) if merge else {}
+        merged.update(inputs)
+        data["artifacts"][artifact] = {"inputs": merged, "built_at": time.time(), "empty": empty}
+        atomic_write_json(os.path.join(base_dir, MANIFEST_FILENAME), data)
+
+
+def forget(base_dir: str, artifact: str):
+    with file_lock(os.path.join(base_dir, LOCK_FILENAME)):
+        data = _read(base_dir)
+        if data["artifacts"].pop(artifact, None) is not None:
+            atomic_write_json(os.path.join(base_dir, MANIFEST_FILENAME), data)
+
+
+def state(base_dir: str, artifact: str, inputs: dict, manifest: dict = None) -> str:
+    entry = (manifest if manifest is not None else read(base_dir)).get(artifact)
+    if entry and entry.get("empty"):
+        return "fresh" if entry["inputs"] == inputs else "stale"
+    if not os.path.exists(os.path.join(base_dir, artifact)):
+        return "missing"
+    if entry is None:
+        return "unknown"
+    return "fresh" if entry["inputs"] == inputs else "stale"
+
+
+def is_fresh(base_dir: str, artifact: str, inputs: dict) -> bool:
+    return state(base_dir, artifact, inputs) == "fresh"
+
+
+def covers(base_dir: str, artifact: str, inputs: dict) -> bool:
+    """Artefato existe e foi gerado com (pelo menos) estas entradas, nestas versões."""
+    entry = read(base_dir).get(artifact)
+    if entry is None or not os.path.exists(os.path.join(base_dir, artifact)):
+        return False
+    recorded = entry["inputs"]
+    return all(recorded.get(rel) == fp for rel, fp in inputs.items())
@@ -1,7 +1,9 @@
 import os
 import pandas as pd
 from typing import List
-from .utils.pcdmis_parser import ler_relatorio_pcdmis 
+from .utils.pcdmis_parser import ler_relatorio_pcdmis, ler_relatorio_pcdmis_bytes
+from .utils.fileio import atomic_write_bytes, atomic_write_text
+from . import lineage, report_registry
 from .pieces_service import sanitize_piece_name  
 BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
 
@@ -12,42 +14,134 @@ def ensure_csv_dir(group: str, piece: str) -> str:
     os.makedirs(csv_dir, exist_ok=True)
     return csv_dir
 
-def extract_all_txt_to_csv(group: str, piece: str) -> List[str]:
+def extract_txt_to_csv(group: str, piece: str, fname: str):
+    """
+    Extrai um único TXT de txt/ para csv/ (mesmo nome, .csv).
+    Retorna o nome do CSV, ou None se o TXT não tiver medições.
+    Levanta DuplicateReport se o mesmo relatório já existe com outro nome.
+    """
+    g = sanitize_piece_name(group)
+    p = sanitize_piece_name(piece)
+    base = os.path.join(BASE_DIR, g, "pieces", p)
+    txt_path = os.path.join(base, "txt", fname)
+    csv_name = os.path.splitext(fname)[0] + ".csv"
+    inputs = lineage.fingerprints(base, [f"txt/{fname}"])
+
+    df = ler_relatorio_pcdmis(txt_path)  #retorna df
+    if df.empty:
+        lineage.record(base, f"csv/{csv_name}", inputs, empty=True)
+        return None
+
+    with open(txt_path, "rb") as f:
+        sha = report_registry.raw_hash(f.read())
+    key = report_registry.report_key(df)
+    try:
+        report_registry.check_and_register(g, p, fname, sha, key)
+    except report_registry.DuplicateReport:
+        lineage.record(base, f"csv/{csv_name}", inputs, empty=True)
+        raise
+
+    csv_dir = ensure_csv_dir(group, piece)
+    csv_path = os.path.join(csv_dir, csv_name)
+    atomic_write_text(csv_path, df.to_csv(index=False))
+    lineage.record(base, f"csv/{csv_name}", inputs)
+    return csv_name
+
+def store_report(group: str, piece: str, fname: str, data: bytes, df=None):
+    """
+    Grava um relatório recebido em memória (pipeline, lote, upload em partes):
+    confere duplicado, grava txt/ + csv/ e registra o conteúdo.
+    Retorna o nome do CSV, ou None se não houver medições.
+    """
+    g = sanitize_piece_name(group)
+    p = sanitize_piece_name(piece)
+
+    sha = report_registry.raw_hash(data)
+    #mesmos bytes → nem parseia
+    report_registry.check(g, p, fname, sha)
+
+    if df is None:
+        df = ler_relatorio_pcdmis_bytes(data)
+    key = report_registry.report_key(df)
+    report_registry.check_and_register(g, p, fname, sha, key)
+
+    #o TXT fica em txt/ mesmo sem medições, como no upload manual
+    base = os.path.join(BASE_DIR, g, "pieces", p)
+    csv_name = os.path.splitext(fname)[0] + ".csv"
+    try:
+        atomic_write_bytes(os.path.join(base, "txt", fname), data)
+        if not df.empty:
+            atomic_write_text(os.path.join(base, "csv", csv_name), df.to_csv(index=False))
+    except Exception:
+        report_registry.forget(g, p, fname)
+        raise
+    inputs = lineage.fingerprints(base, [f"txt/{fname}"])
+    lineage.record(base, f"csv/{csv_name}", inputs, empty=df.empty)
+    return None if df.empty else csv_name
+
+def extract_all_txt_to_csv(group: str, piece: str, progress=None, force: bool = False) -> List[str]:
     """
     Para cada TXT em data/groups/<group>/pieces/<piece>/txt,
     extrai usando ler_relatorio_pcdmis() e salva um CSV
     com o mesmo nome (troca .txt -> .csv) em .../csv/.
     Retorna lista de caminhos de CSV (nomes de arquivo).
+    TXT cujo CSV já está em dia (ver lineage) não é reprocessado, a não
+    ser com `force`.
+    `progress(feitos, total, arquivo)` é chamado a cada TXT (tarefas em fila).
     """
     g = sanitize_piece_name(group)
     p = sanitize_piece_name(piece)
-    txt_dir = os.path.join(BASE_DIR, g, "pieces", p, "txt")
+    base = os.path.join(BASE_DIR, g, "pieces", p)
+    txt_dir = os.path.join(base, "txt")
     if not os.path.isdir(txt_dir):
         return []
 
-    csv_dir = ensure_csv_dir(group, piece)
     saved = []
+    names = [f for f in sorted(os.listdir(txt_dir)) if f.lower().endswith(".txt")]
+    manifest = lineage.read(base)
 
-    for fname in sorted(os.listdir(txt_dir)):
-        if not fname.lower().endswith(".txt"):
+    for i, fname in enumerate(names):
+        if progress:
+            progress(i, len(names), fname)
+        csv_name = os.path.splitext(fname)[0] + ".csv"
+        inputs = lineage.fingerprints(base, [f"txt/{fname}"])
+        if not force and lineage.state(base, f"csv/{csv_name}", inputs, manifest) == "fresh":
+            if os.path.exists(os.path.join(base, "csv", csv_name)):
+                saved.append(csv_name)
             continue
-        txt_path = os.path.join(txt_dir, fname)
         try:
-            df = ler_relatorio_pcdmis(txt_path)  #retorna df
+            csv_name = extract_txt_to_csv(group, piece, fname)
         except Exception as e:
             #falha em um arquivo não deve abortar tudo
             continue
 
-        if df.empty:
-            continue
-
-        csv_name = os.path.splitext(fname)[0] + ".csv"
-        csv_path = os.path.join(csv_dir, csv_name)
-        df.to_csv(csv_path, index=False, encoding="utf-8")
-        saved.append(csv_name)
+        if csv_name:
+            saved.append(csv_name)
 
     return saved
 
+def list_csv_files(group: str, piece: str) -> list[tuple[str, str]]:
+    """[(caminho, nome)] dos CSV em csv/, em ordem de nome."""
+    g = sanitize_piece_name(group)
+    p = sanitize_piece_name(piece)
+    csv_dir = os.path.join(BASE_DIR, g, "pieces", p, "csv")
+    if not os.path.isdir(csv_dir):
+        return []
+    return [
+        (os.path.join(csv_dir, f), f)
+        for f in sorted(os.listdir(csv_dir))
+        if f.lower().endswith(".csv")
+    ]
+
+
+def query_csv_dataframe(group: str, piece: str, query):
+    """
+    Igual ao load_all_csv_as_dataframe, mas com projeção/filtros/paginação
+    aplicados na leitura (TableQuery). Retorna (DataFrame, next_cursor).
+    """
+    return query.run(list_csv_files(group, piece), label_column="RelatorioCSV")
+
+
 def load_all_csv_as_dataframe(group: str, piece: str) -> pd.DataFrame:
     """
     Carrega todos os CSV em data/groups/<group>/pieces/<piece>/csv/
@@ -95,7 +189,7 @@ def save_analysis_csv(group: str, piece: str):
         BASE_DIR, g, "pieces", p, "analysis.csv"
     )
 
-    df.to_csv(analysis_path, index=False, encoding="utf-8")
+    atomic_write_text(analysis_path, df.to_csv(index=False))
 
     return analysis_path
 
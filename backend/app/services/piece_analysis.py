@@ -0,0 +1,339 @@
+"""
+Analysis semanal de uma peça (analysis/analysis_{ano}_W{semana}.csv) e suas
+estatísticas (..._stats.json).
+
+O analysis da semana é a junção de todos os CSVs de csv/ com a coluna
+Origem (nome do CSV) — o mesmo que /generate_analysis e os generate-week-*
+de grupo fazem. Aqui também dá para acrescentar só os CSVs novos a um
+analysis que já existe, sem reler os outros.
+
+Toda escrita de uma semana da peça passa por week_lock (lock de arquivo,
+vale entre workers do uvicorn) e é atômica. Quem esperou o lock só reusa o
+que encontrou se a linhagem mostrar que já cobre as suas entradas (os CSVs
+que ia acrescentar, o analysis de que ia calcular); senão faz o trabalho.
+
+Cada gravação registra a linhagem (ver lineage); ensure_csvs,
+ensure_week_analysis e ensure_week_stats só refazem o que estiver
+desatualizado, e ensure_week encadeia os três (txt → csv → analysis → stats). Cada _stats.json
+gravado atualiza a linha da peça no rollup do grupo (ver rollup).
+
+As estatísticas são calculadas quando o analysis muda (ingestão, extração,
+generate_analysis); as leituras (read_stats, latest_stats) só consultam o
+arquivo compacto, com cache em memória pela impressão.
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+from . import catalog, lineage, rollup
+from .pcdmis_csv_service import extract_txt_to_csv
+from .pieces_service import sanitize_piece_name
+from .report_registry import DuplicateReport
+from .statistics_service import calculate_statistics
+from .utils.fileio import atomic_write_json, atomic_write_text
+from .utils.filelock import file_lock
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
+
+logger = logging.getLogger(__name__)
+
+#_stats.json já parseados (caminho → (impressão, dados)), para as leituras
+STATS_CACHE_SIZE = int(os.environ.get("STATS_CACHE_SIZE", "64"))
+_stats_cache: OrderedDict = OrderedDict()
+_stats_cache_lock = threading.Lock()
+
+
+def current_week() -> tuple[int, int]:
+    """(ano, semana ISO) de agora, como as rotas usam por padrão."""
+    now = datetime.now()
+    return now.year, now.isocalendar()[1]
+
+
+def piece_dir(group: str, piece: str) -> str:
+    return os.path.join(BASE_DIR, sanitize_piece_name(group), "pieces", sanitize_piece_name(piece))
+
+
+def analysis_path(group: str, piece: str, year: int, week: int) -> str:
+    return os.path.join(piece_dir(group, piece), "analysis", f"analysis_{year}_W{week:02d}.csv")
+
+
+def stats_path(group: str, piece: str, year: int, week: int) -> str:
+    return analysis_path(group, piece, year, week).replace(".csv", "_stats.json")
+
+
+def _rel(group: str, piece: str, path: str) -> str:
+    """Caminho relativo à pasta da peça (chave do lineage.json)."""
+    return os.path.relpath(path, piece_dir(group, piece)).replace(os.sep, "/")
+
+
+def week_lock(group: str, piece: str, year: int, week: int):
+    """Lock do analysis + _stats.json da semana (reentrante na mesma thread)."""
+    return file_lock(os.path.join(piece_dir(group, piece), "analysis", f".lock_{year}_W{week:02d}"))
+
+
+def _read_csv_with_origin(csv_dir: str, file: str):
+    df = pd.read_csv(os.path.join(csv_dir, file))
+    df["Origem"] = file
+    return df
+
+
+def build_week_analysis(group: str, piece: str, year: int, week: int):
+    """Junta todos os CSVs da peça no analysis da semana. Retorna o DataFrame (ou None)."""
+    base = piece_dir(group, piece)
+    with week_lock(group, piece, year, week):
+        path = analysis_path(group, piece, year, week)
+        if lineage.is_fresh(base, _rel(group, piece, path), lineage.folder_inputs(base, "csv", ".csv")):
+            #montado enquanto esperávamos, com os mesmos CSVs
+            return pd.read_csv(path)
+        return _build_week_analysis(group, piece, year, week)
+
+
+def _build_week_analysis(group: str, piece: str, year: int, week: int):
+    base = piece_dir(group, piece)
+    csv_dir = os.path.join(base, "csv")
+    if not os.path.isdir(csv_dir):
+        return None
+    inputs = lineage.folder_inputs(base, "csv", ".csv")
+
+    dfs = []
+    for file in sorted(os.listdir(csv_dir)):
+        if file.lower().endswith(".csv"):
+            try:
+                dfs.append(_read_csv_with_origin(csv_dir, file))
+            except Exception:
+                logger.exception("Erro ao ler %s/%s: %s fica fora do analysis", group, piece, file)
+                continue
+
+    if not dfs:
+        return None
+
+    df_total = pd.concat(dfs, ignore_index=True)
+    path = analysis_path(group, piece, year, week)
+    atomic_write_text(path, df_total.to_csv(index=False))
+    lineage.record(base, _rel(group, piece, path), inputs)
+    return df_total
+
+
+def outdated_csvs(group: str, piece: str, manifest: dict = None) -> list[tuple[str, str]]:
+    """[(TXT, estado do CSV)] dos TXT de txt/ cujo CSV não está em dia."""
+    base = piece_dir(group, piece)
+    txt_dir = os.path.join(base, "txt")
+    if not os.path.isdir(txt_dir):
+        return []
+    manifest = lineage.read(base) if manifest is None else manifest
+    outdated = []
+    for fname in sorted(f for f in os.listdir(txt_dir) if f.lower().endswith(".txt")):
+        csv_rel = f"csv/{os.path.splitext(fname)[0]}.csv"
+        state = lineage.state(base, csv_rel, lineage.fingerprints(base, [f"txt/{fname}"]), manifest)
+        if state != "fresh":
+            outdated.append((fname, state))
+    return outdated
+
+
+def ensure_csvs(group: str, piece: str) -> list[str]:
+    """
+    csv/ em dia com txt/: re-extrai só os TXT com CSV desatualizado ou
+    faltando. Retorna os CSVs regravados.
+    """
+    extracted = []
+    for fname, _ in outdated_csvs(group, piece):
+        try:
+            csv_name = extract_txt_to_csv(group, piece, fname)
+        except DuplicateReport:
+            #registrado como processado sem CSV
+            continue
+        except Exception:
+            logger.exception("Erro ao extrair %s/%s: %s", group, piece, fname)
+            continue
+        if csv_name:
+            extracted.append(csv_name)
+    return extracted
+
+
+def ensure_week_analysis(group: str, piece: str, year: int, week: int):
+    """
+    analysis da semana em dia com csv/: refaz só se algum CSV mudou (e aí
+    já grava o _stats.json, para as leituras não calcularem nada).
+    Retorna (DataFrame ou None, refeito?).
+    """
+    base = piece_dir(group, piece)
+    with week_lock(group, piece, year, week):
+        path = analysis_path(group, piece, year, week)
+        if lineage.is_fresh(base, _rel(group, piece, path), lineage.folder_inputs(base, "csv", ".csv")):
+            return pd.read_csv(path), False
+        df = _build_week_analysis(group, piece, year, week)
+        if df is not None:
+            write_week_stats(group, piece, year, week, df)
+        return df, True
+
+
+def append_to_week_analysis(group: str, piece: str, year: int, week: int, csv_names: list[str]):
+    """
+    Acrescenta os CSVs `csv_names` ao analysis da semana (linhas antigas da
+    mesma Origem são trocadas). Sem analysis ainda, monta o completo.
+    Retorna o DataFrame resultante (ou None).
+    """
+    base = piece_dir(group, piece)
+    with week_lock(group, piece, year, week):
+        path = analysis_path(group, piece, year, week)
+        if not os.path.exists(path):
+            return _build_week_analysis(group, piece, year, week)
+        wanted = lineage.fingerprints(base, [f"csv/{name}" for name in csv_names])
+        if lineage.covers(base, _rel(group, piece, path), wanted):
+            #outro append/rebuild já incluiu estes CSVs, nesta versão
+            return pd.read_csv(path)
+        return _append(path, group, piece, csv_names)
+
+
+def _append(path: str, group: str, piece: str, csv_names: list[str]):
+    base = piece_dir(group, piece)
+    csv_dir = os.path.join(base, "csv")
+    inputs = lineage.fingerprints(base, [f"csv/{name}" for name in csv_names])
+    new_parts = []
+    for name in csv_names:
+        try:
+            new_parts.append(_read_csv_with_origin(csv_dir, name))
+        except Exception:
+            logger.exception("Erro ao ler %s/%s: %s não foi acrescentado", group, piece, name)
+
+    df = pd.read_csv(path)
+    if not new_parts:
+        return df
+
+    df = df[~df["Origem"].isin(csv_names)]
+    df = pd.concat([df, *new_parts], ignore_index=True)
+    atomic_write_text(path, df.to_csv(index=False))
+    lineage.record(base, _rel(group, piece, path), inputs, merge=True)
+    return df
+
+
+def _cache_stats(path: str, fingerprint, stats: dict):
+    with _stats_cache_lock:
+        _stats_cache[path] = (fingerprint, stats)
+        _stats_cache.move_to_end(path)
+        while len(_stats_cache) > STATS_CACHE_SIZE:
+            _stats_cache.popitem(last=False)
+
+
+def read_stats(path: str) -> dict:
+    """
+    _stats.json parseado, do cache em memória enquanto a impressão do
+    arquivo for a mesma. O dict é compartilhado: não alterar.
+    """
+    fp = lineage.fingerprint(path)
+    if fp is None:
+        raise FileNotFoundError(path)
+    with _stats_cache_lock:
+        hit = _stats_cache.get(path)
+        if hit and hit[0] == fp:
+            _stats_cache.move_to_end(path)
+            return hit[1]
+    with open(path, "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    _cache_stats(path, fp, stats)
+    return stats
+
+
+def write_week_stats(group: str, piece: str, year: int, week: int, df=None):
+    """
+    Calcula e grava o _stats.json da semana. Retorna as estatísticas.
+    Sem `df`, lê o analysis (FileNotFoundError se ainda não existir). Com
+    `df`, quem chama segura o week_lock desde que o produziu: a impressão
+    registrada é a do analysis de onde ele saiu.
+    """
+    base = piece_dir(group, piece)
+    with week_lock(group, piece, year, week):
+        path = stats_path(group, piece, year, week)
+        source = analysis_path(group, piece, year, week)
+        inputs = lineage.fingerprints(base, [_rel(group, piece, source)])
+        if inputs and lineage.is_fresh(base, _rel(group, piece, path), inputs):
+            #já calculado deste mesmo analysis
+            return read_stats(path)
+        if df is None:
+            df = pd.read_csv(source)
+        stats = calculate_statistics(df)
+        #compacto: é lido muito mais do que aberto à mão
+        atomic_write_json(path, stats, indent=None)
+        fp = lineage.fingerprint(path)
+        _cache_stats(path, fp, stats)
+        lineage.record(base, _rel(group, piece, path), inputs)
+        rollup.record(group, piece, year, week, stats.get("summary"), fp)
+        return stats
+
+
+def ensure_week_stats(group: str, piece: str, year: int, week: int):
+    """
+    _stats.json em dia com o analysis da semana: recalcula só se mudou.
+    Retorna (estatísticas, recalculado?). FileNotFoundError sem analysis.
+    """
+    base = piece_dir(group, piece)
+    path = stats_path(group, piece, year, week)
+    #caminho comum (já calculado na ingestão): sem lock, só consulta
+    if stats_fresh(group, piece, year, week):
+        try:
+            return read_stats(path), False
+        except FileNotFoundError:
+            pass
+    with week_lock(group, piece, year, week):
+        source = analysis_path(group, piece, year, week)
+        inputs = lineage.fingerprints(base, [_rel(group, piece, source)])
+        if not inputs:
+            raise FileNotFoundError(source)
+        if lineage.is_fresh(base, _rel(group, piece, path), inputs):
+            return read_stats(path), False
+        return write_week_stats(group, piece, year, week), True
+
+
+def ensure_week(group: str, piece: str, year: int, week: int):
+    """
+    CSVs + analysis + _stats.json da semana em dia, refazendo só o que
+    mudou. Retorna (estatísticas ou None se não houver CSV, refeito algo?).
+    """
+    base = piece_dir(group, piece)
+    ensure_csvs(group, piece)
+    with week_lock(group, piece, year, week):
+        path = analysis_path(group, piece, year, week)
+        if lineage.is_fresh(base, _rel(group, piece, path), lineage.folder_inputs(base, "csv", ".csv")):
+            return ensure_week_stats(group, piece, year, week)
+        df = _build_week_analysis(group, piece, year, week)
+        if df is None:
+            return None, False
+        return write_week_stats(group, piece, year, week, df), True
+
+
+def stats_fresh(group: str, piece: str, year: int, week: int) -> bool:
+    """_stats.json da semana em dia com o analysis? Só compara impressões."""
+    base = piece_dir(group, piece)
+    a_rel = _rel(group, piece, analysis_path(group, piece, year, week))
+    s_rel = _rel(group, piece, stats_path(group, piece, year, week))
+    return lineage.is_fresh(base, s_rel, lineage.fingerprints(base, [a_rel]))
+
+
+def week_fresh(group: str, piece: str, year: int, week: int) -> bool:
+    """analysis e _stats.json da semana em dia? Só compara impressões, não lê os arquivos."""
+    base = piece_dir(group, piece)
+    a_rel = _rel(group, piece, analysis_path(group, piece, year, week))
+    return (
+        lineage.is_fresh(base, a_rel, lineage.folder_inputs(base, "csv", ".csv"))
+        and stats_fresh(group, piece, year, week)
+    )
+
+
+def latest_stats(group: str, piece: str):
+    """
+    (estatísticas, ano, semana) da semana mais recente com analysis, em dia
+    com ele — o que gráficos de controle, capabilidade e plano de ação
+    mostram. None se a peça não tiver analysis.
+    """
+    weeks = catalog.analysis_weeks(sanitize_piece_name(group), sanitize_piece_name(piece))
+    if not weeks:
+        return None
+    year, week = weeks[-1]
+    stats, _ = ensure_week_stats(group, piece, year, week)
+    return stats, year, week
@@ -0,0 +1,111 @@
+"""
+Imagem da peça (imagens/peca.*): ETag forte e miniaturas em cache.
+
+  - image_etag: sha256 do conteúdo, memorizado por (caminho, mtime, tamanho)
+    — o arquivo só é relido quando muda;
+  - thumbnail: JPEG reduzido para os cards dos relatórios por peça, gravado
+    em <peça>/.thumbs/{etag}_{largura}.jpg e reaproveitado enquanto a imagem
+    original for a mesma (o etag faz parte do nome).
+
+Cache HTTP nas rotas:
+  ?v=<etag> igual ao atual  → Cache-Control immutable por 1 ano;
+  sem ?v                    → no-cache + ETag (revalida e recebe 304).
+"""
+
+import hashlib
+import io
+import os
+import threading
+
+from .utils.fileio import atomic_write_bytes
+
+THUMBS_DIRNAME = ".thumbs"
+THUMB_WIDTHS = (160, 320, 640)
+THUMB_QUALITY = 82
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "public, no-cache"
+
+_etags: dict = {}
+_lock = threading.Lock()
+
+
+def image_etag(path: str) -> str:
+    """Hash do conteúdo (hex, 32 chars)."""
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _lock:
+        cached = _etags.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    etag = h.hexdigest()[:32]
+
+    with _lock:
+        _etags[path] = (key, etag)
+    return etag
+
+
+def thumb_width(width: int) -> int:
+    """Menor largura padrão ≥ pedida (evita um arquivo por largura arbitrária)."""
+    for w in THUMB_WIDTHS:
+        if width <= w:
+            return w
+    return THUMB_WIDTHS[-1]
+
+
+def thumbnail(image_path: str, width: int) -> tuple[str, str]:
+    """
+    Caminho da miniatura (gera se preciso) e o etag dela.
+    A pasta da peça é a mãe de imagens/.
+    """
+    from PIL import Image, ImageOps
+
+    width = thumb_width(width)
+    etag = image_etag(image_path)
+    piece_dir = os.path.dirname(os.path.dirname(image_path))
+    thumbs_dir = os.path.join(piece_dir, THUMBS_DIRNAME)
+    thumb_path = os.path.join(thumbs_dir, f"{etag}_{width}.jpg")
+
+    if not os.path.exists(thumb_path):
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            if img.width > width:
+                img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, "JPEG", quality=THUMB_QUALITY, optimize=True)
+        atomic_write_bytes(thumb_path, buf.getvalue())
+        _prune(thumbs_dir, etag)
+
+    return thumb_path, f"{etag}-{width}"
+
+
+def _prune(thumbs_dir: str, etag: str):
+    #miniaturas de imagens antigas da peça
+    for f in os.listdir(thumbs_dir):
+        if not f.startswith(etag) and not f.startswith(".tmp_"):
+            try:
+                os.remove(os.path.join(thumbs_dir, f))
+            except OSError:
+                pass
+
+
+def cache_headers(etag: str, version) -> dict:
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": CACHE_IMMUTABLE if version == etag.split("-")[0] else CACHE_REVALIDATE,
+        "Access-Control-Allow-Origin": "*",
+    }
+
+
+def not_modified(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return f'"{etag}"' in tags or "*" in tags
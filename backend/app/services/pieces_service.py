@@ -3,6 +3,9 @@ import re
 import json
 import shutil
 
+from . import catalog
+from .utils.fileio import atomic_write_json
+
 BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
 
 # apenas números, letras, underline e hífen
@@ -17,22 +20,8 @@ def sanitize_piece_name(name: str) -> str:
     return name
 
 def list_pieces(group: str):
-    """Lista peças com suas informações."""
-    group_path = os.path.join(BASE_DIR, group, "pieces")
-    if not os.path.isdir(group_path):
-        return []
-
-    pieces = []
-
-    for folder in os.listdir(group_path):
-        piece_path = os.path.join(group_path, folder)
-        if os.path.isdir(piece_path):
-            info_file = os.path.join(piece_path, "info.json")
-            if os.path.exists(info_file):
-                with open(info_file, "r", encoding="utf-8") as f:
-                    pieces.append(json.load(f))
-
-    return pieces
+    """Lista peças com suas informações (catálogo em memória)."""
+    return catalog.pieces(group)
 
 
 def create_piece(group: str, part_number: str, part_name: str, model: str):
@@ -71,6 +60,7 @@ def create_piece(group: str, part_number: str, part_name: str, model: str):
             indent=2
         )
 
+    catalog.piece_added(safe_group, safe_number)
     return True, safe_number
 
 
@@ -90,6 +80,7 @@ def delete_piece(group: str, part_number: str):
     except Exception as e:
         return False, f"Erro ao apagar peça: {e}"
 
+    catalog.piece_removed(safe_group, safe_number)
     return True, safe_number
 
 
@@ -162,16 +153,16 @@ def get_piece_info(group: str, piece: str):
     group_safe = sanitize_piece_name(group)
     piece_safe = sanitize_piece_name(piece)
 
-    info_file = os.path.join(
-        BASE_DIR,
-        group_safe,
-        "pieces",
-        piece_safe,
-        "info.json"
-    )
+    return catalog.piece_info(group_safe, piece_safe)
+
 
-    if not os.path.exists(info_file):
-        return None
+def set_piece_image(group: str, piece: str, filename: str):
+    """Registra no info.json o arquivo de imagem da peça (imagens/<filename>)."""
+    group_safe = sanitize_piece_name(group)
+    piece_safe = sanitize_piece_name(piece)
 
-    with open(info_file, "r", encoding="utf-8") as f:
-        return json.load(f)
+    info_file = os.path.join(BASE_DIR, group_safe, "pieces", piece_safe, "info.json")
+    info = get_piece_info(group_safe, piece_safe) or {}
+    info["image"] = filename
+    atomic_write_json(info_file, info)
+    catalog.piece_updated(group_safe, piece_safe)
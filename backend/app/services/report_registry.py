@@ -0,0 +1,252 @@
+"""
+Registro de conteúdo dos relatórios de cada peça (<peça>/report_hashes.json).
+
+O mesmo relatório enviado de novo com outro nome dobrava as medições (e o
+Cp/Cpk). Para cada TXT aceito guardamos:
+
+  sha256 → hash dos bytes do arquivo (checado já no upload, sem parsear);
+  key    → "Data|Hora|hash das medições", do DataFrame parseado — pega o
+           mesmo relatório mesmo com outra codificação/espaços.
+
+upload_txt, o extrator, o pipeline de ingestão e o lote passam por
+check_and_register antes de gravar (conferir e registrar numa só seção
+crítica: dois envios do mesmo conteúdo ao mesmo tempo não passam os dois);
+duplicados são pulados na hora. Peças antigas sem registro
+ganham um na primeira consulta (única varredura de txt/): cópias que já
+estavam lá só ficam marcadas com duplicate_of. Tirar o CSV delas do
+analysis é um passo explícito (o TXT fica):
+
+  python -m app.services.report_registry            → todos os conjuntos
+  python -m app.services.report_registry CONJ_1 ... → só os informados
+
+Toda leitura-alteração-gravação do registro é feita sob file_lock (vale
+entre os workers do uvicorn).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+
+from . import lineage
+from .pieces_service import sanitize_piece_name
+from .utils.fileio import atomic_write_json
+from .utils.filelock import file_lock
+from .utils.pcdmis_parser import ler_relatorio_pcdmis
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
+REGISTRY_FILENAME = "report_hashes.json"
+LOCK_FILENAME = ".report_hashes.lock"
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_cache: dict = {}  #pasta da peça → (mtime do registro, dados)
+
+
+class DuplicateReport(ValueError):
+    def __init__(self, fname: str, duplicate_of: str):
+        super().__init__(f"{fname} é o mesmo relatório que {duplicate_of}")
+        self.fname = fname
+        self.duplicate_of = duplicate_of
+
+
+def raw_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def report_key(df) -> str:
+    """Data|Hora|hash das medições parseadas."""
+    if df.empty:
+        return ""
+    first = df.iloc[0]
+    content = hashlib.sha256(df.to_csv(index=False).encode("utf-8")).hexdigest()[:32]
+    return f"{first['Data']}|{first['Hora']}|{content}"
+
+
+def _piece_dir(group: str, piece: str) -> str:
+    return os.path.join(BASE_DIR, sanitize_piece_name(group), "pieces", sanitize_piece_name(piece))
+
+
+def _locked(piece_dir: str):
+    return file_lock(os.path.join(piece_dir, LOCK_FILENAME))
+
+
+def _match(files: dict, fname: str, sha256: str = None, key: str = None):
+    """Original (não marcado como cópia) com o mesmo conteúdo, fora o próprio fname."""
+    for other, entry in files.items():
+        if other == fname or entry.get("duplicate_of"):
+            continue
+        if sha256 and entry.get("sha256") == sha256:
+            return other
+        if key and entry.get("key") == key:
+            return other
+    return None
+
+
+def _build(piece_dir: str) -> dict:
+    files = {}
+    txt_dir = os.path.join(piece_dir, "txt")
+    if os.path.isdir(txt_dir):
+        for fname in sorted(os.listdir(txt_dir)):
+            if not fname.lower().endswith(".txt"):
+                continue
+            path = os.path.join(txt_dir, fname)
+            try:
+                with open(path, "rb") as f:
+                    sha = raw_hash(f.read())
+                key = report_key(ler_relatorio_pcdmis(path))
+            except Exception:
+                continue
+            entry = {"sha256": sha, "key": key}
+            #o primeiro nome fica como original; cópias antigas ficam marcadas
+            other = _match(files, fname, sha, key)
+            if other:
+                entry["duplicate_of"] = other
+            files[fname] = entry
+    return {"files": files}
+
+
+def _drop_csv(piece_dir: str, fname: str) -> bool:
+    """Apaga o CSV de uma cópia (o analysis fica desatualizado e é refeito)."""
+    csv_rel = f"csv/{os.path.splitext(fname)[0]}.csv"
+    try:
+        os.remove(os.path.join(piece_dir, *csv_rel.split("/")))
+    except FileNotFoundError:
+        return False
+    lineage.record(piece_dir, csv_rel, lineage.fingerprints(piece_dir, [f"txt/{fname}"]), empty=True)
+    return True
+
+
+def _load(piece_dir: str) -> dict:
+    path = os.path.join(piece_dir, REGISTRY_FILENAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        if not os.path.isdir(piece_dir):
+            return {"files": {}}
+        with _locked(piece_dir):
+            if os.path.exists(path):
+                #outro processo montou enquanto esperávamos
+                return _load(piece_dir)
+            data = _build(piece_dir)
+            _save(piece_dir, data)
+        return data
+
+    cached = _cache.get(piece_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except ValueError:
+        #registro corrompido: remonta como se não existisse
+        with _locked(piece_dir):
+            data = _build(piece_dir)
+            _save(piece_dir, data)
+        return data
+    _cache[piece_dir] = (mtime, data)
+    return data
+
+
+def _save(piece_dir: str, data: dict):
+    path = os.path.join(piece_dir, REGISTRY_FILENAME)
+    atomic_write_json(path, data)
+    _cache[piece_dir] = (os.stat(path).st_mtime_ns, data)
+
+
+def find_duplicate(group: str, piece: str, fname: str, sha256: str = None, key: str = None):
+    """
+    Nome do arquivo já registrado com o mesmo conteúdo (ou None).
+    Compara com todos os outros registrados, menos as cópias marcadas
+    (duplicate_of) — o original fica, as cópias saem — e o próprio `fname`
+    não conta: reenviar com o mesmo nome substitui.
+    """
+    with _lock:
+        files = _load(_piece_dir(group, piece))["files"]
+        return _match(files, fname, sha256, key)
+
+
+def check(group: str, piece: str, fname: str, sha256: str = None, key: str = None):
+    """Levanta DuplicateReport se o conteúdo já existir em outro arquivo."""
+    other = find_duplicate(group, piece, fname, sha256, key)
+    if other:
+        raise DuplicateReport(fname, other)
+
+
+def register(group: str, piece: str, fname: str, sha256: str = None, key: str = None):
+    piece_dir = _piece_dir(group, piece)
+    with _lock, _locked(piece_dir):
+        data = _load(piece_dir)
+        entry = data["files"].setdefault(fname, {})
+        #registrado = aceito como original
+        entry.pop("duplicate_of", None)
+        if sha256:
+            entry["sha256"] = sha256
+        if key:
+            entry["key"] = key
+        _save(piece_dir, data)
+
+
+def check_and_register(group: str, piece: str, fname: str, sha256: str = None, key: str = None):
+    """
+    check + register sob o mesmo lock. Levanta DuplicateReport se o
+    conteúdo já existir em outro arquivo; senão `fname` fica registrado
+    (quem chama grava o arquivo em seguida, ou o esquece se falhar).
+    """
+    piece_dir = _piece_dir(group, piece)
+    with _lock, _locked(piece_dir):
+        other = _match(_load(piece_dir)["files"], fname, sha256, key)
+        if other:
+            raise DuplicateReport(fname, other)
+        register(group, piece, fname, sha256, key)
+
+
+def drop_duplicate_csvs(group: str, piece: str) -> list[str]:
+    """
+    Apaga o CSV de cada TXT marcado como cópia (duplicate_of), para não
+    contar duas vezes no analysis. Retorna os CSVs apagados.
+    """
+    piece_dir = _piece_dir(group, piece)
+    removed = []
+    with _lock, _locked(piece_dir):
+        for fname, entry in _load(piece_dir)["files"].items():
+            if entry.get("duplicate_of") and _drop_csv(piece_dir, fname):
+                csv_name = f"{os.path.splitext(fname)[0]}.csv"
+                logger.warning("%s/%s: %s apagado (%s é cópia de %s)",
+                               group, piece, csv_name, fname, entry["duplicate_of"])
+                removed.append(csv_name)
+    return removed
+
+
+def drop_all_duplicate_csvs(groups: list[str] | None = None) -> dict[str, list[str]]:
+    """{grupo/peça: CSVs apagados} de todas as peças (ou só dos grupos informados)."""
+    if not os.path.isdir(BASE_DIR):
+        return {}
+    result = {}
+    for group in sorted(os.listdir(BASE_DIR)):
+        pieces_dir = os.path.join(BASE_DIR, group, "pieces")
+        if not os.path.isdir(pieces_dir) or (groups and group not in groups):
+            continue
+        for piece in sorted(os.listdir(pieces_dir)):
+            if os.path.isdir(os.path.join(pieces_dir, piece)):
+                removed = drop_duplicate_csvs(group, piece)
+                if removed:
+                    result[f"{group}/{piece}"] = removed
+    return result
+
+
+def forget(group: str, piece: str, fname: str):
+    piece_dir = _piece_dir(group, piece)
+    with _lock, _locked(piece_dir):
+        data = _load(piece_dir)
+        if data["files"].pop(fname, None) is not None:
+            _save(piece_dir, data)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for piece, removed in drop_all_duplicate_csvs(sys.argv[1:] or None).items():
+        print(f"{piece}: {len(removed)} CSV(s) de cópia apagado(s)")
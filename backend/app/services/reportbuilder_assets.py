@@ -0,0 +1,208 @@
+"""
+Armazenamento endereçado por conteúdo (hash → arquivo) dos blobs do report builder.
+
+Imagens coladas no canvas chegam como data URL ("data:image/png;base64,...")
+dentro de `pages`. Antes de gravar, cada data URL grande é extraída para:
+
+  app/data/jobs/{group}/reportbuilder/_assets/{sha256}.{ext}
+
+e no layout fica só a referência "asset://{sha256}.{ext}". O mesmo blob
+usado em vários snapshots é gravado uma única vez.
+
+Quem extrai e grava o JSON que referencia os assets segura assets_lock do
+começo ao fim; gc_assets roda depois de cada gravação, sob o mesmo lock.
+Um asset reaproveitado tem o mtime renovado e o GC não apaga nada mais novo
+que GC_GRACE_SECONDS (patches do auto-save ainda só na memória).
+"""
+
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import time
+from pathlib import Path
+
+from .utils.fileio import atomic_write_bytes
+from .utils.filelock import file_lock
+
+ASSETS_DIRNAME = "_assets"
+ASSET_PREFIX = "asset://"
+
+#data URLs menores que isso ficam inline (ícones, pixels etc.)
+MIN_ASSET_BYTES = 2048
+
+LOCK_NAME = ".assets.lock"
+GC_GRACE_SECONDS = 300
+
+_DATA_URL = re.compile(r"^data:([\w.+\-]+/[\w.+\-]+)?((?:;[^,;]*)*?)(;base64)?,", re.IGNORECASE)
+_ASSET_NAME = re.compile(r"^[0-9a-f]{64}\.[A-Za-z0-9]+$")
+
+
+def assets_dir(rb_dir: Path) -> Path:
+    path = Path(rb_dir) / ASSETS_DIRNAME
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def assets_lock(rb_dir: Path):
+    """Lock entre extrair assets + gravar o JSON e o GC (vale entre processos)."""
+    return file_lock(Path(rb_dir) / LOCK_NAME)
+
+
+def is_valid_asset_name(name: str) -> bool:
+    return bool(_ASSET_NAME.match(name))
+
+
+def _ext_for(mime: str) -> str:
+    if not mime:
+        return "bin"
+    if mime.lower() == "image/jpeg":
+        return "jpg"
+    ext = mimetypes.guess_extension(mime.lower())
+    return ext.lstrip(".") if ext else "bin"
+
+
+def _store_data_url(value: str, folder: Path):
+    """Grava a data URL como arquivo. Retorna a referência ou None se não for extraível."""
+    m = _DATA_URL.match(value)
+    if not m:
+        return None
+
+    mime = m.group(1) or ""
+    payload = value[m.end():]
+    try:
+        if m.group(3):
+            raw = base64.b64decode(payload, validate=False)
+        else:
+            from urllib.parse import unquote_to_bytes
+            raw = unquote_to_bytes(payload)
+    except Exception:
+        return None
+
+    digest = hashlib.sha256(raw).hexdigest()
+    name = f"{digest}.{_ext_for(mime)}"
+    target = folder / name
+    try:
+        #reaproveitado: mtime novo, o GC não apaga enquanto o JSON não sai
+        os.utime(target)
+    except FileNotFoundError:
+        atomic_write_bytes(target, raw)
+
+    return ASSET_PREFIX + name
+
+
+def extract_assets(obj, rb_dir: Path):
+    """
+    Percorre o layout e troca data URLs grandes por referências asset://.
+    Retorna uma cópia; o objeto original não é alterado.
+    Chamar dentro de assets_lock, até gravar o JSON com as referências.
+    """
+    folder = assets_dir(rb_dir)
+
+    def walk(node):
+        if isinstance(node, dict):
+            return {k: walk(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [walk(v) for v in node]
+        if isinstance(node, str) and len(node) >= MIN_ASSET_BYTES and node[:5].lower() == "data:":
+            ref = _store_data_url(node, folder)
+            return ref if ref else node
+        return node
+
+    return walk(obj)
+
+
+def inline_assets(obj, rb_dir: Path):
+    """
+    Inverso de extract_assets: troca asset:// pela data URL original,
+    para o front continuar recebendo o mesmo formato de sempre.
+    Referências cujo arquivo sumiu ficam como estão.
+    """
+    folder = Path(rb_dir) / ASSETS_DIRNAME
+    cache: dict[str, str] = {}
+
+    def resolve(ref: str) -> str:
+        if ref in cache:
+            return cache[ref]
+        name = ref[len(ASSET_PREFIX):]
+        path = folder / name
+        if not is_valid_asset_name(name) or not path.exists():
+            cache[ref] = ref
+            return ref
+        mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        encoded = base64.b64encode(path.read_bytes()).decode("ascii")
+        cache[ref] = f"data:{mime};base64,{encoded}"
+        return cache[ref]
+
+    def walk(node):
+        if isinstance(node, dict):
+            return {k: walk(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [walk(v) for v in node]
+        if isinstance(node, str) and node.startswith(ASSET_PREFIX):
+            return resolve(node)
+        return node
+
+    return walk(obj)
+
+
+def collect_refs(obj, found: set | None = None) -> set:
+    """Nomes de assets referenciados dentro de um layout."""
+    found = set() if found is None else found
+    if isinstance(obj, dict):
+        for v in obj.values():
+            collect_refs(v, found)
+    elif isinstance(obj, list):
+        for v in obj:
+            collect_refs(v, found)
+    elif isinstance(obj, str) and obj.startswith(ASSET_PREFIX):
+        found.add(obj[len(ASSET_PREFIX):])
+    return found
+
+
+def gc_assets(rb_dir: Path) -> list[str]:
+    """
+    Remove assets que nenhum JSON da pasta (auto-save, journal ou snapshot) referencia mais.
+    Roda depois de cada gravação — os JSONs já são pequenos, a varredura é barata.
+    """
+    rb_dir = Path(rb_dir)
+    with assets_lock(rb_dir):
+        return _gc(rb_dir)
+
+
+def _gc(rb_dir: Path) -> list[str]:
+    folder = rb_dir / ASSETS_DIRNAME
+    if not folder.exists():
+        return []
+
+    used: set = set()
+    for f in rb_dir.glob("*.json"):
+        try:
+            collect_refs(json.loads(f.read_text(encoding="utf-8")), used)
+        except Exception:
+            #arquivo ilegível: por segurança não apaga nada
+            return []
+
+    #patches do auto-save incremental ainda não compactados
+    for f in rb_dir.glob("*.jsonl"):
+        with open(f, encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    collect_refs(json.loads(line), used)
+                except Exception:
+                    continue
+
+    removed = []
+    cutoff = time.time() - GC_GRACE_SECONDS
+    for asset in folder.iterdir():
+        if asset.is_file() and is_valid_asset_name(asset.name) and asset.name not in used:
+            try:
+                if asset.stat().st_mtime > cutoff:
+                    continue
+                asset.unlink()
+                removed.append(asset.name)
+            except OSError:
+                continue
+    return removed
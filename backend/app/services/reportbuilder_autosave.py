@@ -0,0 +1,276 @@
+"""
+Auto-save incremental do report builder.
+
+Em vez de reescrever o canvas inteiro a cada tick, o front pode mandar só
+as mudanças (JSON Patch) contra a versão que ele conhece:
+
+  _autosave.json            → snapshot completo + "version"
+  _autosave.journal.jsonl   → um patch por linha, versões > snapshot
+  _autosave.version         → última versão aceita (por qualquer processo)
+
+Patches que chegam em sequência rápida ficam em memória e são gravados
+juntos (uma linha no journal) depois de COALESCE_SECONDS. A cada
+COMPACT_EVERY linhas o journal é compactado num snapshot novo.
+Todas as escritas do snapshot são atômicas (temp + rename).
+
+Com vários workers do uvicorn, a versão é conferida e incrementada sob um
+lock de arquivo contra a gravada em _autosave.version; um processo que vê
+o disco mudado por outro relê snapshot + journal antes de aplicar. Se a
+última versão ainda está só na memória de outro processo (patches
+esperando o COALESCE_SECONDS), o cliente recebe 409 e reenvia o estado
+completo.
+"""
+
+import atexit
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from .lineage import fingerprint
+from .reportbuilder_assets import assets_lock, extract_assets
+from .utils.fileio import atomic_write_json, atomic_write_text
+from .utils.filelock import file_lock
+from .utils.jsonpatch import JsonPatchError, apply_patch
+
+SNAPSHOT_NAME = "_autosave.json"
+JOURNAL_NAME = "_autosave.journal.jsonl"
+VERSION_NAME = "_autosave.version"
+LOCK_NAME = ".autosave.lock"
+
+COALESCE_SECONDS = 1.0
+COMPACT_EVERY = 50
+
+
+class VersionConflict(Exception):
+    def __init__(self, current: int):
+        super().__init__(f"Versão desatualizada (atual: {current})")
+        self.current = current
+
+
+class _Session:
+    """Estado em memória do auto-save de um conjunto."""
+
+    def __init__(self, rb_dir: Path):
+        self.rb_dir = rb_dir
+        self.lock = threading.RLock()
+        self.state = None
+        self.version = 0
+        self.pending: list[dict] = []
+        self.journal_lines = 0
+        self.timer = None
+        self.stamp = None   #impressões dos arquivos na última leitura/gravação deste processo
+
+
+_sessions: dict[str, _Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def _session(rb_dir: Path) -> _Session:
+    key = str(Path(rb_dir).resolve())
+    with _sessions_lock:
+        sess = _sessions.get(key)
+        if sess is None:
+            sess = _sessions[key] = _Session(Path(rb_dir))
+    return sess
+
+
+@contextmanager
+def _locked(sess: _Session):
+    """Lock do conjunto entre processos (arquivo) e entre threads, sempre nessa ordem."""
+    with file_lock(sess.rb_dir / LOCK_NAME), sess.lock:
+        yield
+
+
+def _stamp(sess: _Session) -> tuple:
+    return tuple(fingerprint(sess.rb_dir / name) for name in (SNAPSHOT_NAME, JOURNAL_NAME, VERSION_NAME))
+
+
+def _read_version(sess: _Session) -> int:
+    try:
+        return int((sess.rb_dir / VERSION_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0
+
+
+def _mark(sess: _Session, version: int):
+    atomic_write_text(sess.rb_dir / VERSION_NAME, str(version))
+    sess.stamp = _stamp(sess)
+
+
+def _cancel_timer(sess: _Session):
+    if sess.timer is not None:
+        sess.timer.cancel()
+        sess.timer = None
+
+
+def _sync(sess: _Session) -> int:
+    """
+    Relê o disco se outro processo gravou desde a última vez e retorna a
+    última versão aceita. Chamar dentro de _locked.
+    """
+    stamp = _stamp(sess)
+    if sess.state is None or stamp != sess.stamp:
+        #o que estava pendente aqui foi substituído pelo estado completo do outro
+        _cancel_timer(sess)
+        sess.pending = []
+        _load_from_disk(sess)
+        sess.stamp = stamp
+    return max(_read_version(sess), sess.version)
+
+
+def _load_from_disk(sess: _Session):
+    """Lê o snapshot e reaplica o journal (linhas corrompidas no fim são ignoradas)."""
+    snapshot = sess.rb_dir / SNAPSHOT_NAME
+    state = {}
+    if snapshot.exists():
+        state = json.loads(snapshot.read_text(encoding="utf-8"))
+    version = int(state.get("version", 0))
+
+    lines = 0
+    journal = sess.rb_dir / JOURNAL_NAME
+    if journal.exists():
+        with open(journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if entry["version"] <= version:
+                        continue
+                    state = apply_patch(state, entry["ops"])
+                    version = entry["version"]
+                    state["updated_at"] = entry.get("updated_at", state.get("updated_at"))
+                    lines += 1
+                except Exception:
+                    #escrita interrompida no meio: para no último patch íntegro
+                    break
+
+    state["version"] = version
+    sess.state = state
+    sess.version = version
+    sess.journal_lines = lines
+
+
+def _write_snapshot(sess: _Session):
+    atomic_write_json(sess.rb_dir / SNAPSHOT_NAME, sess.state)
+    journal = sess.rb_dir / JOURNAL_NAME
+    if journal.exists():
+        journal.unlink()
+    sess.journal_lines = 0
+    sess.stamp = _stamp(sess)
+
+
+def _flush(sess: _Session):
+    with _locked(sess):
+        _cancel_timer(sess)
+        if not sess.pending:
+            return
+        if _stamp(sess) != sess.stamp:
+            #outro processo gravou o estado completo depois destes patches
+            sess.pending = []
+            return
+
+        if sess.journal_lines + 1 >= COMPACT_EVERY:
+            sess.pending = []
+            _write_snapshot(sess)
+            return
+
+        entry = {
+            "version": sess.version,
+            "updated_at": sess.state.get("updated_at"),
+            "ops": sess.pending,
+        }
+        with open(sess.rb_dir / JOURNAL_NAME, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        sess.pending = []
+        sess.journal_lines += 1
+        sess.stamp = _stamp(sess)
+
+
+def load(rb_dir: Path) -> dict:
+    """Estado atual (com "version"), já incluindo patches ainda não gravados."""
+    sess = _session(rb_dir)
+    with _locked(sess):
+        _sync(sess)
+        return dict(sess.state)
+
+
+def save_full(rb_dir: Path, payload: dict) -> int:
+    """Substitui o estado inteiro (POST do layout). Grava snapshot e zera o journal."""
+    sess = _session(rb_dir)
+    with _locked(sess):
+        current = _sync(sess)
+        _cancel_timer(sess)
+        sess.pending = []
+        sess.version = current + 1
+        sess.state = {**payload, "version": sess.version}
+        _write_snapshot(sess)
+        _mark(sess, sess.version)
+        return sess.version
+
+
+def apply_ops(rb_dir: Path, base_version: int, ops: list[dict]) -> int:
+    """
+    Aplica um JSON Patch sobre a versão `base_version`.
+    Levanta VersionConflict se o cliente estiver atrasado e JsonPatchError
+    se o patch não se aplicar. Retorna a nova versão.
+    """
+    sess = _session(rb_dir)
+    #assets antes do lock do auto-save (mesma ordem do POST do layout)
+    with assets_lock(rb_dir), _locked(sess):
+        current = _sync(sess)
+        #sess.version < current: a última versão ainda não está no disco
+        if base_version != current or sess.version != current:
+            raise VersionConflict(current)
+
+        ops = [
+            {**op, "value": extract_assets(op["value"], rb_dir)} if "value" in op else op
+            for op in ops
+        ]
+        state = apply_patch(sess.state, ops)
+        if not isinstance(state, dict):
+            raise JsonPatchError("O documento precisa continuar sendo um objeto")
+
+        sess.version += 1
+        state["version"] = sess.version
+        state["updated_at"] = datetime.utcnow().isoformat()
+        sess.state = state
+        sess.pending.extend(ops)
+        _mark(sess, sess.version)
+
+        if sess.timer is None:
+            sess.timer = threading.Timer(COALESCE_SECONDS, _flush, args=(sess,))
+            sess.timer.daemon = True
+            sess.timer.start()
+
+        return sess.version
+
+
+def flush(rb_dir: Path):
+    """Grava imediatamente o que estiver pendente para este conjunto."""
+    key = str(Path(rb_dir).resolve())
+    sess = _sessions.get(key)
+    if sess is not None:
+        _flush(sess)
+
+
+def compact(rb_dir: Path):
+    """Força a compactação do journal num snapshot completo."""
+    sess = _session(rb_dir)
+    with _locked(sess):
+        _flush(sess)
+        #só quem tem a última versão compacta (senão gravaria um estado velho)
+        if sess.version == _sync(sess) and sess.journal_lines:
+            _write_snapshot(sess)
+
+
+@atexit.register
+def flush_all():
+    for sess in list(_sessions.values()):
+        try:
+            _flush(sess)
+        except Exception:
+            continue
@@ -0,0 +1,118 @@
+"""
+Índice de metadados dos snapshots nomeados do report builder.
+
+  app/data/jobs/{group}/reportbuilder/_index.json
+
+Guarda só o que a listagem precisa (reportName, updated_at, page_count,
+pageOrientation), atualizado a cada save/delete. Assim listar os snapshots
+é uma leitura de um arquivo pequeno, sem abrir cada JSON. Cada
+leitura-alteração-gravação do índice passa pelo lock de arquivo .index.lock
+(vale entre workers do uvicorn).
+
+Reconstrução para pastas antigas (ou editadas à mão):
+  python -m app.services.reportbuilder_index            → todos os conjuntos
+  python -m app.services.reportbuilder_index CONJ_1 ... → só os informados
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from .utils.fileio import atomic_write_json
+from .utils.filelock import file_lock
+
+INDEX_NAME = "_index.json"
+LOCK_NAME = ".index.lock"
+
+JOBS_DIR = Path(__file__).resolve().parent.parent / "data" / "jobs"
+
+def entry_for(name: str, payload: dict) -> dict:
+    return {
+        "name": name,
+        "reportName": payload.get("reportName", name),
+        "updated_at": payload.get("updated_at", ""),
+        "page_count": len(payload.get("pages", [])),
+        "pageOrientation": payload.get("pageOrientation", "landscape"),
+    }
+
+
+def _locked(rb_dir: Path):
+    return file_lock(Path(rb_dir) / LOCK_NAME)
+
+
+def _write(rb_dir: Path, reports: dict):
+    atomic_write_json(Path(rb_dir) / INDEX_NAME, {"reports": reports})
+
+
+def _read_raw(rb_dir: Path):
+    path = Path(rb_dir) / INDEX_NAME
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))["reports"]
+    except Exception:
+        return None
+
+
+def rebuild(rb_dir: Path) -> dict:
+    """Relê todos os snapshots da pasta e regrava o índice."""
+    rb_dir = Path(rb_dir)
+    with _locked(rb_dir):
+        reports = {}
+        for f in rb_dir.glob("*.json"):
+            if f.stem.startswith("_"):
+                continue
+            try:
+                data = json.loads(f.read_text(encoding="utf-8"))
+            except Exception:
+                continue
+            reports[f.stem] = entry_for(f.stem, data)
+        _write(rb_dir, reports)
+    return reports
+
+
+def list_entries(rb_dir: Path) -> list[dict]:
+    """Entradas do índice, mais recente primeiro. Sem índice → reconstrói uma vez."""
+    reports = _read_raw(rb_dir)
+    if reports is None:
+        reports = rebuild(rb_dir)
+    return sorted(reports.values(), key=lambda r: r.get("updated_at", ""), reverse=True)
+
+
+def upsert(rb_dir: Path, name: str, payload: dict):
+    with _locked(rb_dir):
+        reports = _read_raw(rb_dir)
+        if reports is None:
+            #primeiro save numa pasta antiga: indexa o que já existe
+            rebuild(rb_dir)
+            return
+        reports[name] = entry_for(name, payload)
+        _write(rb_dir, reports)
+
+
+def remove(rb_dir: Path, name: str):
+    with _locked(rb_dir):
+        reports = _read_raw(rb_dir)
+        if reports is None:
+            return
+        reports.pop(name, None)
+        _write(rb_dir, reports)
+
+
+def rebuild_all(groups: list[str] | None = None) -> dict[str, int]:
+    if not JOBS_DIR.exists():
+        return {}
+    result = {}
+    for group_dir in sorted(JOBS_DIR.iterdir()):
+        rb_dir = group_dir / "reportbuilder"
+        if not rb_dir.is_dir():
+            continue
+        if groups and group_dir.name not in groups:
+            continue
+        result[group_dir.name] = len(rebuild(rb_dir))
+    return result
+
+
+if __name__ == "__main__":
+    for group, count in rebuild_all(sys.argv[1:] or None).items():
+        print(f"{group}: {count} snapshot(s) indexado(s)")
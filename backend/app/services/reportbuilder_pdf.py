@@ -0,0 +1,380 @@
+"""
+Renderização do report builder em PDF no backend.
+
+Cada página do layout (auto-save ou snapshot) é desenhada com Pillow no
+mesmo tamanho do canvas do front (1122x794 px em paisagem) com escala 2,
+igual ao html2canvas do export do navegador.
+
+  - Páginas são renderizadas em paralelo num pool de processos.
+  - O PNG de cada página fica em _render_cache/{hash}.png; o hash cobre o
+    JSON da página, a orientação e a assinatura (tamanho + mtime) das
+    imagens usadas. Reexportar depois de mexer numa página só redesenha ela.
+  - O PDF final é montado embutindo o IDAT dos PNGs direto (FlateDecode),
+    sem decodificar as imagens de novo.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+from urllib.parse import unquote
+
+from .reportbuilder_assets import ASSET_PREFIX, ASSETS_DIRNAME, is_valid_asset_name
+from .utils.fileio import atomic_write_bytes
+
+JOBS_DIR = Path(__file__).resolve().parent.parent / "data" / "jobs"
+CACHE_DIRNAME = "_render_cache"
+
+#mesmo tamanho do canvas do front (gridSnap.js)
+CANVAS_SIZES = {"landscape": (1122, 794), "portrait": (794, 1122)}
+#A4 em pontos
+PDF_SIZES = {"landscape": (841.89, 595.28), "portrait": (595.28, 841.89)}
+
+SCALE = 2
+TEXT_PADDING = 8
+LINE_HEIGHT = 1.4
+
+#muda quando o desenho muda → invalida o cache antigo
+RENDER_VERSION = 1
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+MAX_CACHE_PAGES = 500
+
+_pool = None
+
+
+# ── resolução das imagens ─────────────────────────────────────────────────────
+
+def _job_file(url: str):
+    """/static/jobs/... → caminho no disco (sem sair de data/jobs)."""
+    prefix = "/static/jobs/"
+    if not url or not url.startswith(prefix):
+        return None
+    path = (JOBS_DIR / unquote(url[len(prefix):])).resolve()
+    if JOBS_DIR.resolve() not in path.parents or not path.is_file():
+        return None
+    return path
+
+
+def _image_source(element: dict, rb_dir: Path):
+    """
+    Retorna ("file", caminho) ou ("bytes", conteúdo) para o elemento de imagem,
+    ou None se a imagem não está disponível no servidor (URL externa, arquivo apagado).
+    """
+    if element.get("type") == "image":
+        path = _job_file((element.get("chart") or {}).get("url", ""))
+        return ("file", str(path)) if path else None
+
+    src = element.get("src") or ""
+    if src.startswith(ASSET_PREFIX):
+        name = src[len(ASSET_PREFIX):]
+        path = Path(rb_dir) / ASSETS_DIRNAME / name
+        if is_valid_asset_name(name) and path.is_file():
+            return ("file", str(path))
+        return None
+    if src.startswith("data:") and ";base64," in src:
+        try:
+            return ("bytes", base64.b64decode(src.split(";base64,", 1)[1]))
+        except Exception:
+            return None
+    if src.startswith("/static/jobs/"):
+        path = _job_file(src)
+        return ("file", str(path)) if path else None
+    return None
+
+
+def _page_key(page: dict, orientation: str, sources: dict) -> str:
+    files = {}
+    for src in sources.values():
+        if src and src[0] == "file":
+            st = os.stat(src[1])
+            files[src[1]] = [st.st_size, st.st_mtime_ns]
+    blob = json.dumps(
+        {"v": RENDER_VERSION, "o": orientation, "page": page, "files": files},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+# ── desenho (roda nos processos do pool) ──────────────────────────────────────
+
+def _font(size: int, bold: bool):
+    from PIL import ImageFont
+
+    names = (
+        ["DejaVuSans-Bold.ttf", "arialbd.ttf", "Arial Bold.ttf"] if bold
+        else ["DejaVuSans.ttf", "arial.ttf", "Arial.ttf"]
+    )
+    for name in names:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size)
+
+
+def _wrap(draw, text: str, font, max_width: float) -> list[str]:
+    """Quebra de linha equivalente a white-space: pre-wrap + word-break."""
+    lines = []
+    for paragraph in str(text).split("\n"):
+        current = ""
+        for word in paragraph.split(" "):
+            candidate = word if not current else f"{current} {word}"
+            if draw.textlength(candidate, font=font) <= max_width:
+                current = candidate
+                continue
+            if current:
+                lines.append(current)
+            #palavra maior que a caixa: quebra por caractere
+            current = ""
+            for ch in word:
+                if current and draw.textlength(current + ch, font=font) > max_width:
+                    lines.append(current)
+                    current = ch
+                else:
+                    current += ch
+        lines.append(current)
+    return lines
+
+
+def _draw_text(img, draw, el: dict):
+    x, y = el.get("x", 0) * SCALE, el.get("y", 0) * SCALE
+    w, h = el.get("width", 300) * SCALE, el.get("height", 100) * SCALE
+
+    bg = el.get("backgroundColor")
+    if bg and bg != "transparent":
+        try:
+            draw.rectangle([x, y, x + w, y + h], fill=bg)
+        except ValueError:
+            pass
+
+    size = int(el.get("fontSize", 16) * SCALE)
+    font = _font(size, el.get("fontWeight") == "bold")
+    pad = TEXT_PADDING * SCALE
+    inner_w = max(w - 2 * pad, 1)
+    line_h = size * LINE_HEIGHT
+    color = el.get("color") or "#000000"
+    align = el.get("textAlign") or "left"
+
+    #recorta no tamanho da caixa (overflow: hidden)
+    box = img.crop((int(x), int(y), int(x + w), int(y + h)))
+    from PIL import ImageDraw
+    box_draw = ImageDraw.Draw(box)
+
+    cy = pad
+    for line in _wrap(box_draw, el.get("content", ""), font, inner_w):
+        if cy > h:
+            break
+        lw = box_draw.textlength(line, font=font)
+        if align == "center":
+            cx = pad + (inner_w - lw) / 2
+        elif align == "right":
+            cx = pad + inner_w - lw
+        else:
+            cx = pad
+        try:
+            box_draw.text((cx, cy + (line_h - size) / 2), line, font=font, fill=color)
+        except ValueError:
+            box_draw.text((cx, cy + (line_h - size) / 2), line, font=font, fill="#000000")
+        if el.get("textDecoration") == "underline" and lw:
+            uy = cy + (line_h + size) / 2
+            box_draw.line([cx, uy, cx + lw, uy], fill=color, width=max(1, SCALE))
+        cy += line_h
+
+    img.paste(box, (int(x), int(y)))
+
+
+def _draw_image(img, draw, el: dict, source):
+    from PIL import Image
+
+    x, y = el.get("x", 0) * SCALE, el.get("y", 0) * SCALE
+    w = el.get("width", 500) * SCALE
+
+    if source is None:
+        #mesmo comportamento do onError do front
+        name = el.get("filename") or (el.get("chart") or {}).get("filename", "imagem")
+        draw.text((x + 16 * SCALE, y + 16 * SCALE), f"X {name}", fill="red", font=_font(14 * SCALE, False))
+        return
+
+    kind, value = source
+    pic = Image.open(value if kind == "file" else BytesIO(value))
+    pic.load()
+    if pic.width == 0:
+        return
+    #width: 100%; height: auto
+    h = w * pic.height / pic.width
+    pic = pic.convert("RGBA").resize((max(int(w), 1), max(int(h), 1)), Image.LANCZOS)
+    img.paste(pic, (int(x), int(y)), pic)
+
+
+def _render_page(page: dict, orientation: str, sources: dict, out_path: str) -> str:
+    from PIL import Image, ImageDraw
+
+    cw, ch = CANVAS_SIZES.get(orientation, CANVAS_SIZES["landscape"])
+    img = Image.new("RGB", (cw * SCALE, ch * SCALE), "white")
+    draw = ImageDraw.Draw(img)
+
+    for el in page.get("elements", []):
+        kind = el.get("type")
+        if kind == "text":
+            _draw_text(img, draw, el)
+        elif kind in ("image", "external-image"):
+            try:
+                _draw_image(img, draw, el, sources.get(el.get("id")))
+            except Exception:
+                _draw_image(img, draw, el, None)
+
+    buf = BytesIO()
+    img.save(buf, "PNG", optimize=False)
+    atomic_write_bytes(out_path, buf.getvalue())
+    return out_path
+
+
+# ── montagem do PDF ───────────────────────────────────────────────────────────
+
+def _png_info(data: bytes):
+    """Largura, altura e IDAT concatenado de um PNG RGB 8 bits não entrelaçado."""
+    pos = 8
+    width = height = None
+    idat = []
+    while pos < len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        if kind == b"IHDR":
+            width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", chunk)
+            if depth != 8 or color != 2 or interlace != 0:
+                raise ValueError("PNG de página em formato inesperado")
+        elif kind == b"IDAT":
+            idat.append(chunk)
+        elif kind == b"IEND":
+            break
+        pos += 12 + length
+    return width, height, b"".join(idat)
+
+
+def build_pdf(png_paths: list[str], orientation: str) -> bytes:
+    pw, ph = PDF_SIZES.get(orientation, PDF_SIZES["landscape"])
+    objects: list[bytes] = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add(b"")
+    pages_id = add(b"")
+    page_ids = []
+
+    for path in png_paths:
+        w, h, idat = _png_info(Path(path).read_bytes())
+        image_id = add(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+            b"/ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+            b"/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >> "
+            b"/Length %d >>\nstream\n" % (w, h, w, len(idat)) + idat + b"\nendstream"
+        )
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (pw, ph)
+        content = zlib.compress(content)
+        content_id = add(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, pw, ph, image_id, content_id)
+        ))
+
+    objects[catalog_id - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for off in offsets:
+        out.write(b"%010d 00000 n \n" % off)
+    out.write(
+        b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, catalog_id, xref)
+    )
+    return out.getvalue()
+
+
+# ── API ───────────────────────────────────────────────────────────────────────
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return _pool
+
+
+def render_pdf(rb_dir: Path, state: dict) -> tuple[bytes, dict]:
+    """
+    Renderiza o layout salvo num PDF paginado.
+    Retorna (bytes do PDF, {"pages", "rendered", "cached"}).
+    """
+    global _pool
+    rb_dir = Path(rb_dir)
+    orientation = state.get("pageOrientation", "landscape")
+    if orientation not in CANVAS_SIZES:
+        orientation = "landscape"
+
+    cache_dir = rb_dir / CACHE_DIRNAME
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    png_paths = []
+    todo = []
+    for page in state.get("pages", []):
+        sources = {
+            el.get("id"): _image_source(el, rb_dir)
+            for el in page.get("elements", [])
+            if el.get("type") in ("image", "external-image")
+        }
+        out_path = cache_dir / f"{_page_key(page, orientation, sources)}.png"
+        png_paths.append(str(out_path))
+        if out_path.exists():
+            os.utime(out_path)
+        else:
+            todo.append((page, orientation, sources, str(out_path)))
+
+    if len(todo) > 1:
+        try:
+            futures = [_get_pool().submit(_render_page, *job) for job in todo]
+            for fut in futures:
+                fut.result()
+        except BrokenProcessPool:
+            _pool = None
+            for job in todo:
+                if not Path(job[3]).exists():
+                    _render_page(*job)
+    elif todo:
+        _render_page(*todo[0])
+
+    pdf = build_pdf(png_paths, orientation)
+    _trim_cache(cache_dir, set(png_paths))
+    return pdf, {"pages": len(png_paths), "rendered": len(todo), "cached": len(png_paths) - len(todo)}
+
+
+def _trim_cache(cache_dir: Path, in_use: set[str]):
+    """Mantém no máximo MAX_CACHE_PAGES PNGs, apagando os usados há mais tempo."""
+    files = [f for f in cache_dir.glob("*.png") if str(f) not in in_use]
+    excess = len(files) + len(in_use) - MAX_CACHE_PAGES
+    if excess <= 0:
+        return
+    files.sort(key=lambda f: f.stat().st_mtime)
+    for f in files[:excess]:
+        try:
+            f.unlink()
+        except OSError:
+            continue
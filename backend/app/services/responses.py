@@ -0,0 +1,148 @@
+"""
+Caminho rápido de resposta para payloads grandes (dataframe / analysis).
+
+  - FastJSONResponse: serializa com orjson, que entende numpy e NaN
+    (vira null) sem passar pelo jsonable_encoder do FastAPI, e negocia
+    br / gzip pelo Accept-Encoding do cliente.
+    brotli é opcional — sem o pacote instalado, fica só gzip.
+
+Uso nas rotas: ?fast=true (opt-in, o formato padrão continua igual).
+Com ?orient=split as linhas vão como listas + "columns" uma vez só,
+sem repetir as chaves em cada registro.
+
+  - stream_table: ?format=ndjson|csv devolve um StreamingResponse que vai
+    escrevendo os blocos lidos do disco (TableQuery.iter_chunks), sem montar
+    a lista inteira — memória constante e primeiro byte imediato.
+"""
+
+import gzip
+import itertools
+
+import orjson
+import pandas as pd
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+#abaixo disso comprimir não compensa
+MIN_COMPRESS_BYTES = 1024
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _accepted_encodings(request: Request) -> dict[str, float]:
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(request: Request):
+    """'br', 'gzip' ou None, conforme o que o cliente aceita."""
+    accepted = _accepted_encodings(request)
+    options = []
+    if brotli is not None and accepted.get("br", 0) > 0:
+        options.append((accepted["br"], 1, "br"))
+    if accepted.get("gzip", 0) > 0:
+        options.append((accepted["gzip"], 0, "gzip"))
+    if not options:
+        return None
+    return max(options)[2]
+
+
+def compress_body(body: bytes, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=5)
+    return body
+
+
+class FastJSONResponse(Response):
+    """
+    JSONResponse com orjson. Se receber o `request`, comprime o corpo
+    com br/gzip conforme o Accept-Encoding.
+    """
+    media_type = "application/json"
+
+    def __init__(self, content, request: Request = None, status_code: int = 200, headers=None):
+        self._encoding = choose_encoding(request) if request is not None else None
+        self._applied = None
+        super().__init__(content=content, status_code=status_code, headers=headers)
+        if request is not None:
+            self.headers["Vary"] = "Accept-Encoding"
+        if self._applied:
+            self.headers["Content-Encoding"] = self._applied
+
+    def render(self, content) -> bytes:
+        body = orjson.dumps(content, option=ORJSON_OPTIONS)
+        if self._encoding and len(body) >= MIN_COMPRESS_BYTES:
+            body = compress_body(body, self._encoding)
+            self._applied = self._encoding
+        return body
+
+
+def dataframe_rows(df: pd.DataFrame, orient: str = "records"):
+    """
+    Linhas do DataFrame prontas para o orjson.
+    records → lista de dicts (formato atual); split → {"columns", "data"}.
+    """
+    if orient == "split":
+        return {
+            "columns": [str(c) for c in df.columns],
+            "data": list(df.itertuples(index=False, name=None)),
+        }
+    return df.to_dict(orient="records")
+
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _encode_chunks(chunks, fmt: str):
+    columns = None
+    for df, _cursor in chunks:
+        if fmt == "csv":
+            if columns is None:
+                columns = list(df.columns)
+                yield df.to_csv(index=False).encode("utf-8")
+            else:
+                #arquivos do csv/ podem ter colunas em ordem diferente
+                yield df.reindex(columns=columns).to_csv(index=False, header=False).encode("utf-8")
+        elif len(df):
+            yield (df.to_json(orient="records", lines=True, force_ascii=False).rstrip("\n") + "\n").encode("utf-8")
+
+
+def stream_table(chunks, fmt: str, filename: str) -> StreamingResponse:
+    """
+    StreamingResponse em NDJSON ou CSV a partir de um gerador de blocos
+    (DataFrame, cursor). O primeiro bloco é lido aqui, antes de responder,
+    para que erros de consulta (coluna inexistente etc.) virem 400 e não
+    uma resposta cortada.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is not None:
+        chunks = itertools.chain([first], chunks)
+    return StreamingResponse(
+        _encode_chunks(chunks, fmt),
+        media_type=STREAM_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'inline; filename="{filename}.{fmt}"'},
+    )
@@ -0,0 +1,359 @@
+"""
+Rollup materializado do grupo: uma linha por (ano, semana, peça) com as
+contagens verde/amarelo/vermelho de CG/CP/CPK, médias e totais do summary
+do _stats.json da peça.
+
+  data/groups/{grupo}/rollup.sqlite → tabelas piece_week e group_week
+
+group_week guarda os relatórios de grupo gravados (o JSON inteiro, por
+tipo/ano/semana): /reports, /cp-reports e /cpk-reports listam exatamente
+os relatórios gerados, como antes, sem abrir um JSON por semana.
+
+Os pieces-*-report recalculavam as estatísticas de cada peça a partir do
+analysis; /report e /report/cp-cpk da peça também (cada um lendo todos os
+analysis). Agora são uma consulta só (piece_trend para a peça):
+
+  - write_week_stats (único lugar que grava _stats.json) atualiza a linha
+    da peça, group_reports.write_report a do relatório;
+  - na primeira consulta de cada grupo no processo, sync() confere as
+    impressões dos _stats.json e dos relatórios existentes e acerta o que
+    foi gravado por fora (dados antigos, cópia manual) e o que sumiu;
+  - peças apagadas ficam de fora das consultas (filtro pelo catálogo).
+
+SQLite em modo WAL: vários workers do uvicorn leem e gravam o mesmo arquivo.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from . import catalog, lineage, piece_analysis
+from .pieces_service import sanitize_piece_name
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "groups")
+ROLLUP_FILENAME = "rollup.sqlite"
+
+KINDS = ("cg", "cp", "cpk")
+COUNT_COLUMNS = ["total_characteristics"] + [f"{kind}_{color}" for kind in KINDS for color in ("green", "yellow", "red")]
+VALUE_COLUMNS = COUNT_COLUMNS + ["avg_cp", "avg_cpk", "avg_sigma", "avg_r", "total_measurements", "total_ok"]
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS piece_week (
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    piece TEXT NOT NULL,
+    {", ".join(f"{col} {'REAL' if col.startswith('avg_') else 'INTEGER'}" for col in VALUE_COLUMNS)},
+    stats_fp TEXT,
+    updated_at REAL,
+    PRIMARY KEY (year, week, piece)
+);
+CREATE INDEX IF NOT EXISTS piece_week_piece ON piece_week (piece, year, week);
+CREATE TABLE IF NOT EXISTS group_week (
+    kind TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    report TEXT NOT NULL,
+    report_fp TEXT,
+    PRIMARY KEY (kind, year, week)
+);
+"""
+
+_lock = threading.Lock()
+_synced: set = set()
+
+
+def rollup_path(group: str) -> str:
+    return os.path.join(BASE_DIR, sanitize_piece_name(group), ROLLUP_FILENAME)
+
+
+def _connect(group: str):
+    path = rollup_path(group)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _upsert(conn, piece: str, year: int, week: int, summary: dict, fingerprint):
+    cols = ["year", "week", "piece", *VALUE_COLUMNS, "stats_fp", "updated_at"]
+    values = [year, week, piece, *(summary.get(col) for col in VALUE_COLUMNS), fingerprint, time.time()]
+    conn.execute(
+        f"INSERT OR REPLACE INTO piece_week ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+        values,
+    )
+
+
+def record(group: str, piece: str, year: int, week: int, summary, fingerprint=None):
+    """Grava (ou apaga, sem summary) a linha da peça na semana."""
+    piece = sanitize_piece_name(piece)
+    try:
+        with closing(_connect(group)) as conn, conn:
+            if summary:
+                _upsert(conn, piece, year, week, summary, fingerprint)
+            else:
+                conn.execute("DELETE FROM piece_week WHERE year = ? AND week = ? AND piece = ?", (year, week, piece))
+    except sqlite3.Error as e:
+        #o _stats.json já foi gravado; o sync da próxima subida acerta a linha
+        print(f"Erro ao atualizar rollup de {group}/{piece}: {e}")
+
+
+def record_report(group: str, kind: str, report: dict, fingerprint=None):
+    """Grava a linha do relatório de grupo `kind` da semana (o JSON como foi salvo)."""
+    try:
+        with closing(_connect(group)) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO group_week (kind, year, week, report, report_fp) VALUES (?, ?, ?, ?, ?)",
+                (kind, report["year"], report["week"], json.dumps(report), fingerprint),
+            )
+    except sqlite3.Error as e:
+        print(f"Erro ao atualizar rollup de {group}: {e}")
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_summary(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("summary")
+    except (OSError, ValueError):
+        return None
+
+
+def sync(group: str, force: bool = False):
+    """Acerta o rollup com os _stats.json do disco (uma vez por grupo no processo)."""
+    group = sanitize_piece_name(group)
+    with _lock:
+        #arquivo apagado (ou grupo recriado) sincroniza de novo
+        if group in _synced and not force and os.path.exists(rollup_path(group)):
+            return
+    with closing(_connect(group)) as conn, conn:
+        stored = {
+            (row["year"], row["week"], row["piece"]): row["stats_fp"]
+            for row in conn.execute("SELECT year, week, piece, stats_fp FROM piece_week")
+        }
+        seen = set()
+        for info in catalog.pieces(group):
+            piece = sanitize_piece_name(info["part_number"])
+            for year, week in catalog.analysis_weeks(group, piece):
+                path = piece_analysis.stats_path(group, piece, year, week)
+                fp = lineage.fingerprint(path)
+                if fp is None:
+                    continue
+                seen.add((year, week, piece))
+                if stored.get((year, week, piece)) == fp:
+                    continue
+                summary = _read_summary(path)
+                if summary:
+                    _upsert(conn, piece, year, week, summary, fp)
+        for year, week, piece in set(stored) - seen:
+            conn.execute("DELETE FROM piece_week WHERE year = ? AND week = ? AND piece = ?", (year, week, piece))
+        _sync_reports(conn, group)
+    with _lock:
+        _synced.add(group)
+
+
+def _sync_reports(conn, group: str):
+    #import aqui: group_reports importa piece_analysis, que importa este módulo
+    from .group_reports import REPORT_KINDS, group_dir
+
+    stored = {
+        (row["kind"], row["year"], row["week"]): row["report_fp"]
+        for row in conn.execute("SELECT kind, year, week, report_fp FROM group_week")
+    }
+    seen = set()
+    for kind, (folder, prefix) in REPORT_KINDS.items():
+        path = os.path.join(group_dir(group), folder)
+        if not os.path.isdir(path):
+            continue
+        for fname in os.listdir(path):
+            if not (fname.startswith(prefix) and fname.endswith(".json")):
+                continue
+            try:
+                year, week = fname[len(prefix):-len(".json")].split("_W")
+                key = (kind, int(year), int(week))
+            except ValueError:
+                continue
+            fp = lineage.fingerprint(os.path.join(path, fname))
+            if fp is not None and stored.get(key) == fp:
+                seen.add(key)
+                continue
+            report = _read_json(os.path.join(path, fname))
+            if report and (report.get("year"), report.get("week")) == key[1:]:
+                seen.add(key)
+                conn.execute(
+                    "INSERT OR REPLACE INTO group_week (kind, year, week, report, report_fp) VALUES (?, ?, ?, ?, ?)",
+                    (*key, json.dumps(report), fp),
+                )
+    for key in set(stored) - seen:
+        conn.execute("DELETE FROM group_week WHERE kind = ? AND year = ? AND week = ?", key)
+
+
+def _ensure_stats(group: str, piece: str, year: int, week: int):
+    """Calcula o _stats.json da semana se faltar ou estiver desatualizado (a linha vem junto)."""
+    if piece_analysis.stats_fresh(group, piece, year, week):
+        return
+    try:
+        stats, rebuilt = piece_analysis.ensure_week_stats(group, piece, year, week)
+    except Exception as e:
+        print(f"Erro ao processar peça {piece}: {e}")
+        return
+    if not rebuilt:
+        #outro worker gravou no meio do caminho
+        record(group, piece, year, week, stats.get("summary"),
+               lineage.fingerprint(piece_analysis.stats_path(group, piece, year, week)))
+
+
+def sync_week(group: str, year: int, week: int):
+    """
+    Garante a semana no rollup para as peças com analysis: calcula o
+    _stats.json de quem não tem (ou tem desatualizado) — o que os
+    pieces-*-report faziam em toda chamada, agora só quando precisa.
+    """
+    group = sanitize_piece_name(group)
+    sync(group)
+    for info in catalog.pieces(group):
+        piece = sanitize_piece_name(info["part_number"])
+        if os.path.exists(piece_analysis.analysis_path(group, piece, year, week)):
+            _ensure_stats(group, piece, year, week)
+
+
+def _pieces_filter(group: str) -> set:
+    return {sanitize_piece_name(info["part_number"]) for info in catalog.pieces(group)}
+
+
+def rows(group: str, piece: str = None, year: int = None, week: int = None) -> list[dict]:
+    """Linhas do rollup (filtros opcionais), ordenadas por ano/semana/peça."""
+    group = sanitize_piece_name(group)
+    sync(group)
+    where, params = [], []
+    for col, value in (("piece", sanitize_piece_name(piece) if piece else None), ("year", year), ("week", week)):
+        if value is not None:
+            where.append(f"{col} = ?")
+            params.append(value)
+    sql = "SELECT * FROM piece_week"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY year, week, piece"
+    known = _pieces_filter(group)
+    with closing(_connect(group)) as conn:
+        result = [dict(row) for row in conn.execute(sql, params)]
+    return [r for r in result if r["piece"] in known]
+
+
+def _pct(value, total):
+    return round((value / total) * 100, 2) if total else 0
+
+
+def week_totals(group: str, kind: str, start=None, end=None) -> list[dict]:
+    """
+    Relatórios de grupo `kind` gerados, por semana, exatamente como foram
+    gravados (generate-week-* / ingestão). start/end ((ano, semana),
+    inclusivos) vão para o WHERE: só as linhas do intervalo são lidas.
+    """
+    group = sanitize_piece_name(group)
+    sync(group)
+    where, params = ["kind = ?"], [kind]
+    if start:
+        where.append("(year, week) >= (?, ?)")
+        params.extend(start)
+    if end:
+        where.append("(year, week) <= (?, ?)")
+        params.extend(end)
+    sql = f"SELECT report FROM group_week WHERE {' AND '.join(where)} ORDER BY year, week"
+    with closing(_connect(group)) as conn:
+        return [json.loads(row["report"]) for row in conn.execute(sql, params)]
+
+
+def pieces_week(group: str, year: int, week: int, kind: str) -> list[dict]:
+    """
+    Contagens `kind` de cada peça na semana, do pior para o melhor
+    (mais vermelho + amarelo) — os gráficos "Por Peça".
+    """
+    group = sanitize_piece_name(group)
+    sync_week(group, year, week)
+    sql = f"""
+        SELECT piece, {kind}_green AS green, {kind}_yellow AS yellow, {kind}_red AS red,
+               total_characteristics AS total
+        FROM piece_week
+        WHERE year = ? AND week = ?
+        ORDER BY {kind}_red DESC, {kind}_yellow DESC, piece
+    """
+    with closing(_connect(group)) as conn:
+        result = [dict(row) for row in conn.execute(sql, (year, week))]
+
+    pieces = []
+    for r in result:
+        info = catalog.piece_info(group, r["piece"])
+        if info is None:
+            continue
+        pieces.append({
+            "part_number": info.get("part_number", r["piece"]),
+            "part_name": info.get("part_name", r["piece"]),
+            "green": r["green"],
+            "green_percent": _pct(r["green"], r["total"]),
+            "yellow": r["yellow"],
+            "yellow_percent": _pct(r["yellow"], r["total"]),
+            "red": r["red"],
+            "red_percent": _pct(r["red"], r["total"]),
+            "total": r["total"],
+            "image": catalog.piece_image(group, r["piece"]),
+            "image_version": catalog.piece_image_version(group, r["piece"]),
+        })
+    return pieces
+
+
+def piece_trend(group: str, piece: str, start=None, end=None) -> list[dict]:
+    """
+    Tendência semanal da peça com todas as métricas de uma vez: contagens e
+    percentuais CG/CP/CPK, médias (Cp, Cpk, sigma, R) e OK%. Semanas com
+    analysis no intervalo; as que ainda não têm _stats.json em dia são
+    calculadas uma vez, o resto é uma consulta no rollup.
+    """
+    group, piece = sanitize_piece_name(group), sanitize_piece_name(piece)
+    weeks = catalog.analysis_weeks(group, piece, start, end)
+    if not weeks:
+        return []
+    sync(group)
+    for year, week in weeks:
+        _ensure_stats(group, piece, year, week)
+
+    where, params = ["piece = ?"], [piece]
+    for op, bound in ((">=", weeks[0]), ("<=", weeks[-1])):
+        where.append(f"(year, week) {op} (?, ?)")
+        params.extend(bound)
+    sql = f"SELECT * FROM piece_week WHERE {' AND '.join(where)} ORDER BY year, week"
+    with closing(_connect(group)) as conn:
+        result = [dict(row) for row in conn.execute(sql, params)]
+
+    available = set(weeks)
+    trend = []
+    for r in result:
+        if (r["year"], r["week"]) not in available:
+            continue
+        item = {"year": r["year"], "week": r["week"], "total": r["total_characteristics"]}
+        for kind in KINDS:
+            for color in ("green", "yellow", "red"):
+                item[f"{kind}_{color}"] = r[f"{kind}_{color}"]
+                item[f"{kind}_{color}_percent"] = _pct(r[f"{kind}_{color}"], r["total_characteristics"])
+        item.update({
+            "avg_cp": r["avg_cp"],
+            "avg_cpk": r["avg_cpk"],
+            "avg_sigma": r["avg_sigma"],
+            "avg_r": r["avg_r"],
+            "total_measurements": r["total_measurements"],
+            "total_ok": r["total_ok"],
+            "ok_percent": _pct(r["total_ok"], r["total_measurements"]),
+        })
+        trend.append(item)
+    return trend
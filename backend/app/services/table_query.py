@@ -0,0 +1,267 @@
+"""
+Leitura parcial de CSVs de medição: projeção de colunas, filtros e paginação
+aplicados DURANTE a leitura, não depois de montar a tabela inteira.
+
+  - só as colunas pedidas (+ as usadas nos filtros) são convertidas (usecols);
+  - os arquivos são lidos em blocos e a leitura para assim que a página enche;
+  - o cursor guarda (arquivo, linha) para a próxima página continuar de onde
+    parou, sem reler o começo do arquivo.
+
+Filtros suportados (todos opcionais, combinados com E):
+  point   → NomePonto (um ou vários, sem diferenciar maiúsculas)
+  axis    → Eixo
+  origem  → Origem / arquivo de origem
+  date_from / date_to → coluna Data (DD/MM/AAAA), intervalo fechado
+"""
+
+import base64
+import json
+from datetime import date
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, Query
+
+CHUNK_ROWS = 20_000
+
+FILTER_COLUMNS = {
+    "point": "NomePonto",
+    "axis": "Eixo",
+    "origem": "Origem",
+}
+DATE_COLUMN = "Data"
+DATE_FORMAT = "%d/%m/%Y"
+
+
+class QueryError(ValueError):
+    pass
+
+
+def encode_cursor(file_idx: int, row: int) -> str:
+    raw = json.dumps([file_idx, row]).encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        file_idx, row = json.loads(base64.urlsafe_b64decode(padded))
+        return int(file_idx), int(row)
+    except Exception:
+        raise QueryError("Cursor inválido")
+
+
+def _upper_set(values) -> Optional[set]:
+    if not values:
+        return None
+    return {str(v).strip().upper() for v in values if str(v).strip()} or None
+
+
+class TableQuery:
+    """Parâmetros de projeção/filtro/paginação de uma leitura."""
+
+    def __init__(
+        self,
+        columns: Optional[list[str]] = None,
+        point: Optional[list[str]] = None,
+        axis: Optional[list[str]] = None,
+        origem: Optional[list[str]] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        cursor: Optional[str] = None,
+    ):
+        self.columns = [c for c in (columns or []) if c] or None
+        self.filters = {
+            "point": _upper_set(point),
+            "axis": _upper_set(axis),
+            "origem": _upper_set(origem),
+        }
+        self.date_from = pd.Timestamp(date_from) if date_from else None
+        self.date_to = pd.Timestamp(date_to) if date_to else None
+        self.limit = limit
+        self.offset = max(offset or 0, 0)
+        self.cursor = decode_cursor(cursor) if cursor else None
+
+    @property
+    def is_plain(self) -> bool:
+        """Sem nenhum parâmetro → leitura completa como antes."""
+        return self.columns is None and self.is_projection_only
+
+    @property
+    def is_projection_only(self) -> bool:
+        """Só columns=, sem filtros nem paginação."""
+        return (
+            not any(self.filters.values())
+            and self.date_from is None
+            and self.date_to is None
+            and self.limit is None
+            and not self.offset
+            and self.cursor is None
+        )
+
+    def _mask(self, df: pd.DataFrame, label_column: Optional[str]) -> Optional[np.ndarray]:
+        mask = None
+
+        def combine(m):
+            nonlocal mask
+            mask = m if mask is None else (mask & m)
+
+        for key, wanted in self.filters.items():
+            if not wanted:
+                continue
+            col = FILTER_COLUMNS[key]
+            if key == "origem" and label_column and col not in df.columns:
+                col = label_column
+            if col not in df.columns:
+                combine(np.zeros(len(df), dtype=bool))
+                continue
+            combine(df[col].astype(str).str.strip().str.upper().isin(wanted).to_numpy())
+
+        if (self.date_from is not None or self.date_to is not None):
+            if DATE_COLUMN not in df.columns:
+                combine(np.zeros(len(df), dtype=bool))
+            else:
+                dates = pd.to_datetime(df[DATE_COLUMN], format=DATE_FORMAT, errors="coerce")
+                m = dates.notna().to_numpy()
+                if self.date_from is not None:
+                    m &= (dates >= self.date_from).to_numpy()
+                if self.date_to is not None:
+                    m &= (dates <= self.date_to).to_numpy()
+                combine(m)
+
+        return mask
+
+    def _usecols(self, header: list[str]) -> Optional[list[str]]:
+        if self.columns is None:
+            return None
+        needed = set(self.columns)
+        for key, wanted in self.filters.items():
+            if wanted:
+                needed.add(FILTER_COLUMNS[key])
+        if self.date_from is not None or self.date_to is not None:
+            needed.add(DATE_COLUMN)
+        return [c for c in header if c in needed]
+
+    def iter_chunks(self, files: list[tuple[str, Optional[str]]], label_column: Optional[str] = None):
+        """
+        Lê `files` ([(caminho, rótulo)]) aplicando a consulta, bloco a bloco.
+        Se `label_column` for dado, cada linha recebe o rótulo do arquivo nessa coluna
+        (ex.: RelatorioCSV no /dataframe) e o filtro de origem descarta o arquivo
+        inteiro sem abri-lo.
+        Gera (DataFrame, cursor) — o cursor aponta para logo depois do bloco;
+        para quando o limit é atingido.
+        """
+        start_file, start_row = self.cursor or (0, 0)
+        to_skip = self.offset if self.cursor is None else 0
+        remaining = self.limit
+        wanted_origem = self.filters["origem"]
+
+        for file_idx in range(start_file, len(files)):
+            path, label = files[file_idx]
+            first_row = start_row if file_idx == start_file else 0
+
+            if label_column and wanted_origem and str(label).upper() not in wanted_origem:
+                continue
+
+            try:
+                header = list(pd.read_csv(path, nrows=0).columns)
+            except Exception:
+                continue
+            if self.columns:
+                unknown = [c for c in self.columns if c not in header and c != label_column]
+                if unknown:
+                    raise QueryError(f"Colunas inexistentes: {', '.join(unknown)}")
+
+            reader = pd.read_csv(
+                path,
+                usecols=self._usecols(header),
+                skiprows=range(1, first_row + 1) if first_row else None,
+                chunksize=CHUNK_ROWS,
+            )
+            raw_pos = first_row
+            with reader:
+                for chunk in reader:
+                    if label_column:
+                        chunk[label_column] = label
+                    positions = np.arange(raw_pos, raw_pos + len(chunk))
+                    raw_pos += len(chunk)
+
+                    mask = self._mask(chunk, label_column)
+                    if mask is not None:
+                        chunk = chunk[mask]
+                        positions = positions[mask]
+
+                    if to_skip:
+                        dropped = min(to_skip, len(chunk))
+                        chunk = chunk.iloc[dropped:]
+                        positions = positions[dropped:]
+                        to_skip -= dropped
+
+                    if remaining is not None and len(chunk) >= remaining:
+                        chunk = chunk.iloc[:remaining]
+                        next_row = int(positions[remaining - 1]) + 1
+                        yield self._project(chunk), encode_cursor(file_idx, next_row)
+                        return
+
+                    if len(chunk):
+                        if remaining is not None:
+                            remaining -= len(chunk)
+                        yield self._project(chunk), encode_cursor(file_idx, raw_pos)
+
+    def run(self, files: list[tuple[str, Optional[str]]], label_column: Optional[str] = None):
+        """Como iter_chunks, mas junta tudo. Retorna (DataFrame, next_cursor ou None)."""
+        parts = []
+        next_cursor = None
+        for chunk, cursor in self.iter_chunks(files, label_column):
+            parts.append(chunk)
+            next_cursor = cursor
+        if self.limit is None or sum(len(c) for c in parts) < self.limit:
+            next_cursor = None
+        return self._finish(parts), next_cursor
+
+    def page_info(self, next_cursor: Optional[str]) -> dict:
+        """Campos extras da resposta paginada (vazio na leitura completa)."""
+        if self.is_plain:
+            return {}
+        return {"limit": self.limit, "offset": self.offset, "next_cursor": next_cursor}
+
+    def _project(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self.columns:
+            return df[[c for c in self.columns if c in df.columns]]
+        return df
+
+    def _finish(self, parts: list[pd.DataFrame]) -> pd.DataFrame:
+        if not parts:
+            return pd.DataFrame(columns=self.columns or [])
+        return pd.concat(parts, ignore_index=True)
+
+
+def table_query_params(
+    columns: Optional[str] = Query(None, description="Colunas separadas por vírgula"),
+    point: Optional[List[str]] = Query(None, description="NomePonto (pode repetir)"),
+    axis: Optional[List[str]] = Query(None, description="Eixo (pode repetir)"),
+    origem: Optional[List[str]] = Query(None, description="Arquivo de origem (pode repetir)"),
+    date_from: Optional[date] = Query(None, description="Data inicial (AAAA-MM-DD)"),
+    date_to: Optional[date] = Query(None, description="Data final (AAAA-MM-DD)"),
+    limit: Optional[int] = Query(None, ge=1, le=100_000),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior"),
+) -> TableQuery:
+    """Dependência FastAPI: monta a TableQuery a partir da query string."""
+    try:
+        return TableQuery(
+            columns=[c.strip() for c in columns.split(",")] if columns else None,
+            point=point,
+            axis=axis,
+            origem=origem,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+        )
+    except QueryError as e:
+        raise HTTPException(400, str(e))
@@ -0,0 +1,424 @@
+"""
+Fila de tarefas em segundo plano para as operações longas:
+
+  extract_to_csv           → TXT → CSV (uma peça ou o grupo inteiro)
+  generate_analysis        → analysis da semana (uma peça ou o grupo inteiro)
+  generate-week-report     → relatório CG do grupo
+  generate-week-cp-report  → relatório CP do grupo
+  generate-week-cpk-report → relatório CPK do grupo
+
+Em grupos grandes essas rotas passavam do timeout do proxy. Agora elas
+aceitam ?background=true e devolvem na hora o id da tarefa; o andamento
+(progresso, resultado por peça, resultado final) é lido em /tasks/{id}
+ou acompanhado por SSE em /tasks/{id}/events.
+
+  - TASK_WORKERS threads consomem a fila (mesmo esquema do pipeline de
+    ingestão);
+  - cada tarefa é um JSON em data/tasks/ (diário): ao subir de novo, as
+    que estavam na fila ou rodando voltam para a fila;
+  - o diário é o mesmo para todos os workers do uvicorn: quem roda uma
+    tarefa segura o lock .run_{id} enquanto ela roda (só um processo a
+    pega, e uma "running" sem dono é retomada), e /tasks/{id} de outro
+    processo lê o estado do JSON;
+  - cancelar é cooperativo: vale entre um arquivo/peça e o próximo;
+  - tarefas terminadas são apagadas depois de TASK_TTL_DAYS.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from . import catalog, group_reports, ingest, piece_analysis
+from .pcdmis_csv_service import extract_all_txt_to_csv
+from .pieces_service import sanitize_piece_name
+from .utils.fileio import atomic_write_json
+from .utils.filelock import file_lock
+
+TASKS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "tasks")
+WORKERS = int(os.environ.get("TASK_WORKERS", "2"))
+TTL_SECONDS = float(os.environ.get("TASK_TTL_DAYS", "7")) * 86400
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "error", "cancelled")
+
+#relatório de grupo → tipos gravados (ver group_reports.REPORT_KINDS)
+WEEK_REPORT_KINDS = {
+    "generate-week-report": "cg",
+    "generate-week-cp-report": "cp",
+    "generate-week-cpk-report": "cpk",
+}
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskNotFound(LookupError):
+    pass
+
+
+class _Context:
+    """O que a função da tarefa usa para dar notícia e ver se foi cancelada."""
+
+    def __init__(self, task: dict):
+        self.task = task
+
+    def check(self):
+        if self.task.get("cancel_requested"):
+            raise TaskCancelled()
+
+    def progress(self, done: int, total: int, current=None):
+        self.check()
+        _update(self.task, progress={"done": done, "total": total, "current": current})
+
+    def piece_result(self, piece: str, result: dict):
+        with _lock:
+            self.task["results"][piece] = result
+        _save(self.task)
+
+
+#operações
+
+def _week(params: dict) -> tuple[int, int]:
+    year, week = params.get("year"), params.get("week")
+    if week is None or year is None:
+        year, week = piece_analysis.current_week()
+    if not (1 <= week <= 53):
+        raise ValueError("Semana deve estar entre 1 e 53")
+    if not (2020 <= year <= 2050):
+        raise ValueError("Ano inválido")
+    return year, week
+
+
+def _target_pieces(params: dict) -> list[str]:
+    group = params["group"]
+    if params.get("piece"):
+        return [sanitize_piece_name(params["piece"])]
+    return [info["part_number"] for info in catalog.pieces(group)]
+
+
+def _run_extract(params: dict, ctx: _Context) -> dict:
+    pieces = _target_pieces(params)
+    total = 0
+    for i, piece in enumerate(pieces):
+        if len(pieces) == 1:
+            #uma peça só: progresso por arquivo
+            saved = extract_all_txt_to_csv(params["group"], piece, progress=ctx.progress)
+        else:
+            ctx.progress(i, len(pieces), piece)
+            saved = extract_all_txt_to_csv(params["group"], piece, progress=lambda *a: ctx.check())
+        if saved:
+            #medições novas: analysis + _stats.json da semana atual já em dia
+            ingest.refresh_piece(params["group"], piece, saved, refresh_group=False)
+        ctx.piece_result(piece, {"saved": len(saved)})
+        total += len(saved)
+    if total:
+        #relatórios de grupo uma vez, não por peça (como no lote)
+        group_reports.refresh_from_stats(params["group"], *piece_analysis.current_week())
+    return {"pieces": len(pieces), "saved": total}
+
+
+def _run_analysis(params: dict, ctx: _Context) -> dict:
+    year, week = _week(params)
+    pieces = _target_pieces(params)
+    rows = 0
+    for i, piece in enumerate(pieces):
+        ctx.progress(i, len(pieces), piece)
+        df, rebuilt = piece_analysis.ensure_week_analysis(params["group"], piece, year, week)
+        if df is None:
+            ctx.piece_result(piece, {"status": "skipped"})
+            continue
+        ctx.piece_result(piece, {"status": "ok", "rows": len(df), "rebuilt": rebuilt})
+        rows += len(df)
+    return {"year": year, "week": week, "rows": rows, "file": f"analysis_{year}_W{week:02d}.csv"}
+
+
+def _run_week_report(kind: str):
+    def run(params: dict, ctx: _Context) -> dict:
+        year, week = _week(params)
+
+        def on_piece(piece, result, done, total):
+            ctx.piece_result(piece, result)
+            ctx.progress(done, total, piece)
+
+        reports = group_reports.generate_week(params["group"], year, week, (kind,), on_piece=on_piece)
+        if not reports:
+            raise ValueError("Nenhuma peça foi processada")
+        report = reports[kind]
+        return {"year": year, "week": week, "pieces_processed": report["pieces_processed"], "data": report}
+    return run
+
+
+TASK_KINDS = {
+    "extract_to_csv": _run_extract,
+    "generate_analysis": _run_analysis,
+    **{name: _run_week_report(kind) for name, kind in WEEK_REPORT_KINDS.items()},
+}
+
+
+#estado
+
+_lock = threading.Lock()
+_tasks: dict = {}   #tarefas criadas ou rodando neste processo
+_queue: queue.Queue = queue.Queue()
+_stop = threading.Event()
+_threads: list = []
+_loaded = False
+
+
+def _path(task_id: str) -> str:
+    return os.path.join(TASKS_DIR, f"{task_id}.json")
+
+
+def _run_lock_path(task_id: str) -> str:
+    return os.path.join(TASKS_DIR, f".run_{task_id}")
+
+
+def _journal_lock():
+    """Lock das gravações do diário (entre threads e processos)."""
+    return file_lock(os.path.join(TASKS_DIR, ".lock"))
+
+
+def _read(task_id: str):
+    if not task_id.isalnum():
+        return None
+    try:
+        with open(_path(task_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(task_id: str):
+    for path in (_path(task_id), _run_lock_path(task_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _save(task: dict):
+    #uma gravação por vez (um retrato antigo não sobrescreve um novo), sem
+    #perder um cancelamento pedido em outro processo
+    with _journal_lock():
+        disk = _read(task["id"])
+        with _lock:
+            if disk and disk.get("cancel_requested"):
+                task["cancel_requested"] = True
+            snapshot = json.loads(json.dumps(task))
+        atomic_write_json(_path(task["id"]), snapshot)
+
+
+def _update(task: dict, **fields):
+    with _lock:
+        task.update(fields)
+    _save(task)
+
+
+def _load():
+    """Lê o diário uma vez: recoloca na fila o que não terminou (o claim decide quem roda)."""
+    global _loaded
+    with _lock:
+        if _loaded:
+            return
+        _loaded = True
+    if not os.path.isdir(TASKS_DIR):
+        return
+    now = time.time()
+    pending = []
+    for name in os.listdir(TASKS_DIR):
+        if not name.endswith(".json") or name.startswith("."):
+            continue
+        task = _read(name[:-len(".json")])
+        if task is None:
+            continue
+        if task["status"] in FINISHED and now - (task.get("finished_at") or 0) > TTL_SECONDS:
+            _remove(task["id"])
+            continue
+        if task["status"] in ACTIVE:
+            pending.append(task)
+    for task in sorted(pending, key=lambda t: t["created_at"]):
+        _queue.put(task["id"])
+
+
+def _worker():
+    while not _stop.is_set():
+        try:
+            task_id = _queue.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        try:
+            _execute(task_id)
+        finally:
+            _queue.task_done()
+
+
+def _claim(task_id: str):
+    """
+    Passa a tarefa do diário para running (quem chama segura o .run_{id}).
+    None se ela já terminou ou foi cancelada.
+    """
+    with _journal_lock():
+        task = _read(task_id)
+        if task is not None and task["status"] in ACTIVE and task.get("cancel_requested"):
+            task.update(status="cancelled", finished_at=time.time())
+            atomic_write_json(_path(task_id), task)
+        if task is None or task["status"] not in ACTIVE:
+            with _lock:
+                _tasks.pop(task_id, None)
+            return None
+        #"running" aqui é de um processo que morreu (o lock estava livre)
+        task.update(status="running", started_at=time.time())
+        atomic_write_json(_path(task_id), task)
+        with _lock:
+            _tasks[task_id] = task
+        return task
+
+
+def _execute(task_id: str):
+    try:
+        with file_lock(_run_lock_path(task_id), blocking=False):
+            task = _claim(task_id)
+            if task is not None:
+                _run(task)
+    except BlockingIOError:
+        #outro worker (deste ou de outro processo) está com ela
+        pass
+
+
+def _run(task: dict):
+    try:
+        result = TASK_KINDS[task["kind"]](task["params"], _Context(task))
+        progress = dict(task["progress"], done=task["progress"].get("total"))
+        _update(task, status="done", result=result, progress=progress, finished_at=time.time())
+    except TaskCancelled:
+        _update(task, status="cancelled", finished_at=time.time())
+    except Exception as e:
+        _update(task, status="error", error=str(e), finished_at=time.time())
+
+
+def start():
+    """Sobe os workers (startup do app; submit também chama)."""
+    _load()
+    with _lock:
+        if _threads:
+            return
+        _stop.clear()
+        _threads.extend(
+            threading.Thread(target=_worker, name=f"task-worker-{i}", daemon=True)
+            for i in range(WORKERS)
+        )
+        threads = list(_threads)
+    for t in threads:
+        t.start()
+
+
+def stop():
+    _stop.set()
+    with _lock:
+        threads = list(_threads)
+        _threads.clear()
+    for t in threads:
+        t.join(timeout=5)
+
+
+#api
+
+def submit(kind: str, group: str, piece=None, week=None, year=None) -> dict:
+    if kind not in TASK_KINDS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    group = sanitize_piece_name(group)
+    if not catalog.pieces(group):
+        raise TaskNotFound("Nenhuma peça encontrada no grupo")
+    params = {"group": group, "piece": sanitize_piece_name(piece) if piece else None, "week": week, "year": year}
+    if kind != "extract_to_csv":
+        params["year"], params["week"] = _week(params)
+
+    start()
+    task = {
+        "id": uuid.uuid4().hex,
+        "kind": kind,
+        "params": params,
+        "status": "queued",
+        "progress": {"done": 0, "total": None, "current": None},
+        "results": {},
+        "result": None,
+        "error": None,
+        "cancel_requested": False,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+    }
+    with _lock:
+        _tasks[task["id"]] = task
+    _save(task)
+    _queue.put(task["id"])
+    return get(task["id"])
+
+
+def submit_response(kind: str, group: str, piece=None, week=None, year=None):
+    """202 com a tarefa criada (rotas com ?background=true e POST /tasks)."""
+    try:
+        task = submit(kind, group, piece=piece, week=week, year=year)
+    except TaskNotFound as e:
+        raise HTTPException(404, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return JSONResponse(task, status_code=202)
+
+
+def get(task_id: str) -> dict:
+    _load()
+    with _lock:
+        task = _tasks.get(task_id)
+        if task is not None and task["status"] != "queued":
+            return json.loads(json.dumps(task))
+    #criada/rodando em outro worker do uvicorn (ou ainda na fila): o diário tem o estado
+    task = _read(task_id)
+    if task is None:
+        raise TaskNotFound(task_id)
+    return task
+
+
+def list_tasks(status=None, limit: int = 50) -> list[dict]:
+    _load()
+    items = {}
+    names = os.listdir(TASKS_DIR) if os.path.isdir(TASKS_DIR) else []
+    for name in names:
+        if name.endswith(".json") and not name.startswith("."):
+            task = _read(name[:-len(".json")])
+            if task is not None:
+                items[task["id"]] = task
+    with _lock:
+        for task_id, task in _tasks.items():
+            if task["status"] != "queued":
+                items[task_id] = json.loads(json.dumps(task))
+    result = [t for t in items.values() if not status or t["status"] == status]
+    result.sort(key=lambda t: t["created_at"], reverse=True)
+    return result[:limit]
+
+
+def cancel(task_id: str) -> dict:
+    _load()
+    with _journal_lock():
+        task = _read(task_id)
+        if task is None:
+            raise TaskNotFound(task_id)
+        if task["status"] in ACTIVE:
+            task["cancel_requested"] = True
+            if task["status"] == "queued":
+                #ainda na fila: o worker só descarta, marca já
+                task.update(status="cancelled", finished_at=time.time())
+            atomic_write_json(_path(task_id), task)
+            #rodando aqui: o worker vê o pedido no próximo check
+            with _lock:
+                local = _tasks.get(task_id)
+                if local is not None:
+                    local.update(cancel_requested=True, status=task["status"], finished_at=task["finished_at"])
+    return get(task_id)
@@ -0,0 +1,35 @@
+import os
+import json
+import tempfile
+
+
+def atomic_write_bytes(path, data: bytes):
+    """
+    Grava em arquivo temporário na mesma pasta e troca com os.replace().
+    Quem lê o arquivo nunca vê um conteúdo pela metade.
+    """
+    path = os.fspath(path)
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_text(path, text: str, encoding: str = "utf-8"):
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def atomic_write_json(path, data, indent=2):
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=indent))
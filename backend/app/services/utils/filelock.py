@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+    import msvcrt
+
+_held = threading.local()
+
+
+def _lock_fd(fd, blocking=True):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return
+    if not blocking:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError as e:
+            raise BlockingIOError(str(e))
+        return
+    #msvcrt.LK_LOCK desiste depois de ~10s; tenta até conseguir
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Lock exclusivo num arquivo ao lado dos dados, valendo entre processos
+    (vários workers do uvicorn) e entre threads. Reentrante na mesma thread.
+    Com blocking=False levanta BlockingIOError se outro já tiver o lock.
+    """
+    path = os.fspath(path)
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = {}
+    if path in held:
+        held[path] += 1
+        try:
+            yield
+        finally:
+            held[path] -= 1
+        return
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _lock_fd(fd, blocking)
+        held[path] = 1
+        try:
+            yield
+        finally:
+            del held[path]
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,136 @@
+"""
+Implementação mínima de JSON Patch (RFC 6902): add, remove, replace, move, copy, test.
+Usada pelo auto-save incremental do report builder.
+"""
+
+import copy
+
+
+class JsonPatchError(ValueError):
+    pass
+
+
+def _parse_pointer(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise JsonPatchError(f"Ponteiro inválido: '{pointer}'")
+    return [p.replace("~1", "/").replace("~0", "~") for p in pointer[1:].split("/")]
+
+
+def _list_index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise JsonPatchError(f"Índice inválido: '{token}'")
+    idx = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if idx > limit:
+        raise JsonPatchError(f"Índice fora do intervalo: {idx}")
+    return idx
+
+
+def _resolve_parent(doc, tokens: list[str]):
+    node = doc
+    for token in tokens[:-1]:
+        if isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f"Caminho inexistente: '{token}'")
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_list_index(node, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Caminho inexistente: '{token}'")
+    return node
+
+
+def _get(doc, pointer: str):
+    node = doc
+    for token in _parse_pointer(pointer):
+        if isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f"Caminho inexistente: '{pointer}'")
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_list_index(node, token, allow_end=False)]
+        else:
+            raise JsonPatchError(f"Caminho inexistente: '{pointer}'")
+    return node
+
+
+def _add(doc, pointer: str, value):
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        return value
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, last, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Não é possível adicionar em '{pointer}'")
+    return doc
+
+
+def _remove(doc, pointer: str):
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        raise JsonPatchError("Não é possível remover a raiz")
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise JsonPatchError(f"Caminho inexistente: '{pointer}'")
+        return parent.pop(last)
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, last, allow_end=False))
+    raise JsonPatchError(f"Caminho inexistente: '{pointer}'")
+
+
+def _value(op: dict):
+    if "value" not in op:
+        raise JsonPatchError(f"Operação '{op.get('op')}' sem 'value'")
+    return copy.deepcopy(op["value"])
+
+
+def apply_patch(doc, ops: list[dict]):
+    """
+    Aplica as operações sobre uma cópia de `doc` e retorna o resultado.
+    Se qualquer operação falhar, levanta JsonPatchError e nada é alterado.
+    """
+    doc = copy.deepcopy(doc)
+
+    for op in ops:
+        kind = op.get("op")
+        path = op.get("path")
+        if not isinstance(path, str):
+            raise JsonPatchError("Operação sem 'path'")
+
+        if kind == "add":
+            doc = _add(doc, path, _value(op))
+        elif kind == "remove":
+            _remove(doc, path)
+        elif kind == "replace":
+            _get(doc, path)
+            if path == "":
+                doc = _value(op)
+            else:
+                _remove(doc, path)
+                doc = _add(doc, path, _value(op))
+        elif kind == "move":
+            source = op.get("from", "")
+            if path.startswith(source + "/"):
+                raise JsonPatchError("Não é possível mover para dentro de si mesmo")
+            value = _remove(doc, source)
+            doc = _add(doc, path, value)
+        elif kind == "copy":
+            value = copy.deepcopy(_get(doc, op.get("from", "")))
+            doc = _add(doc, path, value)
+        elif kind == "test":
+            if _get(doc, path) != op.get("value"):
+                raise JsonPatchError(f"Teste falhou em '{path}'")
+        else:
+            raise JsonPatchError(f"Operação desconhecida: '{kind}'")
+
+    return doc
@@ -10,6 +10,20 @@ def ler_relatorio_pcdmis(caminho_arquivo):
         with open(caminho_arquivo, "r", encoding="latin-1") as f:
             linhas = f.readlines()
 
+    return ler_linhas_pcdmis(linhas)
+
+
+def ler_relatorio_pcdmis_bytes(conteudo: bytes):
+    # Mesmo que ler_relatorio_pcdmis, para conteúdo já em memória (ex.: entrada de um zip)
+    try:
+        texto = conteudo.decode("utf-8")
+    except UnicodeDecodeError:
+        texto = conteudo.decode("latin-1")
+
+    return ler_linhas_pcdmis(texto.splitlines())
+
+
+def ler_linhas_pcdmis(linhas):
     data, hora = None, None
     id_loc, tipo_geo, nome_ponto = None, None, None
     dados = []
@@ -0,0 +1,37 @@
+"""
+Intervalo de semanas dos gráficos de tendência (from_year/from_week até
+to_year/to_week). Semanas são comparadas como tuplas (ano, semana).
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+def week_range(from_year=None, from_week=None, to_year=None, to_week=None, year=None, week=None):
+    """
+    (início, fim) do filtro; None = sem limite daquele lado. week + year
+    (filtro antigo de uma semana só) vira início = fim. ValueError se um
+    limite vier pela metade ou com semana fora de 1-53.
+    """
+    if week and year:
+        from_year, from_week, to_year, to_week = year, week, year, week
+
+    def bound(y, w, name):
+        if y is None and w is None:
+            return None
+        if y is None or w is None:
+            raise ValueError(f"Informe {name}_year e {name}_week juntos")
+        if not (1 <= w <= 53):
+            raise ValueError("Semana deve estar entre 1 e 53")
+        return (y, w)
+
+    start, end = bound(from_year, from_week, "from"), bound(to_year, to_week, "to")
+    if start and end and start > end:
+        raise ValueError("Início do intervalo depois do fim")
+    return start, end
+
+
+def in_range(weeks: list, start=None, end=None) -> list:
+    """Fatia de `weeks` (lista ordenada de (ano, semana)) dentro do intervalo."""
+    lo = bisect_left(weeks, start) if start else 0
+    hi = bisect_right(weeks, end) if end else len(weeks)
+    return weeks[lo:hi]
@@ -0,0 +1,241 @@
+"""
+Executor dedicado ao trabalho pesado (pandas, leitura de CSVs, relatórios de grupo).
+
+Rotas `def` comuns rodam no threadpool padrão do Starlette; um relatório de
+grupo grande ocupava as threads e até GET /groups ficava esperando.
+Agora as rotas pesadas são `async` e mandam o trabalho para este pool de
+tamanho fixo — o event loop fica livre para as leituras leves.
+
+  @router.get("/...")
+  @offload
+  def rota_pesada(...):
+      ...
+
+Tamanho do pool: variável de ambiente HEAVY_WORKERS (padrão 4).
+
+Pedidos idênticos ao mesmo tempo (segunda 8h, todo mundo abre o painel do
+grupo) dividem uma execução só:
+
+  @router.get("/...")
+  @coalesce("pieces-cpk-report")
+  @offload
+  def rota_pesada(group, week, year):
+      ...
+
+A chave é (endpoint, parâmetros da rota); quem chega com a mesma chave
+enquanto a primeira ainda roda recebe o mesmo resultado (ou o mesmo erro).
+
+Controle de admissão: o trabalho em lote (estatísticas, relatórios de grupo,
+extração, renderização) passa por `admit(classe)` em vez de `offload`:
+
+  @router.get("/...")
+  @coalesce("pieces-cpk-report")
+  @admit("statistics")
+  def rota_pesada(...):
+      ...
+
+  - cada classe tem um limite de execuções simultâneas e uma fila de espera
+    limitada (ADMIT_<CLASSE>="simultâneas:fila", ex. ADMIT_STATISTICS="4:16");
+  - fila cheia → 429 na hora; esperou mais que ADMIT_WAIT_SECONDS → 503.
+    Os dois com Retry-After estimado pelo tempo médio da classe;
+  - o lote roda num pool próprio: o pool de `offload` fica reservado para as
+    leituras interativas, que assim nunca esperam atrás de um lote.
+"""
+
+import asyncio
+import contextlib
+import functools
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+HEAVY_WORKERS = int(os.environ.get("HEAVY_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=HEAVY_WORKERS, thread_name_prefix="heavy")
+
+
+async def run_heavy(fn, *args, **kwargs):
+    """Executa `fn` no pool pesado sem bloquear o event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+def offload(fn):
+    """
+    Transforma uma rota síncrona em async que roda no pool pesado.
+    A assinatura original é preservada (functools.wraps), então o FastAPI
+    continua lendo os parâmetros normalmente.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_heavy(fn, *args, **kwargs)
+
+    return wrapper
+
+
+_inflight: dict = {}
+
+
+def _call_key(endpoint: str, kwargs: dict) -> tuple:
+    parts = [endpoint]
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        if isinstance(value, Request):
+            #o formato de resposta pode vir do Accept
+            value = value.headers.get("accept", "")
+        parts.append((name, repr(value)))
+    return tuple(parts)
+
+
+def _forget(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  #evita "exception was never retrieved" se todos desistiram
+
+
+async def shared(key, factory):
+    """Executa factory() uma vez por chave; chamadas concorrentes esperam a mesma."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_forget, key))
+    #cliente que desconecta não cancela o trabalho dos outros
+    return await asyncio.shield(task)
+
+
+def coalesce(endpoint: str):
+    """Junta chamadas idênticas e simultâneas de uma rota async (ver topo)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await shared(_call_key(endpoint, kwargs), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+#classe → (simultâneas, fila) padrão
+ADMISSION_DEFAULTS = {
+    "ingest": (2, 8),
+    "statistics": (4, 16),
+    "group_report": (2, 8),
+    "render": (1, 4),
+}
+ADMIT_WAIT_SECONDS = float(os.environ.get("ADMIT_WAIT_SECONDS", "30"))
+
+
+def _admission_config(name: str, default: tuple[int, int]) -> tuple[int, int]:
+    raw = os.environ.get(f"ADMIT_{name.upper()}")
+    if not raw:
+        return default
+    limit, _, queue = raw.partition(":")
+    return max(1, int(limit)), max(0, int(queue or default[1]))
+
+
+class _Lane:
+    """Semáforo com fila limitada; vive no event loop (sem threads)."""
+
+    def __init__(self, name: str, limit: int, queue: int):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.active = 0
+        self.waiters = deque()
+        self.avg_seconds = 1.0
+        self.rejected = 0
+
+    def retry_after(self) -> str:
+        ahead = len(self.waiters) + self.active
+        return str(max(1, math.ceil(self.avg_seconds * ahead / self.limit)))
+
+    def _busy(self, status: int, message: str):
+        self.rejected += 1
+        return HTTPException(status, message, headers={"Retry-After": self.retry_after()})
+
+    async def acquire(self):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            return
+        if len(self.waiters) >= self.queue:
+            raise self._busy(429, f"Servidor ocupado ({self.name}), tente de novo")
+
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, ADMIT_WAIT_SECONDS)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  #a vaga chegou junto com o timeout/desistência
+            else:
+                with contextlib.suppress(ValueError):
+                    self.waiters.remove(fut)
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._busy(503, f"Fila cheia há muito tempo ({self.name}), tente de novo")
+            raise
+
+    def release(self):
+        #passa a vaga direto para o próximo da fila
+        while self.waiters:
+            fut = self.waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def observe(self, seconds: float):
+        self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * seconds
+
+    def status(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "avg_seconds": round(self.avg_seconds, 3),
+            "rejected": self.rejected,
+        }
+
+
+_lanes = {
+    name: _Lane(name, *_admission_config(name, default))
+    for name, default in ADMISSION_DEFAULTS.items()
+}
+
+_batch_executor = ThreadPoolExecutor(
+    max_workers=sum(lane.limit for lane in _lanes.values()), thread_name_prefix="batch"
+)
+
+
+@contextlib.asynccontextmanager
+async def admission(kind: str):
+    """Ocupa uma vaga da classe `kind` (429/503 se não houver)."""
+    lane = _lanes[kind]
+    await lane.acquire()
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        lane.observe(time.monotonic() - start)
+        lane.release()
+
+
+def admit(kind: str):
+    """Como `offload`, mas com admissão da classe `kind` e no pool de lote."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with admission(kind):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(_batch_executor, functools.partial(fn, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def admission_status() -> dict:
+    return {name: lane.status() for name, lane in _lanes.items()}
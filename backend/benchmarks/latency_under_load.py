@@ -0,0 +1,98 @@
+"""
+Latência das requisições leves enquanto relatórios pesados rodam.
+
+Sobe a API num uvicorn local (thread), dispara HEAVY requisições pesadas em
+paralelo (relatório por semana de cada peça, que lê todos os analysis_*.csv
+e calcula as estatísticas) e, ao mesmo tempo, mede GET /groups em loop.
+Só usa rotas de leitura: os dados em app/data não são alterados.
+
+Uso (a partir de backend/):
+  python -m benchmarks.latency_under_load
+  python -m benchmarks.latency_under_load --heavy 60 --light 300
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+
+from app.main import app
+from app.services.groups_service import list_groups
+from app.services.pieces_service import list_pieces
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+def _get(path: str) -> float:
+    start = time.perf_counter()
+    with urllib.request.urlopen(f"http://{HOST}:{PORT}{path}", timeout=300) as r:
+        r.read()
+    return time.perf_counter() - start
+
+
+def _heavy_paths() -> list[str]:
+    paths = []
+    for group in list_groups():
+        for piece in list_pieces(group):
+            paths.append(f"/pieces/{group}/{piece['part_number']}/report")
+            paths.append(f"/pieces/{group}/{piece['part_number']}/report/cp-cpk")
+    return paths
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[k]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--heavy", type=int, default=48, help="requisições pesadas simultâneas")
+    parser.add_argument("--light", type=int, default=200, help="quantidade de GET /groups")
+    args = parser.parse_args()
+
+    server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    heavy = _heavy_paths()
+    if not heavy:
+        print("Nenhuma peça com dados em app/data/groups.")
+        return
+
+    idle = [_get("/groups") for _ in range(50)]
+
+    light: list[float] = []
+    with ThreadPoolExecutor(max_workers=args.heavy) as pool:
+        t0 = time.perf_counter()
+        futures = [pool.submit(_get, heavy[i % len(heavy)]) for i in range(args.heavy)]
+        time.sleep(0.2)
+        for _ in range(args.light):
+            if all(f.done() for f in futures):
+                break
+            light.append(_get("/groups"))
+        heavy_times = [f.result() for f in futures]
+        total = time.perf_counter() - t0
+
+    server.should_exit = True
+
+    def fmt(values):
+        return (
+            f"n={len(values):4d}  p50={statistics.median(values) * 1000:8.1f} ms  "
+            f"p99={_percentile(values, 99) * 1000:8.1f} ms  max={max(values) * 1000:8.1f} ms"
+        )
+
+    print(f"GET /groups ocioso      {fmt(idle)}")
+    if light:
+        print(f"GET /groups sob carga   {fmt(light)}")
+    print(f"relatórios pesados      {fmt(heavy_times)}  (total {total:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Tempo de serialização e bytes trafegados das respostas de /analysis.
+
+Para cada analysis_*.csv em app/data/groups compara:
+  - padrão   : jsonable_encoder + json.dumps (o que o FastAPI faz com um dict)
+  - fast     : orjson, records
+  - split    : orjson, orient=split
+e o tamanho de cada corpo com gzip e brotli (se instalado).
+
+Uso (a partir de backend/):
+  python -m benchmarks.serialization
+"""
+
+import gzip
+import json
+import time
+from pathlib import Path
+
+import orjson
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from app.services.responses import ORJSON_OPTIONS, brotli, dataframe_rows
+
+DATA = Path(__file__).resolve().parent.parent / "app" / "data" / "groups"
+
+
+def _timed(fn, repeat=3):
+    best = None
+    out = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+def _default(df):
+    payload = {"rows": len(df), "data": df.to_dict(orient="records")}
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=True).encode("utf-8")
+
+
+def _fast(df, orient):
+    return orjson.dumps({"rows": len(df), "data": dataframe_rows(df, orient)}, option=ORJSON_OPTIONS)
+
+
+def main():
+    files = sorted(DATA.glob("*/pieces/*/analysis/analysis_*.csv"))
+    if not files:
+        print("Nenhum analysis_*.csv encontrado.")
+        return
+
+    totals = {}
+    for path in files:
+        df = pd.read_csv(path)
+        for label, fn in (
+            ("padrão", lambda: _default(df)),
+            ("fast", lambda: _fast(df, "records")),
+            ("split", lambda: _fast(df, "split")),
+        ):
+            elapsed, body = _timed(fn)
+            t = totals.setdefault(label, {"s": 0.0, "raw": 0, "gzip": 0, "br": 0})
+            t["s"] += elapsed
+            t["raw"] += len(body)
+            t["gzip"] += len(gzip.compress(body, compresslevel=5))
+            if brotli is not None:
+                t["br"] += len(brotli.compress(body, quality=4))
+
+    print(f"{len(files)} arquivos de análise")
+    print(f"{'formato':8} {'tempo':>10} {'bruto':>12} {'gzip':>12} {'br':>12}")
+    for label, t in totals.items():
+        br = f"{t['br'] / 1024:9.0f} KB" if brotli is not None else "         -"
+        print(
+            f"{label:8} {t['s'] * 1000:8.0f} ms {t['raw'] / 1024:9.0f} KB "
+            f"{t['gzip'] / 1024:9.0f} KB {br}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from app.services import report_registry
+
+
+@pytest.fixture
+def piece(tmp_path, monkeypatch):
+    """Peça antiga, sem registro: A.TXT e a cópia B.TXT, cada um com o seu CSV."""
+    monkeypatch.setattr(report_registry, "BASE_DIR", str(tmp_path))
+    monkeypatch.setattr(report_registry, "_cache", {})
+    #sem medições: as cópias se acham só pelo sha256 dos bytes
+    monkeypatch.setattr(report_registry, "ler_relatorio_pcdmis", lambda path: pd.DataFrame())
+    base = tmp_path / "G" / "pieces" / "P"
+    for folder in ("txt", "csv"):
+        (base / folder).mkdir(parents=True)
+    for name in ("A", "B"):
+        (base / "txt" / f"{name}.TXT").write_bytes(b"mesmo relatorio")
+        (base / "csv" / f"{name}.csv").write_text("Data,Hora\n", encoding="utf-8")
+    (base / "txt" / "C.TXT").write_bytes(b"outro relatorio")
+    (base / "csv" / "C.csv").write_text("Data,Hora\n", encoding="utf-8")
+    return base
+
+
+def test_lookup_marks_copies_without_deleting(piece):
+    sha = report_registry.raw_hash(b"mesmo relatorio")
+    assert report_registry.find_duplicate("G", "P", "NOVO.TXT", sha) == "A.TXT"
+
+    files = json.loads((piece / "report_hashes.json").read_text(encoding="utf-8"))["files"]
+    assert files["B.TXT"]["duplicate_of"] == "A.TXT"
+    assert sorted(os.listdir(piece / "csv")) == ["A.csv", "B.csv", "C.csv"]
+
+
+def test_drop_duplicate_csvs_returns_and_logs_removed(piece, caplog):
+    with caplog.at_level("WARNING", logger=report_registry.__name__):
+        removed = report_registry.drop_duplicate_csvs("G", "P")
+
+    assert removed == ["B.csv"]
+    assert sorted(os.listdir(piece / "csv")) == ["A.csv", "C.csv"]
+    assert sorted(os.listdir(piece / "txt")) == ["A.TXT", "B.TXT", "C.TXT"]
+    assert "B.csv" in caplog.text
+    #a cópia fica registrada como processada sem CSV
+    manifest = json.loads((piece / "lineage.json").read_text(encoding="utf-8"))["artifacts"]
+    assert manifest["csv/B.csv"]["empty"] is True
+
+    assert report_registry.drop_duplicate_csvs("G", "P") == []
+
+
+def test_check_and_register_rejects_same_content(piece):
+    sha = report_registry.raw_hash(b"novo relatorio")
+    report_registry.check_and_register("G", "P", "D.TXT", sha)
+    with pytest.raises(report_registry.DuplicateReport) as exc:
+        report_registry.check_and_register("G", "P", "E.TXT", sha)
+    assert exc.value.duplicate_of == "D.TXT"
+    #mesmo nome substitui
+    report_registry.check_and_register("G", "P", "D.TXT", sha)
@@ -95,7 +95,7 @@ const PiecesChartCp = forwardRef(function PiecesChartCp(
               <div className={styles.topFiveImage}>
                 {piece.image ? (
                   <img
-                    src={`${API}/pieces/${group}/${piece.part_number}/imagens`}
+                    src={`${API}/pieces/${group}/${piece.part_number}/imagens/thumb?w=320&v=${piece.image_version ?? ""}`}
                     alt={piece.part_number}
                     onError={(e) => {
                       e.target.src = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='100' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='40'%3E🔩%3C/text%3E%3C/svg%3E";